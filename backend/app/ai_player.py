@@ -1,34 +1,56 @@
 from typing import List, Optional, Tuple, Dict
-from .game import Card, CardType, GameState
+from .decompose import decompose, plan_moves, turns_after
+from .game import Card, CardType, GameState, team_of, partner_of
+
+# 跟牌时最多评估的候选数；只按个数限制、不按耗时截断，同一局面总是做出同样的决策
+MAX_PLAN_CANDIDATES = 24
+# 跟牌时最多允许多出的手数（相对于按拆分出牌）
+MAX_EXTRA_TURNS = 1
 
 class AIPlayer:
-    def __init__(self, game_state: GameState, player_index: int):
+    def __init__(self, game_state: GameState, player_index: int, plan: bool = True):
         self.game_state = game_state
         self.player_index = player_index
         self.hand = game_state.players_hands[player_index]
+        # 按手牌拆分（decompose.py）选择出牌；蒙特卡洛模拟中关闭以保持模拟速度
+        self.plan = plan
 
     def make_decision(self) -> Dict:
         """做出决策，返回动作字典 {"action": "play/pass", "cards": [...]}"""
-        if not self.game_state.last_played_cards:
+        if self.game_state.is_leading(self.player_index):
             return self.play_first_hand()
         return self.play_against_last_hand()
 
     def play_first_hand(self) -> Dict:
-        """第一手牌，选择最小的单张"""
+        """第一手牌：按手牌拆分出最小的组合，不拆分时出最小的单张"""
         if not self.hand:
             return {"action": "pass"}
-        
-        # 找出最小的单张
-        min_card = min(self.hand, key=lambda c: self.game_state.get_card_value(c))
-        return {"action": "play", "cards": [min_card]}
+
+        if self.plan:
+            cards = self.planned_lead()
+            if cards:
+                return {"action": "play", "cards": cards}
+
+        return self.smallest_lead()
+
+    def smallest_lead(self) -> Dict:
+        """首出最小的一手"""
+        # 合法出牌中单张排在最前，且同牌型内从小到大
+        move = next(self.game_state.iter_legal_moves(self.player_index), None)
+        if move is None:
+            return {"action": "pass"}
+        return {"action": "play", "cards": list(move.cards)}
+
+    def fallback_decision(self) -> Dict:
+        """决策被拒绝时的兜底动作：跟牌时过牌，首出时出最小的一手"""
+        if self.game_state.is_leading(self.player_index):
+            return self.smallest_lead()
+        return {"action": "pass"}
 
     def play_against_last_hand(self) -> Dict:
         """根据上家出的牌做出回应"""
-        last_cards = self.game_state.last_played_cards
-        last_type = self.game_state.last_played_type
-
         # 尝试找到可以压过上家的牌
-        playable_cards = self.find_playable_cards(last_cards, last_type)
+        playable_cards = self.find_playable_cards()
         if playable_cards:
             return {"action": "play", "cards": playable_cards}
 
@@ -39,148 +61,58 @@ class AIPlayer:
 
         return {"action": "pass"}
 
-    def find_playable_cards(self, last_cards: List[Card], last_type: CardType) -> Optional[List[Card]]:
-        """找出可以压过上家的牌"""
-        if last_type == CardType.SINGLE:
-            return self.find_single(last_cards[0])
-        elif last_type == CardType.PAIR:
-            return self.find_pair(last_cards[0])
-        elif last_type == CardType.TRIPLE:
-            return self.find_triple(last_cards[0])
-        elif last_type == CardType.TRIPLE_WITH_PAIR:
-            return self.find_triple_with_pair(last_cards[0])
-        elif last_type == CardType.STRAIGHT:
-            return self.find_straight(len(last_cards), last_cards[-1])
-        elif last_type == CardType.CONSECUTIVE_PAIRS:
-            return self.find_consecutive_pairs(len(last_cards) // 2, last_cards[-1])
-        elif last_type == CardType.CONSECUTIVE_TRIPLES:
-            return self.find_consecutive_triples(len(last_cards) // 3, last_cards[-1])
-        elif last_type == CardType.STRAIGHT_FLUSH:
-            return self.find_straight_flush(len(last_cards), last_cards[-1])
-        return None
-
-    def find_single(self, target_card: Card) -> Optional[List[Card]]:
-        """找出大于目标牌的单张"""
-        for card in sorted(self.hand, key=lambda c: self.game_state.get_card_value(c)):
-            if self.game_state.get_card_value(card) > self.game_state.get_card_value(target_card):
-                return [card]
+    def planned_lead(self) -> Optional[List[Card]]:
+        """按手牌拆分首出：出最小的非炸弹组合，只剩炸弹时出最小的炸弹"""
+        for group, cards, combo in plan_moves(self.hand, self.game_state.current_level):
+            if self.game_state.can_play_cards(cards, self.player_index):
+                return cards
         return None
 
-    def find_pair(self, target_card: Card) -> Optional[List[Card]]:
-        """找出大于目标牌的对子"""
-        for i in range(len(self.hand) - 1):
-            if (self.hand[i].rank == self.hand[i + 1].rank and 
-                self.game_state.get_card_value(self.hand[i]) > self.game_state.get_card_value(target_card)):
-                return [self.hand[i], self.hand[i + 1]]
+    def find_playable_cards(self) -> Optional[List[Card]]:
+        """找出可以压过上家的非炸弹出牌"""
+        if self.plan:
+            return self.planned_response()
+        for move in self.game_state.iter_legal_moves(self.player_index):
+            if move.combo.is_bomb:
+                break
+            return list(move.cards)
         return None
 
-    def find_triple(self, target_card: Card) -> Optional[List[Card]]:
-        """找出大于目标牌的三张"""
-        for i in range(len(self.hand) - 2):
-            if (self.hand[i].rank == self.hand[i + 1].rank == self.hand[i + 2].rank and 
-                self.game_state.get_card_value(self.hand[i]) > self.game_state.get_card_value(target_card)):
-                return [self.hand[i], self.hand[i + 1], self.hand[i + 2]]
-        return None
-
-    def find_triple_with_pair(self, target_card: Card) -> Optional[List[Card]]:
-        """找出大于目标牌的三带二"""
-        # 先找三张
-        for i in range(len(self.hand) - 2):
-            if self.hand[i].rank == self.hand[i + 1].rank == self.hand[i + 2].rank:
-                # 再找对子
-                for j in range(len(self.hand)):
-                    if j < i or j > i + 2:
-                        for k in range(j + 1, len(self.hand)):
-                            if (self.hand[j].rank == self.hand[k].rank and 
-                                self.game_state.get_card_value(self.hand[i]) > self.game_state.get_card_value(target_card)):
-                                return [self.hand[i], self.hand[i + 1], self.hand[i + 2], 
-                                        self.hand[j], self.hand[k]]
-        return None
-
-    def find_straight(self, length: int, target_card: Card) -> Optional[List[Card]]:
-        """找出大于目标牌的顺子"""
-        # 按点数排序
-        sorted_cards = sorted(self.hand, key=lambda c: self.game_state.get_card_value(c))
-        for i in range(len(sorted_cards) - length + 1):
-            if all(self.game_state.get_card_value(sorted_cards[j]) == 
-                   self.game_state.get_card_value(sorted_cards[i]) + j - i 
-                   for j in range(i, i + length)):
-                if self.game_state.get_card_value(sorted_cards[i + length - 1]) > self.game_state.get_card_value(target_card):
-                    return sorted_cards[i:i + length]
-        return None
-
-    def find_consecutive_pairs(self, pair_count: int, target_card: Card) -> Optional[List[Card]]:
-        """找出大于目标牌的连对"""
-        # 找出所有对子
-        pairs = []
-        for i in range(len(self.hand) - 1):
-            if self.hand[i].rank == self.hand[i + 1].rank:
-                pairs.append([self.hand[i], self.hand[i + 1]])
-        
-        # 找出连续的连对
-        for i in range(len(pairs) - pair_count + 1):
-            if all(self.game_state.get_card_value(pairs[j][0]) == 
-                   self.game_state.get_card_value(pairs[i][0]) + j - i 
-                   for j in range(i, i + pair_count)):
-                if self.game_state.get_card_value(pairs[i + pair_count - 1][0]) > self.game_state.get_card_value(target_card):
-                    result = []
-                    for pair in pairs[i:i + pair_count]:
-                        result.extend(pair)
-                    return result
-        return None
-
-    def find_consecutive_triples(self, triple_count: int, target_card: Card) -> Optional[List[Card]]:
-        """找出大于目标牌的三连三"""
-        # 找出所有三张
-        triples = []
-        for i in range(len(self.hand) - 2):
-            if self.hand[i].rank == self.hand[i + 1].rank == self.hand[i + 2].rank:
-                triples.append([self.hand[i], self.hand[i + 1], self.hand[i + 2]])
-        
-        # 找出连续的三连三
-        for i in range(len(triples) - triple_count + 1):
-            if all(self.game_state.get_card_value(triples[j][0]) == 
-                   self.game_state.get_card_value(triples[i][0]) + j - i 
-                   for j in range(i, i + triple_count)):
-                if self.game_state.get_card_value(triples[i + triple_count - 1][0]) > self.game_state.get_card_value(target_card):
-                    result = []
-                    for triple in triples[i:i + triple_count]:
-                        result.extend(triple)
-                    return result
-        return None
-
-    def find_straight_flush(self, length: int, target_card: Card) -> Optional[List[Card]]:
-        """找出大于目标牌的同花顺"""
-        # 按花色分组
-        suits = {}
-        for card in self.hand:
-            if card.suit not in suits:
-                suits[card.suit] = []
-            suits[card.suit].append(card)
-        
-        # 对每个花色找顺子
-        for suit_cards in suits.values():
-            sorted_cards = sorted(suit_cards, key=lambda c: self.game_state.get_card_value(c))
-            for i in range(len(sorted_cards) - length + 1):
-                if all(self.game_state.get_card_value(sorted_cards[j]) == 
-                       self.game_state.get_card_value(sorted_cards[i]) + j - i 
-                       for j in range(i, i + length)):
-                    if self.game_state.get_card_value(sorted_cards[i + length - 1]) > self.game_state.get_card_value(target_card):
-                        return sorted_cards[i:i + length]
-        return None
+    def planned_response(self) -> Optional[List[Card]]:
+        """
+        选择打出后剩余手牌拆分最好的出牌（同样好时取最小的）；
+        会拆散组合、多出太多手时不出，队友出的牌只用拆分中现成的组合去接
+        """
+        level = self.game_state.current_level
+        planned = decompose(self.hand, level).turns
+        best = None
+        best_score = None
+        for i, move in enumerate(self.game_state.iter_legal_moves(self.player_index)):
+            if move.combo.is_bomb or i >= MAX_PLAN_CANDIDATES:
+                break
+            score = turns_after(self.hand, level, move.cards).score
+            if best_score is None or score < best_score:
+                best, best_score = move, score
+        if best is None:
+            return None
+        extra = turns_after(self.hand, level, best.cards).turns - (planned - 1)
+        partner_led = self.game_state.last_played_player == partner_of(self.player_index)
+        if extra > (0 if partner_led else MAX_EXTRA_TURNS) and not self.opponent_close_to_finish():
+            return None
+        return list(best.cards)
+
+    def opponent_close_to_finish(self) -> bool:
+        return any(0 < len(self.game_state.players_hands[i]) <= 5
+                   for i in range(4) if team_of(i) != team_of(self.player_index))
 
     def find_bomb(self) -> Optional[List[Card]]:
-        """找出炸弹"""
-        # 找出4张或以上的同点数牌
-        for i in range(len(self.hand) - 3):
-            if all(self.hand[j].rank == self.hand[i].rank for j in range(i, i + 4)):
-                return self.hand[i:i + 4]
-        
-        # 找出大小王
-        jokers = [card for card in self.hand if card.rank in ['小王', '大王']]
-        if len(jokers) >= 4:
-            return jokers[:4]
-        
+        """找出能压过上家的最小的炸弹"""
+        # 手牌索引中没有任何炸弹时不必枚举
+        if not self.hand.has_bomb(self.game_state.current_level):
+            return None
+        for move in self.game_state.iter_legal_moves(self.player_index):
+            if move.combo.is_bomb:
+                return list(move.cards)
         return None
 
     def should_play_bomb(self) -> bool:
@@ -188,12 +120,9 @@ class AIPlayer:
         # 如果手牌数量较少，更倾向于出炸弹
         if len(self.hand) <= 5:
             return True
-        
+
         # 如果对手手牌数量较少，更倾向于出炸弹
-        opponent_hands = [len(self.game_state.players_hands[i]) 
-                         for i in range(4) 
-                         if i != self.player_index and i // 2 != self.player_index // 2]
-        if any(hand <= 5 for hand in opponent_hands):
+        if self.opponent_close_to_finish():
             return True
-        
-        return False 
\ No newline at end of file
+
+        return False
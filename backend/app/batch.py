@@ -0,0 +1,404 @@
+"""批量牌型判定（NumPy）
+
+离线分析与 AI 训练需要一次判定、比较大量的手牌和出牌。这里的函数一次处理 N 手牌，
+全部使用向量化的 NumPy 运算，结果与 combos.py / GameState 的逐手判定一致：
+  - classify_ids(ids, level)       (N, k) 的 card id 矩阵，不足 k 张的行用 -1 补齐
+  - classify_counts(counts, level) (N, 15) 的点数计数矩阵，逢人配张数另外给出；
+                                   计数不含花色，不能判定同花顺（按顺子处理）
+  - beats(a, b)                    a 能否压过 b（与 combos.beats 相同）
+  - compare_ids(ids1, ids2, level) 与 GameState.compare_cards 相同
+  - card_values(ids, level)        与 GameState.get_card_value 相同
+level 可以是整数，也可以是长度为 N 的数组。
+
+判定结果为 Batch：type 为 TYPES 中的序号（不成牌型为 -1），key 与 Combo.key 相同。
+同一手牌有第二种解释时（同花顺也是顺子，钢板也可以用逢人配凑成连对，三张加两张逢人配的炸弹也是三带二），
+放在 alt_type / alt_key 中，比较时两种解释都会用到。
+
+逢人配最多 2 张；计数矩阵中传入更多逢人配时，第三种及之后的解释被忽略。
+
+python -m app.batch --check 100000 随机生成出牌，与逐手判定的结果逐一核对并比较耗时。
+"""
+import argparse
+import random
+import sys
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖
+    np = None
+
+from .cards import (
+    BIG_JOKER, CARD_FACE, CARD_RANK, CARD_SUIT, CARD_VALUES, CARDS, DECK_SIZE, MAX_LEVEL, MIN_LEVEL,
+    RANK_COUNT, RANK_VALUES, SMALL_JOKER, level_rank, wild_face,
+)
+from .combos import (
+    BOMB_TYPES, JOKER_BOMB_KEY, PAIRS_SEQUENCES, STRAIGHT_SEQUENCES, TRIPLES_SEQUENCES, CardType, Combo,
+    _BOMB_TIER, _STRAIGHT_FLUSH_TIER, _TIER_WIDTH, classify, find_beating, interpretations,
+)
+
+TYPES: Tuple[CardType, ...] = tuple(CardType)
+TYPE_INDEX = {card_type: index for index, card_type in enumerate(TYPES)}
+INVALID = -1
+
+_SINGLE = TYPE_INDEX[CardType.SINGLE]
+_PAIR = TYPE_INDEX[CardType.PAIR]
+_TRIPLE = TYPE_INDEX[CardType.TRIPLE]
+_TRIPLE_WITH_PAIR = TYPE_INDEX[CardType.TRIPLE_WITH_PAIR]
+_STRAIGHT = TYPE_INDEX[CardType.STRAIGHT]
+_CONSECUTIVE_PAIRS = TYPE_INDEX[CardType.CONSECUTIVE_PAIRS]
+_CONSECUTIVE_TRIPLES = TYPE_INDEX[CardType.CONSECUTIVE_TRIPLES]
+_BOMB = TYPE_INDEX[CardType.BOMB]
+_STRAIGHT_FLUSH = TYPE_INDEX[CardType.STRAIGHT_FLUSH]
+_JOKER_BOMB = TYPE_INDEX[CardType.JOKER_BOMB]
+
+MAX_PLAY_SIZE = 10
+
+Level = Union[int, "np.ndarray"]
+
+
+class Batch(NamedTuple):
+    """N 手牌的判定结果，每个字段都是长度为 N 的数组"""
+    type: "np.ndarray"
+    key: "np.ndarray"
+    alt_type: "np.ndarray"
+    alt_key: "np.ndarray"
+
+    def combo(self, i: int) -> Optional[Combo]:
+        """第 i 手牌的首选解释，与 combos.classify 的结果相同"""
+        if self.type[i] == INVALID:
+            return None
+        return Combo(TYPES[self.type[i]], int(self.key[i]))
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("numpy is not installed")
+
+
+_tables = None
+
+
+def _build_tables():
+    """按 card id、级别索引的查询表，第一次使用时构造"""
+    global _tables
+    if _tables is not None:
+        return _tables
+    _require_numpy()
+    # 最后一列对应补齐用的 -1
+    rank = np.array(CARD_RANK + (RANK_COUNT,), dtype=np.int64)
+    suit = np.array(CARD_SUIT + (-1,), dtype=np.int64)
+    face = np.array(CARD_FACE + (-1,), dtype=np.int64)
+    levels = range(MAX_LEVEL + 1)
+    rank_values = np.array([RANK_VALUES[lv] or (0,) * RANK_COUNT for lv in levels], dtype=np.int64)
+    card_values = np.array([(CARD_VALUES[lv] or (0,) * DECK_SIZE) + (0,) for lv in levels], dtype=np.int64)
+    wild = np.array([wild_face(lv) if lv >= MIN_LEVEL else -2 for lv in levels], dtype=np.int64)
+    level_ranks = np.array([level_rank(lv) if lv >= MIN_LEVEL else 0 for lv in levels], dtype=np.int64)
+
+    # 窗口求和用浮点矩阵乘法（走 BLAS，整数矩阵乘法没有优化），计数很小，结果是精确的
+    def windows(sequences):
+        table = np.zeros((RANK_COUNT, len(sequences)), dtype=np.float32)
+        for start, ranks in enumerate(sequences):
+            table[list(ranks), start] = 1
+        return table
+
+    bomb_tier = np.full(MAX_PLAY_SIZE + 2, -1, dtype=np.int64)
+    for size, tier in _BOMB_TIER.items():
+        bomb_tier[size] = tier
+    is_bomb = np.zeros(len(TYPES) + 1, dtype=bool)
+    for card_type in BOMB_TYPES:
+        is_bomb[TYPE_INDEX[card_type]] = True
+    _tables = {
+        "rank": rank, "suit": suit, "face": face, "rank_values": rank_values, "card_values": card_values,
+        "wild": wild, "level_rank": level_ranks, "bomb_tier": bomb_tier, "is_bomb": is_bomb,
+        "straights": windows(STRAIGHT_SEQUENCES), "pairs": windows(PAIRS_SEQUENCES),
+        "triples": windows(TRIPLES_SEQUENCES),
+    }
+    return _tables
+
+
+def _levels(level: Level, n: int) -> "np.ndarray":
+    levels = np.broadcast_to(np.asarray(level, dtype=np.int64), (n,))
+    if n and (levels.min() < MIN_LEVEL or levels.max() > MAX_LEVEL):
+        raise ValueError("level out of range")
+    return levels
+
+
+def _last_match(ok: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """每行中最后一个为真的列（连续牌型取最大的起点），以及该行是否有为真的列"""
+    found = ok.any(axis=1)
+    last = ok.shape[1] - 1 - np.argmax(ok[:, ::-1], axis=1)
+    return last, found
+
+
+def _classify(counts: "np.ndarray", wilds: "np.ndarray", levels: "np.ndarray",
+              flush: "np.ndarray") -> Batch:
+    """逐手判定（combos._classify）的向量化版本
+
+    counts 为不含逢人配的点数计数，flush 表示所有自然牌花色相同（同花顺的必要条件）。
+    """
+    t = _build_tables()
+    n = counts.shape[0]
+    rows = np.arange(n)
+    rank_values = t["rank_values"]
+    natural = counts.sum(axis=1)
+    size = natural + wilds
+    present = counts > 0
+    distinct = present.sum(axis=1)
+    jokers = counts[:, SMALL_JOKER] + counts[:, BIG_JOKER]
+
+    kind = np.full(n, INVALID, dtype=np.int64)
+    key = np.zeros(n, dtype=np.int64)
+    alt_kind = np.full(n, INVALID, dtype=np.int64)
+    alt_key = np.zeros(n, dtype=np.int64)
+
+    # 同点数牌：单张、对子、三张、炸弹；只有逢人配时按级牌处理
+    low = np.argmax(present, axis=1)
+    high = RANK_COUNT - 1 - np.argmax(present[:, ::-1], axis=1)
+    rank = np.where(distinct == 0, t["level_rank"][levels], low)
+    value = rank_values[levels, rank]
+    same = (distinct <= 1) & (size > 0)
+    joker = rank >= SMALL_JOKER
+    ok = same & joker & (wilds == 0) & (size <= 2)
+    kind[ok] = np.where(size[ok] == 1, _SINGLE, _PAIR)
+    key[ok] = value[ok]
+    ok = same & ~joker & (size <= 3)
+    kind[ok] = np.array([INVALID, _SINGLE, _PAIR, _TRIPLE])[size[ok]]
+    key[ok] = value[ok]
+    tier = t["bomb_tier"][np.minimum(size, MAX_PLAY_SIZE + 1)]
+    ok = same & ~joker & (tier >= 0)
+    kind[ok] = _BOMB
+    key[ok] = tier[ok] * _TIER_WIDTH + value[ok]
+
+    # 四王
+    ok = (size == 4) & (counts[:, SMALL_JOKER] == 2) & (counts[:, BIG_JOKER] == 2)
+    kind[ok] = _JOKER_BOMB
+    key[ok] = JOKER_BOMB_KEY
+
+    # 5 张：同花顺、顺子、三带二
+    five = ~same & (size == 5)
+    totals = natural[:, None]
+    ones = (counts == 1).astype(np.float32)
+    start, found = _last_match(ones @ t["straights"] == totals)
+    straight = five & (jokers == 0) & found
+    straight_flush = straight & flush
+    kind[straight] = _STRAIGHT
+    key[straight] = start[straight]
+    kind[straight_flush] = _STRAIGHT_FLUSH
+    key[straight_flush] = _STRAIGHT_FLUSH_TIER * _TIER_WIDTH + start[straight_flush]
+    alt_kind[straight_flush] = _STRAIGHT
+    alt_key[straight_flush] = start[straight_flush]
+
+    two = five & (distinct == 2)
+    best = np.full(n, -1, dtype=np.int64)
+    for triple, pair in ((low, high), (high, low)):
+        triple_count = counts[rows, triple]
+        pair_count = counts[rows, pair]
+        ok = two & (triple < SMALL_JOKER) & (triple_count <= 3) & (pair_count <= 2)
+        ok &= (pair < SMALL_JOKER) | (pair_count == 2)
+        best = np.where(ok, np.maximum(best, rank_values[levels, triple]), best)
+    # 三张加两张逢人配：首选为 5 张炸弹，逢人配作为级牌对子时也是三带二
+    full = same & ~joker & (size == 5) & (wilds == 2) & (rank != t["level_rank"][levels])
+    alt_kind[full] = _TRIPLE_WITH_PAIR
+    alt_key[full] = value[full]
+
+    ok = best >= 0
+    # 顺子与三带二不会同时成立（逢人配不超过 2 张），三带二只作为首选解释
+    first = ok & (kind == INVALID)
+    kind[first] = _TRIPLE_WITH_PAIR
+    key[first] = best[first]
+
+    # 6 张：钢板、连对
+    six = ~same & (size == 6) & (jokers == 0)
+    dense = counts.astype(np.float32)
+    start_t, found_t = _last_match((dense @ t["triples"] == totals)
+                                   & ((counts > 3).astype(np.float32) @ t["triples"] == 0))
+    start_p, found_p = _last_match((dense @ t["pairs"] == totals)
+                                   & ((counts > 2).astype(np.float32) @ t["pairs"] == 0))
+    triples = six & found_t
+    pairs = six & found_p
+    kind[triples] = _CONSECUTIVE_TRIPLES
+    key[triples] = start_t[triples]
+    only_pairs = pairs & ~triples
+    kind[only_pairs] = _CONSECUTIVE_PAIRS
+    key[only_pairs] = start_p[only_pairs]
+    both = pairs & triples
+    alt_kind[both] = _CONSECUTIVE_PAIRS
+    alt_key[both] = start_p[both]
+
+    return Batch(kind, key, alt_kind, alt_key)
+
+
+def classify_counts(counts, level: Level, wilds=None) -> Batch:
+    """判定 (N, 15) 的点数计数矩阵，wilds 为每手牌另外的逢人配张数（默认为 0）"""
+    _require_numpy()
+    counts = np.asarray(counts, dtype=np.int16)
+    if counts.ndim != 2 or counts.shape[1] != RANK_COUNT:
+        raise ValueError(f"counts must have shape (N, {RANK_COUNT})")
+    n = counts.shape[0]
+    wilds = np.zeros(n, dtype=np.int16) if wilds is None else np.broadcast_to(
+        np.asarray(wilds, dtype=np.int16), (n,))
+    return _classify(counts, wilds, _levels(level, n), np.zeros(n, dtype=bool))
+
+
+def encode_ids(plays: Sequence[Sequence], width: Optional[int] = None) -> "np.ndarray":
+    """把若干手牌（Card 或 card id）编码为 (N, k) 的 id 矩阵，不足 k 张的用 -1 补齐"""
+    _require_numpy()
+    width = width if width is not None else max((len(play) for play in plays), default=0)
+    ids = np.full((len(plays), width), -1, dtype=np.int64)
+    for i, play in enumerate(plays):
+        ids[i, :len(play)] = [card if isinstance(card, int) else card.id for card in play]
+    return ids
+
+
+def _id_matrix(ids) -> "np.ndarray":
+    ids = np.asarray(ids, dtype=np.int64)
+    if ids.ndim != 2:
+        raise ValueError("ids must have shape (N, k)")
+    if ids.size and (ids.min() < -1 or ids.max() >= DECK_SIZE):
+        raise ValueError("card id out of range")
+    # -1 映射到查询表的最后一列
+    return np.where(ids < 0, DECK_SIZE, ids)
+
+
+def counts_from_ids(ids, level: Level) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """(N, k) 的 id 矩阵转为 (不含逢人配的点数计数, 逢人配张数, 自然牌是否同一花色)"""
+    t = _build_tables()
+    ids = _id_matrix(ids)
+    n = ids.shape[0]
+    levels = _levels(level, n)
+    wild = t["face"][ids] == t["wild"][levels][:, None]
+    ranks = np.where(wild, RANK_COUNT, t["rank"][ids])
+    flat = (np.arange(n)[:, None] * (RANK_COUNT + 1) + ranks).ravel()
+    counts = np.bincount(flat, minlength=n * (RANK_COUNT + 1)).reshape(n, RANK_COUNT + 1)[:, :RANK_COUNT]
+    counts = counts.astype(np.int16)
+    suits = np.where(wild, -1, t["suit"][ids])
+    high = suits.max(axis=1, initial=-1)
+    low = np.where(suits < 0, 99, suits).min(axis=1, initial=99)
+    flush = (high == low) | (high < 0)
+    return counts, wild.sum(axis=1, dtype=np.int16), flush
+
+
+def classify_ids(ids, level: Level) -> Batch:
+    """判定 (N, k) 的 id 矩阵，与逐手调用 combos.interpretations 的结果一致"""
+    counts, wilds, flush = counts_from_ids(ids, level)
+    return _classify(counts, wilds, _levels(level, counts.shape[0]), flush)
+
+
+def _beats(kind, key, other_kind, other_key) -> "np.ndarray":
+    is_bomb = _build_tables()["is_bomb"]
+    bomb = is_bomb[kind]
+    other_bomb = is_bomb[other_kind]
+    result = np.where(bomb, ~other_bomb | (key > other_key),
+                      ~other_bomb & (kind == other_kind) & (key > other_key))
+    return result & (kind != INVALID) & (other_kind != INVALID)
+
+
+def beats(batch: Batch, other: Batch) -> "np.ndarray":
+    """batch 中每手牌（任一种解释）能否压过 other 中对应的牌（首选解释）"""
+    return (_beats(batch.type, batch.key, other.type, other.key)
+            | _beats(batch.alt_type, batch.alt_key, other.type, other.key))
+
+
+def compare_ids(ids1, ids2, level: Level) -> "np.ndarray":
+    """逐行比较两组出牌，返回 ids1 是否大于 ids2（GameState.compare_cards）"""
+    return beats(classify_ids(ids1, level), classify_ids(ids2, level))
+
+
+def card_values(ids, level: Level) -> "np.ndarray":
+    """每张牌在该级别下的大小（GameState.get_card_value），补齐的位置为 0"""
+    t = _build_tables()
+    ids = _id_matrix(ids)
+    levels = _levels(level, ids.shape[0])
+    return t["card_values"][levels[:, None], ids]
+
+
+# ---- 与逐手判定核对 ----
+
+def random_plays(count: int, rng: random.Random) -> Tuple[list, list]:
+    """随机的出牌与级别：一半取自手牌中的合法出牌，一半随机选 1~10 张"""
+    from .replay import deal
+    plays = []
+    levels = []
+    while len(plays) < count:
+        level = rng.randint(MIN_LEVEL, MAX_LEVEL)
+        state = deal(rng.getrandbits(32), level)
+        for seat in range(4):
+            hand = list(state.players_hands[seat])
+            moves = state.legal_moves(seat)
+            for move in rng.sample(moves, min(len(moves), 20)):
+                plays.append([card.id for card in move.cards])
+                levels.append(level)
+            for _ in range(20):
+                plays.append([card.id for card in rng.sample(hand, rng.randint(1, MAX_PLAY_SIZE))])
+                levels.append(level)
+    return plays[:count], levels[:count]
+
+
+class Mismatch(NamedTuple):
+    """一手批量判定与逐手判定不一致的出牌；expected / got 为 (牌型, 能否压过下一手, 每张牌的大小)"""
+    level: int
+    cards: List[str]
+    expected: Tuple[Optional[Combo], bool, List[int]]
+    got: Tuple[Optional[Combo], bool, List[int]]
+
+
+class CheckResult(NamedTuple):
+    count: int
+    mismatches: List[Mismatch]
+    vector_time: float
+    scalar_time: float
+
+
+def check(count: int, seed: int = 1) -> CheckResult:
+    """核对 count 手随机出牌的判定与两两比较，返回不一致的出牌与两种判定各自的耗时"""
+    rng = random.Random(seed)
+    plays, levels = random_plays(count, rng)
+    others = plays[1:] + plays[:1]
+    ids = encode_ids(plays, MAX_PLAY_SIZE)
+    other_ids = encode_ids(others, MAX_PLAY_SIZE)
+    level_array = np.array(levels)
+
+    start = time.perf_counter()
+    batch = classify_ids(ids, level_array)
+    wins = beats(batch, classify_ids(other_ids, level_array))
+    values = card_values(ids, level_array)
+    vector_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cards = [[CARDS[i] for i in play] for play in plays]
+    other_cards = [[CARDS[i] for i in play] for play in others]
+    expected = []
+    for play, other, level in zip(cards, other_cards, levels):
+        combo = classify(play, level)
+        other_combo = classify(other, level)
+        win = other_combo is not None and find_beating(interpretations(play, level), other_combo) is not None
+        expected.append((combo, win, [CARD_VALUES[level][card.id] for card in play]))
+    scalar_time = time.perf_counter() - start
+
+    mismatches = []
+    for i, want in enumerate(expected):
+        got = (batch.combo(i), bool(wins[i]), [int(value) for value in values[i, :len(want[2])]])
+        if got != want:
+            mismatches.append(Mismatch(levels[i], [str(card) for card in cards[i]], want, got))
+    return CheckResult(len(plays), mismatches, vector_time, scalar_time)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="批量牌型判定")
+    parser.add_argument("--check", type=int, default=100000, help="与逐手判定核对的随机出牌数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    _require_numpy()
+    result = check(args.check, args.seed)
+    for mismatch in result.mismatches[:10]:
+        print(f"mismatch: level={mismatch.level} cards={mismatch.cards} "
+              f"expected={mismatch.expected} got={mismatch.got}")
+    print(f"{result.count} plays: {len(result.mismatches)} mismatches, batch {result.vector_time * 1e3:.1f}ms, "
+          f"scalar {result.scalar_time * 1e3:.1f}ms ({result.scalar_time / max(result.vector_time, 1e-9):.1f}x)")
+    return 1 if result.mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+"""牌的紧凑编码
+
+两副牌共 108 张，每张牌对应一个 0..107 的整数 id：
+    id = 副号 * 54 + 牌面
+其中牌面 (face) 为 0..53：普通牌为 花色 * 13 + 点数，52 为小王，53 为大王。
+点数索引 (rank index) 为 0..14：0..12 依次为 2..A，13 为小王，14 为大王。
+
+所有查询（花色、点数、名称、各级别下的牌值）都是预先计算好的表，
+Card 是共享的不可变享元对象，手牌用 Hand 的计数向量表示。
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from enum import Enum
+
+
+class CardSuit(Enum):
+    SPADES = "♠"
+    HEARTS = "♥"
+    DIAMONDS = "♦"
+    CLUBS = "♣"
+    JOKER = "🃏"
+
+
+class CardRank(Enum):
+    TWO = "2"
+    THREE = "3"
+    FOUR = "4"
+    FIVE = "5"
+    SIX = "6"
+    SEVEN = "7"
+    EIGHT = "8"
+    NINE = "9"
+    TEN = "10"
+    JACK = "J"
+    QUEEN = "Q"
+    KING = "K"
+    ACE = "A"
+    JOKER_SMALL = "小王"
+    JOKER_BIG = "大王"
+
+
+SUITS: Tuple[CardSuit, ...] = tuple(CardSuit)
+RANKS: Tuple[CardRank, ...] = tuple(CardRank)
+
+SUIT_COUNT = 4            # 不含王的花色数
+NATURAL_RANK_COUNT = 13   # 2..A
+RANK_COUNT = 15           # 2..A + 小王 + 大王
+FACE_COUNT = 54           # 一副牌的牌面数
+DECK_SIZE = 108           # 两副牌
+
+SMALL_JOKER = 13          # 小王的点数索引
+BIG_JOKER = 14            # 大王的点数索引
+JOKER_SUIT = 4            # 王的花色索引
+
+MIN_LEVEL = 2
+MAX_LEVEL = 14            # A 级
+
+_SUIT_INDEX: Dict[CardSuit, int] = {suit: i for i, suit in enumerate(SUITS)}
+_RANK_INDEX: Dict[CardRank, int] = {rank: i for i, rank in enumerate(RANKS)}
+
+
+def face_of(suit_index: int, rank_index: int) -> int:
+    """由花色索引和点数索引计算牌面"""
+    if rank_index >= SMALL_JOKER:
+        return 52 + rank_index - SMALL_JOKER
+    return suit_index * NATURAL_RANK_COUNT + rank_index
+
+
+def _face_suit(face: int) -> int:
+    return JOKER_SUIT if face >= 52 else face // NATURAL_RANK_COUNT
+
+
+def _face_rank(face: int) -> int:
+    return SMALL_JOKER + face - 52 if face >= 52 else face % NATURAL_RANK_COUNT
+
+
+def _face_name(face: int) -> str:
+    suit = SUITS[_face_suit(face)]
+    rank = RANKS[_face_rank(face)]
+    if suit == CardSuit.JOKER:
+        return rank.value
+    return f"{suit.value}{rank.value}"
+
+
+# 以 card id 为下标的查询表
+CARD_FACE: Tuple[int, ...] = tuple(i % FACE_COUNT for i in range(DECK_SIZE))
+CARD_SUIT: Tuple[int, ...] = tuple(_face_suit(f) for f in CARD_FACE)
+CARD_RANK: Tuple[int, ...] = tuple(_face_rank(f) for f in CARD_FACE)
+CARD_NAMES: Tuple[str, ...] = tuple(_face_name(f) for f in CARD_FACE)
+
+# 每个点数对应的牌面，按花色顺序
+RANK_FACES: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(face_of(s, r) for s in range(SUIT_COUNT)) if r < SMALL_JOKER else (face_of(JOKER_SUIT, r),)
+    for r in range(RANK_COUNT)
+)
+
+
+def level_rank(level: int) -> int:
+    """级牌对应的点数索引"""
+    return level - MIN_LEVEL
+
+
+HEART_SUIT = SUITS.index(CardSuit.HEARTS)
+
+
+def wild_face(level: int) -> int:
+    """逢人配（红桃级牌）的牌面"""
+    return face_of(HEART_SUIT, level_rank(level))
+
+
+MAX_RANK_COPIES = 8       # 同一点数最多 8 张（两副牌四种花色）
+NATURAL_RANK_MASK = (1 << NATURAL_RANK_COUNT) - 1
+
+# 同花顺窗口：起点 s 对应的点数位掩码，s = 0 时 A 作 1
+STRAIGHT_WINDOWS: Tuple[int, ...] = tuple(
+    (1 << (NATURAL_RANK_COUNT - 1)) | 0b1111 if s == 0 else 0b11111 << (s - 1)
+    for s in range(NATURAL_RANK_COUNT - 3)
+)
+
+
+def _rank_values(level: int) -> Tuple[int, ...]:
+    # 普通牌按自然点数 2..14，级牌大于 A 记 15，小王 16，大王 17
+    values = [r + 2 for r in range(NATURAL_RANK_COUNT)] + [16, 17]
+    values[level_rank(level)] = 15
+    return tuple(values)
+
+
+# RANK_VALUES[level][rank_index] / CARD_VALUES[level][card_id]，level 取 2..14
+RANK_VALUES: Tuple[Optional[Tuple[int, ...]], ...] = tuple(
+    _rank_values(level) if MIN_LEVEL <= level <= MAX_LEVEL else None
+    for level in range(MAX_LEVEL + 1)
+)
+CARD_VALUES: Tuple[Optional[Tuple[int, ...]], ...] = tuple(
+    tuple(values[r] for r in CARD_RANK) if values else None
+    for values in RANK_VALUES
+)
+
+
+class Card:
+    """一张牌，共享的不可变享元，只保存 card id
+
+    Card(suit, rank) 返回对应牌面第一副牌的实例；两副牌中相同牌面的牌相等。
+    """
+    __slots__ = ("id",)
+
+    def __new__(cls, suit: CardSuit, rank: CardRank, copy: int = 0):
+        face = face_of(_SUIT_INDEX[suit], _RANK_INDEX[rank])
+        return CARDS[copy * FACE_COUNT + face]
+
+    @classmethod
+    def _make(cls, card_id: int) -> "Card":
+        card = object.__new__(cls)
+        object.__setattr__(card, "id", card_id)
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Card is immutable")
+
+    def __reduce__(self):
+        return (card_from_id, (self.id,))
+
+    @property
+    def suit(self) -> CardSuit:
+        return SUITS[CARD_SUIT[self.id]]
+
+    @property
+    def rank(self) -> CardRank:
+        return RANKS[CARD_RANK[self.id]]
+
+    @property
+    def face(self) -> int:
+        return CARD_FACE[self.id]
+
+    @property
+    def rank_index(self) -> int:
+        return CARD_RANK[self.id]
+
+    def __eq__(self, other):
+        if not isinstance(other, Card):
+            return NotImplemented
+        return CARD_FACE[self.id] == CARD_FACE[other.id]
+
+    def __hash__(self):
+        return CARD_FACE[self.id]
+
+    def __str__(self):
+        return CARD_NAMES[self.id]
+
+    def __repr__(self):
+        return f"Card({CARD_NAMES[self.id]})"
+
+
+CARDS: Tuple[Card, ...] = tuple(Card._make(i) for i in range(DECK_SIZE))
+CARD_BY_NAME: Dict[str, Card] = {CARD_NAMES[face]: CARDS[face] for face in range(FACE_COUNT)}
+
+
+def card_from_id(card_id: int) -> Card:
+    return CARDS[card_id]
+
+
+def parse_card(name: str) -> Optional[Card]:
+    """将牌的名称（如 "♠10"、"大王"）解析为 Card，无法识别时返回 None"""
+    return CARD_BY_NAME.get(name)
+
+
+def card_names(cards: Iterable[Card]) -> List[str]:
+    return [CARD_NAMES[card.id] for card in cards]
+
+
+class Hand:
+    """手牌索引：按牌面计数 (counts) 与按点数计数 (rank_counts) 的向量表示
+
+    另外增量维护两组位掩码，增删一张牌都是 O(1)：
+      - rank_masks[k]：张数不少于 k 的点数集合（k 取 1..8）
+      - suit_masks[s]：花色 s 中持有的点数集合
+    炸弹、同花顺候选等与级别有关的查询都基于这些掩码完成。
+
+    迭代时按点数从小到大产出 Card，同一牌面的第二张使用第二副牌的 id。
+    """
+    __slots__ = ("counts", "rank_counts", "size", "rank_masks", "suit_masks")
+
+    def __init__(self, cards: Iterable[Card] = ()):
+        self.counts = bytearray(FACE_COUNT)
+        self.rank_counts = bytearray(RANK_COUNT)
+        self.size = 0
+        self.rank_masks = [0] * (MAX_RANK_COPIES + 1)
+        self.suit_masks = [0] * (SUIT_COUNT + 1)
+        for card in cards:
+            self.add(card)
+
+    def add_id(self, card_id: int):
+        face = CARD_FACE[card_id]
+        rank = CARD_RANK[card_id]
+        self.counts[face] += 1
+        self.rank_counts[rank] += 1
+        self.size += 1
+        self.rank_masks[self.rank_counts[rank]] |= 1 << rank
+        self.suit_masks[CARD_SUIT[card_id]] |= 1 << rank
+
+    def add(self, card: Card):
+        self.add_id(card.id)
+
+    def remove(self, card: Card):
+        """移除一张同牌面的牌，不存在时抛出 ValueError"""
+        card_id = card.id
+        face = CARD_FACE[card_id]
+        if not self.counts[face]:
+            raise ValueError(f"{card} not in hand")
+        rank = CARD_RANK[card_id]
+        self.rank_masks[self.rank_counts[rank]] &= ~(1 << rank)
+        self.counts[face] -= 1
+        self.rank_counts[rank] -= 1
+        self.size -= 1
+        if not self.counts[face]:
+            self.suit_masks[CARD_SUIT[card_id]] &= ~(1 << rank)
+
+    def contains_all(self, cards: Iterable[Card]) -> bool:
+        """手牌中是否包含 cards 中的全部牌（考虑重复）"""
+        needed: Dict[int, int] = {}
+        counts = self.counts
+        for card in cards:
+            face = CARD_FACE[card.id]
+            n = needed.get(face, 0) + 1
+            if n > counts[face]:
+                return False
+            needed[face] = n
+        return True
+
+    def copy(self) -> "Hand":
+        other = Hand.__new__(Hand)
+        other.counts = bytearray(self.counts)
+        other.rank_counts = bytearray(self.rank_counts)
+        other.size = self.size
+        other.rank_masks = list(self.rank_masks)
+        other.suit_masks = list(self.suit_masks)
+        return other
+
+    def assign(self, other: "Hand"):
+        """原地换成与 other 相同的牌，沿用自己的缓冲区"""
+        self.counts[:] = other.counts
+        self.rank_counts[:] = other.rank_counts
+        self.size = other.size
+        self.rank_masks[:] = other.rank_masks
+        self.suit_masks[:] = other.suit_masks
+
+    def clear(self):
+        self.counts = bytearray(FACE_COUNT)
+        self.rank_counts = bytearray(RANK_COUNT)
+        self.size = 0
+        self.rank_masks = [0] * (MAX_RANK_COPIES + 1)
+        self.suit_masks = [0] * (SUIT_COUNT + 1)
+
+    # 与级别有关的查询
+
+    def wild_count(self, level: int) -> int:
+        """逢人配的张数"""
+        return self.counts[wild_face(level)]
+
+    @property
+    def joker_count(self) -> int:
+        return self.rank_counts[SMALL_JOKER] + self.rank_counts[BIG_JOKER]
+
+    @property
+    def has_joker_bomb(self) -> bool:
+        return self.rank_counts[SMALL_JOKER] == 2 and self.rank_counts[BIG_JOKER] == 2
+
+    def ranks_with(self, n: int, level: int) -> int:
+        """算上逢人配后能凑出 n 张的普通点数集合（位掩码）
+
+        逢人配本身计在级牌的点数上；其他点数至少要有一张自然牌。
+        """
+        wilds = self.wild_count(level)
+        level_bit = 1 << level_rank(level)
+        masks = self.rank_masks
+        natural = max(n - wilds, 1)
+        others = masks[natural] & ~level_bit if natural <= MAX_RANK_COPIES else 0
+        own = masks[n] & level_bit if n <= MAX_RANK_COPIES else 0
+        return (others | own) & NATURAL_RANK_MASK
+
+    def bomb_mask(self, level: int) -> int:
+        """能组成（至少 4 张）炸弹的点数集合"""
+        return self.ranks_with(4, level)
+
+    def straight_flush_candidates(self, level: int) -> List[Tuple[int, int]]:
+        """能组成同花顺的 (花色, 起点) 列表"""
+        wilds = self.wild_count(level)
+        need = 5 - wilds
+        result = []
+        for suit in range(SUIT_COUNT):
+            mask = self.suit_masks[suit]
+            if suit == HEART_SUIT and wilds:
+                # 逢人配单独计数，不占红桃级牌的位置
+                mask &= ~(1 << level_rank(level))
+            for start, window in enumerate(STRAIGHT_WINDOWS):
+                if bin(mask & window).count("1") >= need:
+                    result.append((suit, start))
+        return result
+
+    def has_bomb(self, level: int) -> bool:
+        """是否持有任意炸弹（含同花顺与四王）"""
+        return bool(self.has_joker_bomb or self.bomb_mask(level)
+                    or self.straight_flush_candidates(level))
+
+    def __contains__(self, card: Card) -> bool:
+        return self.counts[CARD_FACE[card.id]] > 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def __iter__(self) -> Iterator[Card]:
+        counts = self.counts
+        for rank in range(RANK_COUNT):
+            if not self.rank_counts[rank]:
+                continue
+            for face in RANK_FACES[rank]:
+                for copy in range(counts[face]):
+                    yield CARDS[copy * FACE_COUNT + face]
+
+    def ids(self) -> List[int]:
+        return [card.id for card in self]
+
+    def __repr__(self):
+        return f"Hand({' '.join(card_names(self))})"
@@ -0,0 +1,337 @@
+"""多 worker 部署时的房间归属与跨 worker 转发
+
+每个房间只归属一个 worker，房间的 GameState、AI 回合和广播都在归属的 worker 上执行。
+请求落到其他 worker 时：
+  - HTTP 请求（加入房间、查询状态）通过状态存储的发布/订阅转发给归属 worker 执行（call）
+  - WebSocket 连接留在接受它的 worker 上，客户端消息转发给归属 worker；
+    归属 worker 用 RemoteConnection 代表这个连接，发给它的消息按 worker 合并后
+    转发回来，再放入本地连接的发送队列
+
+归属记录在 "room:{room_id}:owner"，worker 通过 "worker:{worker_id}" 心跳表明存活。
+房间状态变化后标记为脏，由后台任务定期序列化到 "room:{room_id}"；
+归属 worker 失去心跳后，其他 worker 收到该房间的请求时从存储中恢复房间并接管。
+
+没有 fencing：归属 worker 只是暂停（长时间阻塞、网络中断）而不是退出时，超过 OWNER_TTL
+后房间会被接管，它恢复之后并不知道归属已经改变，仍会继续处理已连接客户端的操作并把房间状态
+写入存储，覆盖新归属 worker 保存的状态。OWNER_TTL 需要明显长于正常情况下可能的停顿。
+
+未配置 STATE_STORE 时不启用，所有房间都在当前进程中。
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import socket
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Union
+
+from .game import GameState
+from .protocol import SNAPSHOT
+from .series import Series
+from .store import StateStore, open_store
+from .wire import JSON, encode
+
+logger = logging.getLogger(__name__)
+
+OWNER_TTL = float(os.environ.get("CLUSTER_OWNER_TTL", "15"))
+RPC_TIMEOUT = float(os.environ.get("CLUSTER_RPC_TIMEOUT", "5"))
+FLUSH_INTERVAL = float(os.environ.get("CLUSTER_FLUSH_INTERVAL", "0.5"))
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class RemoteError(Exception):
+    """归属 worker 执行请求时出错"""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _default(obj):
+    if isinstance(obj, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(obj).decode()}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _object_hook(obj):
+    if len(obj) == 1 and "__bytes__" in obj:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def pack(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+def unpack(data: bytes) -> Dict[str, Any]:
+    return json.loads(data, object_hook=_object_hook)
+
+
+ROOM_FIELDS = ("players", "mode", "ai_mode", "seq", "version", "round", "seed", "deal_seed", "spectator_delay")
+
+
+def serialize_room(room: Dict) -> bytes:
+    data = {key: room[key] for key in ROOM_FIELDS if key in room}
+    data["game_state"] = room["game_state"].to_dict()
+    if "series" in room:
+        data["series"] = room["series"].to_dict()
+    return pack(data)
+
+
+def deserialize_room(data: bytes) -> Dict:
+    room = unpack(data)
+    room["game_state"] = GameState.from_dict(room["game_state"])
+    room["series"] = Series.from_dict(room["series"]) if "series" in room else Series()
+    return room
+
+
+class RemoteConnection:
+    """连接在其他 worker 上的客户端，接口与 ClientConnection 相同"""
+
+    def __init__(self, cluster: "Cluster", worker: str, player_id: str, connection_id: str,
+                 protocol: str = SNAPSHOT, wire_format: str = JSON):
+        self.cluster = cluster
+        self.worker = worker
+        self.player_id = player_id
+        self.connection_id = connection_id
+        self.protocol = protocol
+        self.wire_format = wire_format
+        self.closed = False
+        self.closing = False
+
+    async def send(self, message: Dict[str, Any]):
+        await self.send_encoded(encode(message, self.wire_format))
+
+    async def send_encoded(self, payload: Union[str, bytes]):
+        if not self.closed:
+            self.cluster.deliver(self.worker, self.player_id, self.connection_id, payload)
+
+    async def send_json(self, data: Dict[str, Any]):
+        await self.send_encoded(json.dumps(data, ensure_ascii=False))
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        self.cluster.notify(self.worker, "close", player_id=self.player_id,
+                            connection_id=self.connection_id, code=code)
+
+
+class Cluster:
+    def __init__(self, store: StateStore, rooms: Dict[str, Dict], worker_id: Optional[str] = None,
+                 owner_ttl: float = OWNER_TTL, rpc_timeout: float = RPC_TIMEOUT,
+                 flush_interval: float = FLUSH_INTERVAL):
+        self.store = store
+        self.rooms = rooms
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.owner_ttl = owner_ttl
+        self.rpc_timeout = rpc_timeout
+        self.flush_interval = flush_interval
+        self.handlers: Dict[str, Handler] = {}
+        self._dirty: Set[str] = set()
+        self._replies: Dict[str, asyncio.Future] = {}
+        self._outbox: Dict[str, List[Dict[str, Any]]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    # ---- 生命周期 ----
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        await self._heartbeat()
+        inbox = await self.store.subscribe(self._channel(self.worker_id))
+        self._tasks = [
+            asyncio.ensure_future(self._listen(inbox)),
+            asyncio.ensure_future(self._heartbeat_loop()),
+            asyncio.ensure_future(self._flush_loop()),
+            asyncio.ensure_future(self._send_loop()),
+        ]
+
+    async def stop(self):
+        await self.flush()
+        await self._send_outbox()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.store.delete(f"worker:{self.worker_id}")
+
+    def handler(self, op: str):
+        """注册处理其他 worker 请求的函数"""
+        def register(func: Handler):
+            self.handlers[op] = func
+            return func
+        return register
+
+    # ---- 房间归属 ----
+
+    @staticmethod
+    def _owner_key(room_id: str) -> str:
+        return f"room:{room_id}:owner"
+
+    async def claim(self, room_id: str) -> bool:
+        """抢占一个新房间的归属"""
+        return await self.store.set_if_absent(self._owner_key(room_id), self.worker_id.encode())
+
+    async def release(self, room_id: str):
+        """房间被删除时释放归属与保存的状态"""
+        self._dirty.discard(room_id)
+        await self.store.delete(self._owner_key(room_id))
+        await self.store.delete(f"room:{room_id}")
+
+    async def is_alive(self, worker: str) -> bool:
+        return await self.store.get(f"worker:{worker}") is not None
+
+    async def owner_of(self, room_id: str) -> Optional[str]:
+        """房间的归属 worker；房间不存在或归属 worker 已失去心跳时返回 None"""
+        owner = await self.store.get(self._owner_key(room_id))
+        if owner is None:
+            return None
+        owner = owner.decode()
+        if owner != self.worker_id and not await self.is_alive(owner):
+            return None
+        return owner
+
+    async def adopt(self, room_id: str) -> Optional[Dict]:
+        """从存储中恢复失去归属的房间并接管，房间不存在或已被其他 worker 接管时返回 None"""
+        data = await self.store.get(f"room:{room_id}")
+        if data is None:
+            return None
+        previous = await self.store.get(self._owner_key(room_id))
+        previous_owner = previous.decode() if previous else ""
+        # 另一个 worker 可能刚刚抢先接管：只从已经失去心跳的 worker 手中接管
+        if previous_owner and previous_owner != self.worker_id and await self.is_alive(previous_owner):
+            return None
+        lock = f"room:{room_id}:takeover:{previous_owner}"
+        if not await self.store.set_if_absent(lock, self.worker_id.encode(), self.owner_ttl):
+            return None
+        await self.store.set(self._owner_key(room_id), self.worker_id.encode())
+        logger.info("worker %s adopted room %s", self.worker_id, room_id)
+        return deserialize_room(data)
+
+    async def _heartbeat(self):
+        await self.store.set(f"worker:{self.worker_id}", b"1", self.owner_ttl)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.owner_ttl / 3)
+            try:
+                await self._heartbeat()
+            except Exception:
+                logger.exception("cluster heartbeat failed")
+
+    # ---- 房间状态 ----
+
+    def mark_dirty(self, room_id: str):
+        """房间状态发生变化，稍后由后台任务保存"""
+        self._dirty.add(room_id)
+
+    async def save_room(self, room_id: str, room: Dict):
+        await self.store.set(f"room:{room_id}", serialize_room(room))
+
+    async def flush(self):
+        dirty, self._dirty = self._dirty, set()
+        for room_id in dirty:
+            room = self.rooms.get(room_id)
+            if room is not None:
+                await self.save_room(room_id, room)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("cluster flush failed")
+
+    # ---- worker 之间的消息 ----
+
+    @staticmethod
+    def _channel(worker: str) -> str:
+        return f"worker:{worker}:inbox"
+
+    async def call(self, worker: str, op: str, **payload) -> Any:
+        """在另一个 worker 上执行 op 并等待结果"""
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._replies[request_id] = future
+        message = {"op": op, "from": self.worker_id, "id": request_id, "payload": payload}
+        try:
+            await self.store.publish(self._channel(worker), pack(message))
+            return await asyncio.wait_for(future, self.rpc_timeout)
+        except asyncio.TimeoutError:
+            raise RemoteError(504, "房间所在的服务进程没有响应")
+        finally:
+            self._replies.pop(request_id, None)
+
+    def notify(self, worker: str, op: str, **payload):
+        """向另一个 worker 发送不需要回复的消息，同一目标的消息按顺序合并发送"""
+        self._outbox.setdefault(worker, []).append({"op": op, "payload": payload})
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def deliver(self, worker: str, player_id: str, connection_id: str, payload: Union[str, bytes]):
+        """把已编码的消息转发给连接所在的 worker"""
+        self.notify(worker, "deliver", player_id=player_id, connection_id=connection_id, data=payload)
+
+    async def _send_outbox(self):
+        outbox, self._outbox = self._outbox, {}
+        for worker, messages in outbox.items():
+            batch = {"op": "batch", "from": self.worker_id, "payload": {"messages": messages}}
+            await self.store.publish(self._channel(worker), pack(batch))
+
+    async def _send_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self._send_outbox()
+            except Exception:
+                logger.exception("cluster relay failed")
+
+    async def _listen(self, inbox: AsyncIterator[bytes]):
+        async for data in inbox:
+            message = unpack(data)
+            if message["op"] == "reply":
+                future = self._replies.get(message["id"])
+                if future is not None and not future.done():
+                    if "error" in message:
+                        error = message["error"]
+                        future.set_exception(RemoteError(error["status"], error["detail"]))
+                    else:
+                        future.set_result(message.get("result"))
+            elif message["op"] == "batch":
+                # 按顺序处理，保证转发给同一连接的消息不乱序
+                for item in message["payload"]["messages"]:
+                    try:
+                        await self._dispatch(item["op"], item["payload"], message["from"])
+                    except Exception:
+                        logger.exception("cluster op %s failed", item["op"])
+            else:
+                asyncio.ensure_future(self._handle_request(message))
+
+    async def _dispatch(self, op: str, payload: Dict[str, Any], sender: str) -> Any:
+        handler = self.handlers.get(op)
+        if handler is None:
+            raise RemoteError(400, f"unknown op {op}")
+        return await handler(sender=sender, **payload)
+
+    async def _handle_request(self, message: Dict[str, Any]):
+        reply: Dict[str, Any] = {"op": "reply", "id": message["id"]}
+        try:
+            reply["result"] = await self._dispatch(message["op"], message["payload"], message["from"])
+        except Exception as exc:
+            reply["error"] = {
+                "status": getattr(exc, "status_code", 500),
+                "detail": getattr(exc, "detail", str(exc)),
+            }
+        await self.store.publish(self._channel(message["from"]), pack(reply))
+
+
+def open_cluster(url: Optional[str], rooms: Dict[str, Dict]) -> Optional[Cluster]:
+    """根据 STATE_STORE 配置创建集群，未配置时返回 None"""
+    if not url:
+        return None
+    return Cluster(open_store(url), rooms)
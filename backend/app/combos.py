@@ -0,0 +1,235 @@
+"""牌型判定
+
+一手牌的签名是一个整数：低 4 位为级别，之后每个牌面占 2 位计数。
+签名只需一次加法循环即可得到，判定结果按签名缓存，命中时不需要排序、
+计数或字符串解析。
+
+支持掼蛋的全部牌型：单张、对子、三张、三带二、顺子（5 张，A 可作 1）、
+连对（3 对）、钢板（2 个连续三张）、炸弹（4~10 张）、同花顺和四王炸弹，
+并支持逢人配（红桃级牌可代替除王以外的任意牌）。
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from enum import Enum
+
+from .cards import (
+    Card, CARD_FACE, CARD_RANK, CARD_SUIT, DECK_SIZE, FACE_COUNT,
+    NATURAL_RANK_COUNT, RANK_COUNT, RANK_VALUES, SMALL_JOKER, BIG_JOKER,
+    level_rank, wild_face,
+)
+
+
+class CardType(Enum):
+    SINGLE = "单张"
+    PAIR = "对子"
+    TRIPLE = "三张"
+    TRIPLE_WITH_PAIR = "三带二"
+    STRAIGHT = "顺子"
+    CONSECUTIVE_PAIRS = "连对"
+    CONSECUTIVE_TRIPLES = "三连三"
+    BOMB = "炸弹"
+    STRAIGHT_FLUSH = "同花顺"
+    JOKER_BOMB = "天王炸"
+
+
+BOMB_TYPES = frozenset((CardType.BOMB, CardType.STRAIGHT_FLUSH, CardType.JOKER_BOMB))
+
+ACE = NATURAL_RANK_COUNT - 1
+
+# 连续牌型的起点 s 对应的点数序列，s = 0 表示 A 作 1
+STRAIGHT_LENGTH = 5
+PAIRS_LENGTH = 3
+TRIPLES_LENGTH = 2
+
+
+def sequence_ranks(start: int, length: int) -> Tuple[int, ...]:
+    """起点为 start 的连续点数，start = 0 时以 A 开头"""
+    return tuple(ACE if start + i == 0 else start + i - 1 for i in range(length))
+
+
+def _sequences(length: int) -> Tuple[Tuple[int, ...], ...]:
+    return tuple(sequence_ranks(s, length) for s in range(NATURAL_RANK_COUNT + 2 - length))
+
+
+STRAIGHT_SEQUENCES = _sequences(STRAIGHT_LENGTH)
+PAIRS_SEQUENCES = _sequences(PAIRS_LENGTH)
+TRIPLES_SEQUENCES = _sequences(TRIPLES_LENGTH)
+
+
+class Combo(NamedTuple):
+    """一种牌型解释：type 为牌型，key 为同牌型之间比较用的大小
+
+    炸弹类牌型（炸弹、同花顺、四王）的 key 在它们之间全局可比。
+    """
+    type: CardType
+    key: int
+
+    @property
+    def is_bomb(self) -> bool:
+        return self.type in BOMB_TYPES
+
+
+# 炸弹等级：4炸 < 5炸 < 同花顺 < 6炸 < ... < 10炸 < 四王
+_BOMB_TIER = {4: 0, 5: 1, 6: 3, 7: 4, 8: 5, 9: 6, 10: 7}
+_STRAIGHT_FLUSH_TIER = 2
+_JOKER_BOMB_TIER = 8
+_TIER_WIDTH = 32
+
+
+def bomb_key(size: int, value: int) -> int:
+    return _BOMB_TIER[size] * _TIER_WIDTH + value
+
+
+def straight_flush_key(start: int) -> int:
+    return _STRAIGHT_FLUSH_TIER * _TIER_WIDTH + start
+
+
+JOKER_BOMB_KEY = _JOKER_BOMB_TIER * _TIER_WIDTH
+
+_LEVEL_BITS = 4
+CARD_SIG: Tuple[int, ...] = tuple(
+    1 << (2 * CARD_FACE[i] + _LEVEL_BITS) for i in range(DECK_SIZE)
+)
+
+_CACHE_LIMIT = 1 << 17
+_cache: Dict[int, Tuple[Combo, ...]] = {}
+
+
+def signature(cards: Iterable[Card], level: int) -> int:
+    sig = level
+    for card in cards:
+        sig += CARD_SIG[card.id]
+    return sig
+
+
+def interpretations(cards: Iterable[Card], level: int) -> Tuple[Combo, ...]:
+    """返回这手牌所有合法的牌型解释，首选的排在最前；不成牌型时为空元组"""
+    sig = level
+    for card in cards:
+        sig += CARD_SIG[card.id]
+    result = _cache.get(sig)
+    if result is None:
+        result = classify_signature(sig)
+    return result
+
+
+def classify(cards: Iterable[Card], level: int) -> Optional[Combo]:
+    """判定牌型，返回首选解释，不成牌型时返回 None"""
+    result = interpretations(cards, level)
+    return result[0] if result else None
+
+
+def beats(combo: Combo, other: Combo) -> bool:
+    """combo 是否能压过 other"""
+    if combo.type in BOMB_TYPES:
+        if other.type in BOMB_TYPES:
+            return combo.key > other.key
+        return True
+    return combo.type == other.type and combo.key > other.key
+
+
+def find_beating(combos: Tuple[Combo, ...], other: Combo) -> Optional[Combo]:
+    """在多种解释中找出能压过 other 的一种"""
+    for combo in combos:
+        if beats(combo, other):
+            return combo
+    return None
+
+
+def classify_signature(sig: int) -> Tuple[Combo, ...]:
+    """按签名判定并写入缓存"""
+    result = _cache.get(sig)
+    if result is not None:
+        return result
+    if len(_cache) >= _CACHE_LIMIT:
+        _cache.clear()
+    result = _cache[sig] = tuple(_classify(sig))
+    return result
+
+
+def _classify(sig: int) -> List[Combo]:
+    level = sig & ((1 << _LEVEL_BITS) - 1)
+    values = RANK_VALUES[level]
+    wild = wild_face(level)
+
+    counts = [0] * RANK_COUNT
+    suits = set()
+    wilds = 0
+    size = 0
+    bits = sig >> _LEVEL_BITS
+    for face in range(FACE_COUNT):
+        n = (bits >> (2 * face)) & 3
+        if not n:
+            continue
+        size += n
+        if face == wild:
+            wilds = n
+            continue
+        counts[CARD_RANK[face]] += n
+        suits.add(CARD_SUIT[face])
+
+    if size == 0:
+        return []
+    natural = size - wilds
+    jokers = counts[SMALL_JOKER] + counts[BIG_JOKER]
+    present = [r for r in range(RANK_COUNT) if counts[r]]
+    combos: List[Combo] = []
+
+    # 同点数牌：单张、对子、三张、炸弹
+    if len(present) <= 1:
+        rank = present[0] if present else level_rank(level)
+        value = values[rank]
+        if rank >= SMALL_JOKER:
+            if wilds == 0 and size <= 2:
+                combos.append(Combo(CardType.SINGLE if size == 1 else CardType.PAIR, value))
+        elif size == 1:
+            combos.append(Combo(CardType.SINGLE, value))
+        elif size == 2:
+            combos.append(Combo(CardType.PAIR, value))
+        elif size == 3:
+            combos.append(Combo(CardType.TRIPLE, value))
+        elif size in _BOMB_TIER:
+            combos.append(Combo(CardType.BOMB, bomb_key(size, value)))
+            # 三张加两张逢人配：逢人配也可以作为级牌本身组成对子，即三带二
+            if size == 5 and wilds == 2 and rank != level_rank(level):
+                combos.append(Combo(CardType.TRIPLE_WITH_PAIR, value))
+        return combos
+
+    if size == 4 and counts[SMALL_JOKER] == 2 and counts[BIG_JOKER] == 2:
+        return [Combo(CardType.JOKER_BOMB, JOKER_BOMB_KEY)]
+
+    if size == 5:
+        # 同花顺与顺子
+        if not jokers:
+            for start in range(len(STRAIGHT_SEQUENCES) - 1, -1, -1):
+                seq = STRAIGHT_SEQUENCES[start]
+                if sum(1 for r in seq if counts[r] == 1) == natural:
+                    if len(suits) == 1:
+                        combos.append(Combo(CardType.STRAIGHT_FLUSH, straight_flush_key(start)))
+                    combos.append(Combo(CardType.STRAIGHT, start))
+                    break
+        # 三带二：取三张最大的解释
+        if len(present) == 2:
+            best = None
+            for triple, pair in ((present[0], present[1]), (present[1], present[0])):
+                if triple >= SMALL_JOKER or counts[triple] > 3 or counts[pair] > 2:
+                    continue
+                if pair >= SMALL_JOKER and counts[pair] != 2:
+                    continue
+                if best is None or values[triple] > best:
+                    best = values[triple]
+            if best is not None:
+                combos.append(Combo(CardType.TRIPLE_WITH_PAIR, best))
+        return combos
+
+    if size == 6 and not jokers:
+        for start in range(len(TRIPLES_SEQUENCES) - 1, -1, -1):
+            seq = TRIPLES_SEQUENCES[start]
+            if all(counts[r] <= 3 for r in seq) and sum(counts[r] for r in seq) == natural:
+                combos.append(Combo(CardType.CONSECUTIVE_TRIPLES, start))
+                break
+        for start in range(len(PAIRS_SEQUENCES) - 1, -1, -1):
+            seq = PAIRS_SEQUENCES[start]
+            if all(counts[r] <= 2 for r in seq) and sum(counts[r] for r in seq) == natural:
+                combos.append(Combo(CardType.CONSECUTIVE_PAIRS, start))
+                break
+    return combos
@@ -0,0 +1,165 @@
+"""客户端连接与发送队列
+
+每个 WebSocket 连接有一个有界的发送队列和一个独立的写任务。广播时只把消息
+放进各个连接的队列，立即返回，真正的发送由各连接的写任务并发完成，
+一个慢客户端不会拖慢同房间的其他玩家和 AI 回合。
+
+消息在放入队列前按连接协商的格式（wire.py）编码，广播时同一格式只编码一次，
+用 send_encoded 发送给所有该格式的连接。
+
+队列满时按策略处理慢客户端：
+  - "disconnect"：断开该连接，客户端重连后会收到完整快照
+  - "drop"：丢弃最早的一条消息（增量协议的客户端会发现序号缺口并重新同步）
+"""
+import asyncio
+import logging
+import os
+import uuid
+from typing import Any, Dict, Optional, Tuple, Union
+
+from fastapi import WebSocketDisconnect
+
+from .metrics import stage
+from .protocol import SNAPSHOT
+from .wire import JSON, decode, encode, is_binary
+
+logger = logging.getLogger(__name__)
+
+SEND_QUEUE_SIZE = int(os.environ.get("SEND_QUEUE_SIZE", "256"))
+SEND_TIMEOUT = float(os.environ.get("SEND_TIMEOUT", "10"))
+SLOW_CLIENT_POLICY = os.environ.get("SLOW_CLIENT_POLICY", "disconnect")
+
+DISCONNECT = "disconnect"
+DROP = "drop"
+
+_JSON = 0
+_TEXT = 1
+_BYTES = 2
+
+
+class MessageError(Exception):
+    """客户端消息无法解码，或者不是带 action 字段的对象"""
+
+
+class ClientConnection:
+    def __init__(self, websocket, player_id: str, protocol: str = SNAPSHOT,
+                 wire_format: str = JSON, max_queue: int = SEND_QUEUE_SIZE, policy: str = SLOW_CLIENT_POLICY,
+                 send_timeout: float = SEND_TIMEOUT):
+        self.websocket = websocket
+        self.player_id = player_id
+        self.connection_id = uuid.uuid4().hex
+        self.protocol = protocol
+        self.wire_format = wire_format
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.queue: "asyncio.Queue[Tuple[int, Any]]" = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+        self.closing = False
+        self.dropped = 0
+        self._writer = asyncio.ensure_future(self._write_loop())
+
+    async def receive(self) -> Dict[str, Any]:
+        """接收并按连接的格式解码一条客户端消息，格式不对时抛出 MessageError（连接仍然可用）"""
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        raw = message.get("bytes")
+        if raw is None:
+            raw = message.get("text")
+        with stage("parse"):
+            try:
+                data = decode(raw, self.wire_format)
+            except Exception as exc:
+                # json 与 msgpack 的解码异常各不相同
+                raise MessageError("无法解析的消息") from exc
+        if not isinstance(data, dict) or not isinstance(data.get("action"), str):
+            raise MessageError("消息缺少 action")
+        return data
+
+    async def send(self, message: Dict[str, Any]):
+        """按连接的格式编码后放入发送队列"""
+        await self.send_encoded(encode(message, self.wire_format))
+
+    async def send_encoded(self, payload: Union[str, bytes]):
+        """发送已按本连接格式编码好的消息"""
+        if is_binary(self.wire_format):
+            self._enqueue((_BYTES, payload))
+        else:
+            self._enqueue((_TEXT, payload))
+
+    async def send_json(self, data: Dict[str, Any]):
+        """放入发送队列，不等待发送完成"""
+        self._enqueue((_JSON, data))
+
+    async def send_text(self, text: str):
+        self._enqueue((_TEXT, text))
+
+    async def send_bytes(self, data: bytes):
+        self._enqueue((_BYTES, data))
+
+    def _enqueue(self, item: Tuple[int, Any]):
+        if self.closed or self.closing:
+            return
+        try:
+            self.queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+        if self.policy == DROP:
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.dropped += 1
+            self.queue.put_nowait(item)
+        else:
+            logger.warning("client %s is too slow, disconnecting", self.player_id)
+            self.closing = True
+            asyncio.ensure_future(self.close(code=1013))
+
+    async def _write_loop(self):
+        websocket = self.websocket
+        while True:
+            kind, payload = await self.queue.get()
+            try:
+                if kind == _JSON:
+                    send = websocket.send_json(payload)
+                elif kind == _TEXT:
+                    send = websocket.send_text(payload)
+                else:
+                    send = websocket.send_bytes(payload)
+                with stage("send"):
+                    await asyncio.wait_for(send, self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # 发送失败或超时，视为连接已断开
+                self.queue.task_done()
+                await self.close()
+                return
+            self.queue.task_done()
+
+    async def drain(self):
+        """等待队列中的消息全部发送完（或连接被关闭）"""
+        if not self.closed:
+            await self.queue.join()
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        # 丢弃尚未发送的消息，避免 drain() 一直等待
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+def get_connection(clients: Dict[str, ClientConnection], player_id: str) -> Optional[ClientConnection]:
+    connection = clients.get(player_id)
+    if connection is None or connection.closed or connection.closing:
+        return None
+    return connection
@@ -0,0 +1,130 @@
+"""发牌
+
+一次发牌只由一个种子决定：random.Random(seed) 洗一副 card id（共享的只读表 DECK），
+从牌堆末尾起按座位轮流取牌，与 GameState.deal_cards 逐张 pop 的结果相同，
+所以 replay.deal(seed, ...) 可以重现任意一局的初始手牌。
+
+房间的发牌：
+  - 创建房间时指定了 seed 的房间，第 n 局的发牌种子为 round_seed(seed, n)，整场可复现；
+  - 其他房间从 DealPool 中取一份预先生成好的发牌（种子与四手牌），开始一局不需要洗牌和建手牌。
+每局的种子记录在 room["deal_seed"] 中，随对局记录一起保存。
+
+DealPool 在后台任务中补充，取用后数量低于一半时唤醒补充任务；池子空了则当场生成。
+"""
+import asyncio
+import os
+import random
+from collections import deque
+from typing import Deque, Dict, NamedTuple, Optional, Tuple
+
+from .cards import DECK_SIZE, Hand
+from .game import GameState
+
+DEAL_POOL_SIZE = int(os.environ.get("DEAL_POOL_SIZE", "256"))
+# 后台补充时每生成这么多份让出一次事件循环
+DEAL_BATCH = 16
+
+DECK: Tuple[int, ...] = tuple(range(DECK_SIZE))
+SEED_MASK = 0xFFFFFFFF
+
+
+class Deal(NamedTuple):
+    """一次发牌：种子与四个座位的手牌（每份只用于一局）"""
+    seed: int
+    hands: Tuple[Hand, Hand, Hand, Hand]
+
+
+def deal_ids(seed: int) -> Tuple[Tuple[int, ...], ...]:
+    """由种子得到四个座位的 card id"""
+    deck = list(DECK)
+    random.Random(seed).shuffle(deck)
+    return tuple(tuple(deck[DECK_SIZE - 1 - seat::-4]) for seat in range(4))
+
+
+def make_deal(seed: int) -> Deal:
+    hands = []
+    for ids in deal_ids(seed):
+        hand = Hand()
+        for card_id in ids:
+            hand.add_id(card_id)
+        hands.append(hand)
+    return Deal(seed, tuple(hands))
+
+
+def new_state(deal: Deal, level: int = 2, first: int = 0) -> GameState:
+    """用一次发牌开始一局"""
+    state = GameState()
+    state.reset_round(deal.hands, level, first)
+    return state
+
+
+def round_seed(seed: int, round_index: int) -> int:
+    """指定种子的房间中第 round_index 局的发牌种子"""
+    return (seed * 1_000_003 + round_index) & SEED_MASK
+
+
+class DealPool:
+    def __init__(self, size: int = DEAL_POOL_SIZE, seed: Optional[int] = None):
+        self.size = size
+        # 不指定 seed 时由系统熵源初始化；每份发牌都带着自己的种子，不依赖这里的状态复现
+        self._rng = random.Random(seed)
+        self._deals: Deque[Deal] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.taken = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._deals)
+
+    def _generate(self) -> Deal:
+        return make_deal(self._rng.getrandbits(32))
+
+    def fill(self):
+        """同步补满（启动时调用）"""
+        while len(self._deals) < self.size:
+            self._deals.append(self._generate())
+
+    def take(self) -> Deal:
+        self.taken += 1
+        if self._deals:
+            deal = self._deals.popleft()
+        else:
+            self.misses += 1
+            deal = self._generate()
+        if self._wakeup is not None and len(self._deals) < self.size // 2:
+            self._wakeup.set()
+        return deal
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._wakeup = None
+
+    async def _run(self):
+        while True:
+            while len(self._deals) < self.size:
+                for _ in range(DEAL_BATCH):
+                    self._deals.append(self._generate())
+                await asyncio.sleep(0)
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    def stats(self) -> Dict[str, int]:
+        return {"available": len(self._deals), "taken": self.taken, "misses": self.misses}
+
+
+def room_deal(room: Dict, pool: DealPool) -> Deal:
+    """房间下一局的发牌，种子记录在 room["deal_seed"] 中"""
+    seed = room.get("seed")
+    if seed is None:
+        deal = pool.take()
+    else:
+        deal = make_deal(round_seed(seed, room.get("round", 0)))
+    room["deal_seed"] = deal.seed
+    return deal
@@ -0,0 +1,385 @@
+"""手牌拆分
+
+把一手牌拆成若干个牌型组合，使出完所需的手数最少。拆分只看点数计数向量（不区分花色，
+同花顺按顺子处理），逢人配单独计数，可以补进任意普通牌的组合。
+
+搜索方式：每一步取计数不为零的最小点数，枚举包含这个点数的所有组合（同点数的单张、对子、三张、
+炸弹，三带二，以及经过它的顺子、连对、钢板），对剩下的计数递归求解，取得分最小者。
+剩余计数相同的子问题结果相同，按 (计数向量, 逢人配张数) 缓存在一个有界的 LRU 中。
+子问题与级别无关，同一局中后续的手牌、其他对局的相同残局都能命中；
+对外的完整结果另外按 (签名, 级别) 缓存。
+可以给出截止时间（time.perf_counter() 的值），超时后抛出 DeadlineExceeded；
+已经求解完的子问题留在缓存中，之后的调用从那里继续。
+
+得分：手数优先，手数相同时保留更多炸弹，其次单张更少。
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .cards import (
+    CARD_FACE, CARD_RANK, CARDS, FACE_COUNT, RANK_COUNT, RANK_FACES, RANK_VALUES,
+    SMALL_JOKER, BIG_JOKER, Card, Hand, level_rank, wild_face,
+)
+from .combos import (
+    CardType, Combo, JOKER_BOMB_KEY, PAIRS_SEQUENCES, STRAIGHT_SEQUENCES, TRIPLES_SEQUENCES,
+    bomb_key, interpretations,
+)
+
+CACHE_SIZE = int(os.environ.get("DECOMPOSE_CACHE_SIZE", "200000"))
+RESULT_CACHE_SIZE = int(os.environ.get("DECOMPOSE_RESULT_CACHE_SIZE", "4096"))
+
+MAX_BOMB_SIZE = 10
+
+# 得分：每手 1000，炸弹减 10，单张加 1
+_TURN = 1000
+_BOMB_BONUS = 10
+_SINGLE_PENALTY = 1
+
+# 只由逢人配组成的组合，主点数即级牌
+WILD_LEAD = -1
+
+Counts = Tuple[int, ...]
+
+
+class DeadlineExceeded(Exception):
+    """拆分没有在截止时间之前完成"""
+
+
+class Group(NamedTuple):
+    """拆分出的一个组合
+
+    ranks 为用到的自然牌点数（每张一个），wilds 为用到的逢人配张数；
+    lead 为同点数牌、三带二中三张的点数，或连续牌型的起点。
+    """
+    type: CardType
+    lead: int
+    ranks: Tuple[int, ...]
+    wilds: int
+
+    @property
+    def size(self) -> int:
+        return len(self.ranks) + self.wilds
+
+    @property
+    def is_bomb(self) -> bool:
+        return self.type in (CardType.BOMB, CardType.JOKER_BOMB)
+
+    def combo(self, level: int) -> Combo:
+        """该组合在级别 level 下的牌型与大小（与 combos.classify 一致）"""
+        values = RANK_VALUES[level]
+        lead = level_rank(level) if self.lead == WILD_LEAD else self.lead
+        if self.type == CardType.JOKER_BOMB:
+            return Combo(self.type, JOKER_BOMB_KEY)
+        if self.type == CardType.BOMB:
+            return Combo(self.type, bomb_key(self.size, values[lead]))
+        if self.type in (CardType.STRAIGHT, CardType.CONSECUTIVE_PAIRS, CardType.CONSECUTIVE_TRIPLES):
+            return Combo(self.type, lead)
+        return Combo(self.type, values[lead])
+
+    def low_value(self, level: int) -> int:
+        """组合中最小的牌值，用于决定首出的顺序"""
+        values = RANK_VALUES[level]
+        if not self.ranks:
+            return values[level_rank(level)]
+        if self.type in (CardType.STRAIGHT, CardType.CONSECUTIVE_PAIRS, CardType.CONSECUTIVE_TRIPLES):
+            return self.lead + 1  # 起点 0 表示 A 作 1
+        return min(values[rank] for rank in self.ranks)
+
+
+class Decomposition(NamedTuple):
+    groups: Tuple[Group, ...]
+    score: int
+
+    @property
+    def turns(self) -> int:
+        return len(self.groups)
+
+    @property
+    def bombs(self) -> int:
+        return sum(1 for group in self.groups if group.is_bomb)
+
+
+class _LRU:
+    """有界的 LRU；AI 决策与出牌提示在线程池中并发使用，另一个线程可能刚好淘汰了正在读取的键"""
+    __slots__ = ("data", "limit", "hits", "misses")
+
+    def __init__(self, limit: int):
+        self.data: "OrderedDict" = OrderedDict()
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            self.data.move_to_end(key)
+        except KeyError:
+            pass
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        if len(self.data) > self.limit:
+            try:
+                self.data.popitem(last=False)
+            except KeyError:
+                pass
+
+    def clear(self):
+        self.data.clear()
+        self.hits = self.misses = 0
+
+
+_memo = _LRU(CACHE_SIZE)
+_results = _LRU(RESULT_CACHE_SIZE)
+
+
+def _sequences_by_rank() -> Tuple[Tuple[Tuple[CardType, int, int, Tuple[int, ...]], ...], ...]:
+    table: List[List[Tuple[CardType, int, int, Tuple[int, ...]]]] = [[] for _ in range(RANK_COUNT)]
+    for card_type, width, sequences in ((CardType.STRAIGHT, 1, STRAIGHT_SEQUENCES),
+                                        (CardType.CONSECUTIVE_PAIRS, 2, PAIRS_SEQUENCES),
+                                        (CardType.CONSECUTIVE_TRIPLES, 3, TRIPLES_SEQUENCES)):
+        for start, ranks in enumerate(sequences):
+            for rank in ranks:
+                table[rank].append((card_type, width, start, ranks))
+    return tuple(tuple(entries) for entries in table)
+
+
+_SEQUENCES_BY_RANK = _sequences_by_rank()
+_SAME_RANK_TYPES = {1: CardType.SINGLE, 2: CardType.PAIR, 3: CardType.TRIPLE}
+
+
+_TYPES = tuple(CardType)
+_TYPE_INDEX = {card_type: index for index, card_type in enumerate(_TYPES)}
+
+_COST = {card_type: _TURN for card_type in CardType}
+_COST[CardType.SINGLE] = _TURN + _SINGLE_PENALTY
+_COST[CardType.BOMB] = _COST[CardType.JOKER_BOMB] = _TURN - _BOMB_BONUS
+
+
+def type_cost(card_type: CardType) -> int:
+    """一手该牌型的牌在拆分得分中所占的部分"""
+    return _COST[card_type]
+
+
+def _options(counts: Counts, wilds: int, rank: int) -> Iterable[Tuple[CardType, int, Counts, int]]:
+    """包含点数 rank 的所有组合：(牌型, 主点数或起点, 取走后的计数, 剩余逢人配张数)
+
+    组合用到的自然牌即取走前后计数之差，需要时再还原，搜索过程中不构造 Group。
+    """
+    have = counts[rank]
+
+    if rank >= SMALL_JOKER:
+        # 只剩王：单张、对子（两张同样的王）、四王
+        if rank == SMALL_JOKER and have == 2 and counts[BIG_JOKER] == 2:
+            rest = list(counts)
+            rest[SMALL_JOKER] = rest[BIG_JOKER] = 0
+            yield CardType.JOKER_BOMB, rank, tuple(rest), wilds
+        for size in (1, 2) if have == 2 else (1,):
+            rest = list(counts)
+            rest[rank] -= size
+            yield _SAME_RANK_TYPES[size], rank, tuple(rest), wilds
+        return
+
+    # 同点数：单张、对子、三张、炸弹，不足时用逢人配补
+    for size in range(1, min(have + wilds, MAX_BOMB_SIZE) + 1):
+        used = min(have, size)
+        fill = size - used
+        rest = list(counts)
+        rest[rank] -= used
+        yield _SAME_RANK_TYPES.get(size, CardType.BOMB), rank, tuple(rest), wilds - fill
+
+        # 三带二：本点数作三张或对子，另一个点数作对子或三张
+        if size != 2 and size != 3:
+            continue
+        other_size = 5 - size
+        for other in range(rank + 1, RANK_COUNT):
+            other_have = rest[other]
+            # 只带恰好够用（或差的由逢人配补）的点数，不为带牌拆开更大的组合
+            if not other_have or other_have > other_size:
+                continue
+            if other >= SMALL_JOKER and (other_size != 2 or other_have != 2):
+                continue
+            other_fill = other_size - other_have
+            if fill + other_fill > wilds:
+                continue
+            joined = list(rest)
+            joined[other] = 0
+            yield (CardType.TRIPLE_WITH_PAIR, rank if size == 3 else other, tuple(joined),
+                   wilds - fill - other_fill)
+
+    # 经过本点数的顺子、连对、钢板
+    for card_type, width, start, sequence in _SEQUENCES_BY_RANK[rank]:
+        need = 0
+        rest = list(counts)
+        for other in sequence:
+            have_other = counts[other]
+            if have_other < width:
+                need += width - have_other
+                rest[other] = 0
+            else:
+                rest[other] = have_other - width
+        if need <= wilds:
+            yield card_type, start, tuple(rest), wilds - need
+
+
+def _group(card_type: CardType, lead: int, counts: Counts, wilds: int, rest: Counts, rest_wilds: int) -> Group:
+    ranks: Tuple[int, ...] = ()
+    for rank in range(RANK_COUNT):
+        if counts[rank] != rest[rank]:
+            ranks += (rank,) * (counts[rank] - rest[rank])
+    return Group(card_type, lead, ranks, wilds - rest_wilds)
+
+
+def _key(counts: Counts, wilds: int) -> int:
+    """子问题的缓存键：计数向量每个点数一个字节，低 4 位为逢人配张数"""
+    return int.from_bytes(bytes(counts), "little") << 4 | wilds
+
+
+def _unkey(key: int) -> Tuple[Counts, int]:
+    return tuple((key >> 4).to_bytes(RANK_COUNT, "little")), key & 0xF
+
+
+_SCORE_MASK = 0xFFFF
+
+
+def _pack_group(card_type: CardType, lead: int, rest: Counts, rest_wilds: int) -> int:
+    return (_TYPE_INDEX[card_type] + 1 | (lead + 1) << 4 | _key(rest, rest_wilds) << 9) << 16
+
+
+def _solve(counts: Counts, wilds: int, deadline: Optional[float] = None) -> int:
+    """返回打包成一个整数的 (得分, 第一个组合, 剩余子问题)
+
+    低 16 位为得分，其后 4 位为牌型序号加一（0 表示没有组合），5 位为主点数加一，
+    再往上是剩余子问题的缓存键。缓存中只放整数，不受垃圾回收跟踪，
+    缓存很大时也不会拖慢垃圾回收。拆分中其余的组合沿剩余子问题逐个取出。
+    """
+    key = _key(counts, wilds)
+    cached = _memo.get(key)
+    if cached is not None:
+        return cached
+    if deadline is not None and time.perf_counter() > deadline:
+        raise DeadlineExceeded
+
+    rank = next((r for r in range(RANK_COUNT) if counts[r]), None)
+    if rank is None:
+        if not wilds:
+            result = 0
+        else:
+            # 剩下的逢人配作为级牌的单张或对子
+            card_type = _SAME_RANK_TYPES[wilds]
+            result = _COST[card_type] | _pack_group(card_type, WILD_LEAD, counts, 0)
+        _memo.put(key, result)
+        return result
+
+    best_score = None
+    best = None
+    for option in _options(counts, wilds, rank):
+        score = _COST[option[0]] + (_solve(option[2], option[3], deadline) & _SCORE_MASK)
+        if best_score is None or score < best_score:
+            best_score, best = score, option
+    result = best_score | _pack_group(*best)
+    _memo.put(key, result)
+    return result
+
+
+def rank_signature(hand: Hand, level: int) -> Tuple[Counts, int]:
+    """拆分用的规范签名：不含逢人配的点数计数向量，以及逢人配张数"""
+    counts = list(hand.rank_counts)
+    wilds = hand.counts[wild_face(level)]
+    counts[level_rank(level)] -= wilds
+    return tuple(counts), wilds
+
+
+def decompose_counts(counts: Counts, wilds: int, level: int, deadline: Optional[float] = None) -> Decomposition:
+    key = (counts, wilds, level)
+    result = _results.get(key)
+    if result is not None:
+        return result
+    score = _solve(counts, wilds, deadline) & _SCORE_MASK
+    groups: List[Group] = []
+    while True:
+        packed = _solve(counts, wilds) >> 16
+        if not packed:
+            break
+        rest, rest_wilds = _unkey(packed >> 9)
+        card_type = _TYPES[(packed & 0xF) - 1]
+        groups.append(_group(card_type, (packed >> 4 & 0x1F) - 1, counts, wilds, rest, rest_wilds))
+        counts, wilds = rest, rest_wilds
+    # 炸弹放在最后，其余按最小牌值从小到大
+    groups.sort(key=lambda group: (group.is_bomb, group.low_value(level)))
+    result = Decomposition(tuple(groups), score)
+    _results.put(key, result)
+    return result
+
+
+def decompose(hand: Hand, level: int, deadline: Optional[float] = None) -> Decomposition:
+    """手牌的最优拆分"""
+    counts, wilds = rank_signature(hand, level)
+    return decompose_counts(counts, wilds, level, deadline)
+
+
+def turns_after(hand: Hand, level: int, cards: Sequence[Card], deadline: Optional[float] = None) -> Decomposition:
+    """打出 cards 之后剩余手牌的最优拆分"""
+    counts, wilds = rank_signature(hand, level)
+    rest = list(counts)
+    wild = wild_face(level)
+    for card in cards:
+        if CARD_FACE[card.id] == wild:
+            wilds -= 1
+        else:
+            rest[CARD_RANK[card.id]] -= 1
+    return decompose_counts(tuple(rest), wilds, level, deadline)
+
+
+def group_cards(hand: Hand, level: int, groups: Sequence[Group]) -> List[List[Card]]:
+    """为每个组合从手牌中选出具体的牌，各组合之间不重复"""
+    remaining = list(hand.counts)
+    wild = wild_face(level)
+    result: List[List[Card]] = []
+    for group in groups:
+        cards: List[Card] = []
+        for rank in group.ranks:
+            for face in RANK_FACES[rank]:
+                if face != wild and remaining[face]:
+                    remaining[face] -= 1
+                    copy = hand.counts[face] - remaining[face] - 1
+                    cards.append(CARDS[copy * FACE_COUNT + face])
+                    break
+        for _ in range(group.wilds):
+            remaining[wild] -= 1
+            copy = hand.counts[wild] - remaining[wild] - 1
+            cards.append(CARDS[copy * FACE_COUNT + wild])
+        result.append(cards)
+    return result
+
+
+def plan_moves(hand: Hand, level: int) -> List[Tuple[Group, List[Card], Combo]]:
+    """按出牌顺序列出拆分出的组合、对应的牌和牌型解释"""
+    groups = decompose(hand, level).groups
+    result = []
+    for group, cards in zip(groups, group_cards(hand, level, groups)):
+        combos = interpretations(cards, level)
+        combo = next((c for c in combos if c.type == group.type), combos[0] if combos else group.combo(level))
+        result.append((group, cards, combo))
+    return result
+
+
+def cache_info() -> Dict[str, int]:
+    return {
+        "subproblems": len(_memo.data),
+        "hits": _memo.hits,
+        "misses": _memo.misses,
+        "results": len(_results.data),
+    }
+
+
+def clear_cache():
+    _memo.clear()
+    _results.clear()
@@ -1,289 +1,248 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional, Sequence
 import random
-from enum import Enum
-
-class CardSuit(Enum):
-    SPADES = "♠"
-    HEARTS = "♥"
-    DIAMONDS = "♦"
-    CLUBS = "♣"
-    JOKER = "🃏"
-
-class CardRank(Enum):
-    TWO = "2"
-    THREE = "3"
-    FOUR = "4"
-    FIVE = "5"
-    SIX = "6"
-    SEVEN = "7"
-    EIGHT = "8"
-    NINE = "9"
-    TEN = "10"
-    JACK = "J"
-    QUEEN = "Q"
-    KING = "K"
-    ACE = "A"
-    JOKER_SMALL = "小王"
-    JOKER_BIG = "大王"
-
-class Card:
-    def __init__(self, suit: CardSuit, rank: CardRank):
-        self.suit = suit
-        self.rank = rank
-
-    def __str__(self):
-        if self.suit == CardSuit.JOKER:
-            return self.rank.value
-        return f"{self.suit.value}{self.rank.value}"
-
-class CardType(Enum):
-    SINGLE = "单张"
-    PAIR = "对子"
-    TRIPLE = "三张"
-    TRIPLE_WITH_PAIR = "三带二"
-    STRAIGHT = "顺子"
-    CONSECUTIVE_PAIRS = "连对"
-    CONSECUTIVE_TRIPLES = "三连三"
-    BOMB = "炸弹"
-    STRAIGHT_FLUSH = "同花顺"
+from .cards import (
+    Card, CardSuit, CardRank, Hand, CARD_VALUES, DECK_SIZE, MAX_LEVEL, card_from_id,
+)
+from .combos import CardType, Combo, classify, find_beating, interpretations
+from .moves import Move, iter_moves, list_moves
+
+
+def team_of(player_index: int) -> int:
+    """玩家所属队伍：队友坐对角，座位 0、2 为一队，1、3 为一队"""
+    return player_index % 2
+
+
+def partner_of(player_index: int) -> int:
+    return (player_index + 2) % 4
+
+
+def upgrade_levels(positions: List[int]) -> int:
+    """按名次（头游在前）计算获胜队伍升的级数"""
+    winner = team_of(positions[0])
+    # 头游和二游在同一队
+    if team_of(positions[1]) == winner:
+        return 3
+    # 头游和三游在同一队
+    if team_of(positions[2]) == winner:
+        return 1
+    # 头游和末游在同一队
+    return 0
 
 class GameState:
     def __init__(self):
-        self.deck = []
-        self.players_hands = [[], [], [], []]  # 4个玩家的手牌
+        self.deck: List[int] = []  # 牌堆，存放 card id
+        self.players_hands = [Hand() for _ in range(4)]  # 4个玩家的手牌
         self.current_level = 2  # 当前等级
         self.current_player = 0  # 当前玩家索引
         self.last_played_cards = None  # 上一次出的牌
         self.last_played_type = None  # 上一次出的牌型
+        self.last_played_combo: Optional[Combo] = None  # 上一次出牌的牌型解释
         self.last_played_player = None  # 上一个出牌的玩家
+        self.pass_count = 0  # 本轮上一次出牌后连续过牌的人数
+        self.finish_order: List[int] = []  # 出完牌的玩家，按名次排列
         self.game_started = False
         self.initialize_deck()
 
+    def clone(self) -> "GameState":
+        """复制一份可独立修改的局面（手牌与出牌记录各自独立）"""
+        other = GameState.__new__(GameState)
+        other.__dict__.update(self.__dict__)
+        other.deck = list(self.deck)
+        other.players_hands = [hand.copy() for hand in self.players_hands]
+        other.finish_order = list(self.finish_order)
+        return other
+
+    def to_dict(self) -> Dict:
+        """序列化为只含基本类型的字典，用于保存到状态存储"""
+        combo = self.last_played_combo
+        return {
+            "deck": list(self.deck),
+            "hands": [hand.ids() for hand in self.players_hands],
+            "level": self.current_level,
+            "current": self.current_player,
+            "lastCards": [card.id for card in self.last_played_cards] if self.last_played_cards else None,
+            "lastCombo": [combo.type.value, combo.key] if combo else None,
+            "lastPlayer": self.last_played_player,
+            "passCount": self.pass_count,
+            "finishOrder": list(self.finish_order),
+            "started": self.game_started,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "GameState":
+        state = cls()
+        state.deck = list(data["deck"])
+        state.players_hands = [Hand(card_from_id(i) for i in ids) for ids in data["hands"]]
+        state.current_level = data["level"]
+        state.current_player = data["current"]
+        if data["lastCards"]:
+            state.last_played_cards = [card_from_id(i) for i in data["lastCards"]]
+        if data["lastCombo"]:
+            state.last_played_combo = Combo(CardType(data["lastCombo"][0]), data["lastCombo"][1])
+            state.last_played_type = state.last_played_combo.type
+        state.last_played_player = data["lastPlayer"]
+        state.pass_count = data["passCount"]
+        state.finish_order = list(data["finishOrder"])
+        state.game_started = data["started"]
+        return state
+
     def initialize_deck(self):
-        """初始化两副牌"""
-        self.deck = []
-        # 添加两副普通牌
-        for _ in range(2):
-            for suit in [CardSuit.SPADES, CardSuit.HEARTS, CardSuit.DIAMONDS, CardSuit.CLUBS]:
-                for rank in [CardRank.TWO, CardRank.THREE, CardRank.FOUR, CardRank.FIVE,
-                           CardRank.SIX, CardRank.SEVEN, CardRank.EIGHT, CardRank.NINE,
-                           CardRank.TEN, CardRank.JACK, CardRank.QUEEN, CardRank.KING,
-                           CardRank.ACE]:
-                    self.deck.append(Card(suit, rank))
-            # 添加大小王
-            self.deck.append(Card(CardSuit.JOKER, CardRank.JOKER_SMALL))
-            self.deck.append(Card(CardSuit.JOKER, CardRank.JOKER_BIG))
-
-    def shuffle(self):
-        """洗牌"""
-        random.shuffle(self.deck)
-
-    def deal_cards(self):
+        """初始化两副牌（含大小王共108张，以 card id 表示）"""
+        self.deck = list(range(DECK_SIZE))
+
+    def shuffle(self, rng: Optional[random.Random] = None):
+        """洗牌，可传入独立的随机数生成器以便复现"""
+        (rng or random).shuffle(self.deck)
+
+    def deal_cards(self, rng: Optional[random.Random] = None):
         """发牌"""
-        self.shuffle()
-        for i in range(27):  # 每人27张牌
-            for player in range(4):
-                self.players_hands[player].append(self.deck.pop())
+        self.shuffle(rng)
+        # 与从牌堆末尾逐张轮流发牌的结果相同：每人 27 张
+        for player, hand in enumerate(self.players_hands):
+            for card_id in self.deck[len(self.deck) - 1 - player::-4]:
+                hand.add_id(card_id)
+        self.deck = []
+
+    def reset_round(self, hands: Sequence[Hand], level: int, first: int = 0):
+        """在原对象上开始新的一局：把发好的手牌复制进原来的 Hand，清空桌面和名次，沿用原来的列表"""
+        self.deck.clear()
+        for hand, dealt in zip(self.players_hands, hands):
+            hand.assign(dealt)
+        self.current_level = level
+        self.current_player = first
+        self.clear_table()
+        self.finish_order.clear()
+        self.game_started = False
 
     def get_card_type(self, cards: List[Card]) -> Optional[CardType]:
         """判断牌型"""
-        if not cards:
-            return None
-
-        # 单张
-        if len(cards) == 1:
-            return CardType.SINGLE
-
-        # 对子
-        if len(cards) == 2 and cards[0].rank == cards[1].rank:
-            return CardType.PAIR
-
-        # 三张
-        if len(cards) == 3 and all(c.rank == cards[0].rank for c in cards):
-            return CardType.TRIPLE
-
-        # 三带二
-        if len(cards) == 5:
-            ranks = [c.rank for c in cards]
-            if ranks.count(ranks[0]) == 3 and ranks.count(ranks[3]) == 2:
-                return CardType.TRIPLE_WITH_PAIR
-
-        # 顺子
-        if len(cards) >= 5:
-            ranks = sorted([c.rank.value for c in cards])
-            if all(int(ranks[i+1]) - int(ranks[i]) == 1 for i in range(len(ranks)-1)):
-                return CardType.STRAIGHT
-
-        # 连对
-        if len(cards) >= 6:
-            pairs = []
-            for i in range(0, len(cards), 2):
-                if i+1 < len(cards) and cards[i].rank == cards[i+1].rank:
-                    pairs.append(cards[i].rank)
-            if len(pairs) >= 3 and all(pairs[i+1].value - pairs[i].value == 1 for i in range(len(pairs)-1)):
-                return CardType.CONSECUTIVE_PAIRS
-
-        # 炸弹
-        if len(cards) >= 4 and all(c.rank == cards[0].rank for c in cards):
-            return CardType.BOMB
-
-        # 同花顺
-        if len(cards) >= 5:
-            if all(c.suit == cards[0].suit for c in cards):
-                ranks = sorted([c.rank.value for c in cards])
-                if all(int(ranks[i+1]) - int(ranks[i]) == 1 for i in range(len(ranks)-1)):
-                    return CardType.STRAIGHT_FLUSH
-
-        return None
+        combo = classify(cards, self.current_level)
+        return combo.type if combo else None
 
     def get_card_value(self, card: Card) -> int:
-        """获取牌的大小值"""
-        if card.rank == CardRank.JOKER_BIG:
-            return 16
-        elif card.rank == CardRank.JOKER_SMALL:
-            return 15
-        elif card.rank == CardRank.ACE:
-            return 14
-        elif card.rank == CardRank.KING:
-            return 13
-        elif card.rank == CardRank.QUEEN:
-            return 12
-        elif card.rank == CardRank.JACK:
-            return 11
-        elif card.rank.value == str(self.current_level):
-            return 10
-        else:
-            return int(card.rank.value)
+        """获取牌的大小值：2..A 为 2..14，级牌 15，小王 16，大王 17"""
+        return CARD_VALUES[self.current_level][card.id]
 
     def compare_cards(self, cards1: List[Card], cards2: List[Card]) -> bool:
         """比较两组牌的大小，返回cards1是否大于cards2"""
-        type1 = self.get_card_type(cards1)
-        type2 = self.get_card_type(cards2)
-
-        # 炸弹可以打任何牌
-        if type1 == CardType.BOMB and type2 != CardType.BOMB:
-            return True
-        if type1 != CardType.BOMB and type2 == CardType.BOMB:
+        combo2 = classify(cards2, self.current_level)
+        if combo2 is None:
             return False
-        if type1 == CardType.BOMB and type2 == CardType.BOMB:
-            return len(cards1) > len(cards2)
+        return find_beating(interpretations(cards1, self.current_level), combo2) is not None
 
-        # 同花顺大于普通顺子
-        if type1 == CardType.STRAIGHT_FLUSH and type2 == CardType.STRAIGHT:
-            return True
-        if type1 == CardType.STRAIGHT and type2 == CardType.STRAIGHT_FLUSH:
-            return False
+    def is_leading(self, player_index: int) -> bool:
+        """该玩家是否可以自由出牌（第一手牌，或其他人都已过牌）"""
+        return not self.last_played_cards or self.last_played_player == player_index
 
-        # 其他牌型必须相同才能比较
-        if type1 != type2:
-            return False
+    def table_combo(self, player_index: int) -> Optional[Combo]:
+        """该玩家需要压过的牌型，自由出牌时为 None"""
+        if self.is_leading(player_index):
+            return None
+        return self.last_played_combo
+
+    def match_play(self, cards: List[Card], player_index: Optional[int] = None) -> Optional[Combo]:
+        """返回这手牌在当前局面下可用的牌型解释，不能出时返回 None"""
+        combos = interpretations(cards, self.current_level)
+        if not combos:
+            return None
+        table = self.table_combo(self.current_player if player_index is None else player_index)
+        if table is None:  # 第一手牌
+            return combos[0]
+        return find_beating(combos, table)
+
+    def iter_legal_moves(self, player_index: int) -> Iterator[Move]:
+        """逐个产出该玩家当前所有合法的出牌（不含过牌）"""
+        return iter_moves(self.players_hands[player_index], self.current_level,
+                          self.table_combo(player_index))
 
-        # 获取牌型的主牌值
-        def get_main_value(cards: List[Card], card_type: CardType) -> int:
-            if card_type == CardType.SINGLE:
-                return self.get_card_value(cards[0])
-            elif card_type == CardType.PAIR:
-                return self.get_card_value(cards[0])
-            elif card_type == CardType.TRIPLE:
-                return self.get_card_value(cards[0])
-            elif card_type == CardType.TRIPLE_WITH_PAIR:
-                return self.get_card_value(cards[0])
-            elif card_type == CardType.STRAIGHT:
-                return max(self.get_card_value(c) for c in cards)
-            elif card_type == CardType.CONSECUTIVE_PAIRS:
-                return max(self.get_card_value(c) for c in cards)
-            elif card_type == CardType.CONSECUTIVE_TRIPLES:
-                return max(self.get_card_value(c) for c in cards)
-            elif card_type == CardType.STRAIGHT_FLUSH:
-                return max(self.get_card_value(c) for c in cards)
-            return 0
-
-        return get_main_value(cards1, type1) > get_main_value(cards2, type2)
+    def legal_moves(self, player_index: int) -> List[Move]:
+        """该玩家当前所有合法的出牌（不含过牌）"""
+        return list_moves(self.players_hands[player_index], self.current_level,
+                          self.table_combo(player_index))
 
     def can_play_cards(self, cards: List[Card], player_index: int) -> bool:
         """判断是否可以出牌"""
-        if not self.last_played_cards:  # 第一手牌
-            return True
+        return self.match_play(cards, player_index) is not None
 
-        card_type = self.get_card_type(cards)
-        if not card_type:
-            return False
+    def next_active_player(self, player_index: int) -> int:
+        """player_index 之后下一个还有手牌的玩家"""
+        for step in range(1, 5):
+            index = (player_index + step) % 4
+            if self.players_hands[index]:
+                return index
+        return player_index
 
-        if card_type == CardType.BOMB:
-            if self.last_played_type == CardType.BOMB:
-                return len(cards) > len(self.last_played_cards)
-            return True
-
-        if card_type != self.last_played_type:
+    def play_cards(self, cards: List[Card], player_index: int) -> bool:
+        """出牌"""
+        if player_index != self.current_player:
             return False
 
-        return self.compare_cards(cards, self.last_played_cards)
+        combo = self.match_play(cards, player_index)
+        if combo is None:
+            return False
 
-    def play_cards(self, cards: List[Card], player_index: int) -> bool:
-        """出牌"""
-        if not self.can_play_cards(cards, player_index):
+        hand = self.players_hands[player_index]
+        if not hand.contains_all(cards):
             return False
 
         # 从玩家手牌中移除打出的牌
         for card in cards:
-            self.players_hands[player_index].remove(card)
+            hand.remove(card)
+        if not hand:
+            self.finish_order.append(player_index)
 
         self.last_played_cards = cards
-        self.last_played_type = self.get_card_type(cards)
+        self.last_played_type = combo.type
+        self.last_played_combo = combo
         self.last_played_player = player_index
-        self.current_player = (player_index + 1) % 4
+        self.pass_count = 0
+        self.current_player = self.next_active_player(player_index)
 
         return True
 
     def pass_turn(self, player_index: int) -> bool:
         """过牌"""
-        if not self.last_played_cards:
+        if player_index != self.current_player or self.is_leading(player_index):
             return False
 
-        self.current_player = (player_index + 1) % 4
+        self.pass_count += 1
+        leader = self.last_played_player
+        others = sum(1 for i in range(4) if i != leader and self.players_hands[i])
+        if self.pass_count < others:
+            self.current_player = self.next_active_player(player_index)
+            return True
+
+        # 其他人都过牌，本轮结束；出牌者已出完时由队友接风
+        if not self.players_hands[leader]:
+            partner = partner_of(leader)
+            leader = partner if self.players_hands[partner] else self.next_active_player(leader)
+        self.clear_table()
+        self.current_player = leader
         return True
 
-    def update_level(self, winner_team: int, positions: List[int]):
-        """更新游戏等级"""
-        # positions: 玩家名次列表 [0,1,2,3]
-        # winner_team: 获胜队伍索引 0或1
-        
-        # 计算升级数
-        upgrade_levels = 0
-        
-        # 头游和二游在同一队
-        if positions[0] // 2 == positions[1] // 2:
-            upgrade_levels = 3
-        # 头游和三游在同一队
-        elif positions[0] // 2 == positions[2] // 2:
-            upgrade_levels = 1
-        # 头游和末游在同一队
-        elif positions[0] // 2 == positions[3] // 2:
-            upgrade_levels = 0
-        # 末游在对手队
-        elif positions[3] // 2 != winner_team:
-            upgrade_levels = 1
-        
-        # 更新等级
-        if upgrade_levels > 0:
-            new_level = self.current_level + upgrade_levels
-            if new_level > 14:  # A级是最高级
-                new_level = 14
-            self.current_level = new_level
+    def clear_table(self):
+        """清空桌面上的牌，开始新的一轮"""
+        self.last_played_cards = None
+        self.last_played_type = None
+        self.last_played_combo = None
+        self.last_played_player = None
+        self.pass_count = 0
 
     def check_game_end(self) -> Optional[Dict]:
-        """检查游戏是否结束，返回游戏结果"""
-        positions = []
-        for i in range(4):
-            if not self.players_hands[i]:
-                positions.append(i)
-        
-        if len(positions) == 4:  # 所有玩家都出完牌
-            winner_team = positions[0] // 2
-            self.update_level(winner_team, positions)
-            return {
-                "winner_team": winner_team,
-                "positions": positions,
-                "new_level": self.current_level
-            }
-        return None 
\ No newline at end of file
+        """检查游戏是否结束，返回游戏结果
+
+        new_level 为本局级别加上升的级数；current_level 保持本局的级别不变，
+        两队各自的级别由 series.Series 维护。
+        """
+        remaining = [i for i in range(4) if self.players_hands[i]]
+        if len(remaining) > 1:
+            return None
+
+        # 只剩一名玩家有牌时本局结束，名次为出完牌的先后顺序
+        positions = self.finish_order + remaining
+        winner_team = team_of(positions[0])
+        return {
+            "winner_team": winner_team,
+            "positions": positions,
+            "new_level": min(self.current_level + upgrade_levels(positions), MAX_LEVEL)
+        }
@@ -0,0 +1,102 @@
+"""出牌提示
+
+列出当前局面下该玩家所有合法出牌（moves.iter_moves），按打出后剩余手牌的拆分
+（decompose.turns_after）排序：这一手加上剩余手牌的拆分，得分越好越靠前
+（手数越少越好，其次保留更多炸弹、更少单张），同样好时小的牌在前，炸弹排在普通牌型之后。
+
+同样点数、同样牌型、只是花色不同的出牌剩余手牌的拆分相同，只保留一种。
+手牌最优拆分中的组合不需要再搜索：打出后剩余部分的最优拆分就是拆分中其余的组合。
+其余出牌按枚举顺序（同牌型内从小到大）逐个评估。时间预算从进入函数时开始计算，
+枚举合法出牌、拆分手牌和逐个评估时都会检查，超过后停止：已评估的出牌照常排序返回，
+一个都没有评估完时按枚举顺序返回（turnsLeft 为 None），并标记结果不完整。
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cards import CARD_FACE, CARD_RANK, wild_face
+from .decompose import DeadlineExceeded, decompose, group_cards, turns_after, type_cost
+from .game import GameState
+from .moves import Move
+from .wire import CardList
+
+HINT_LIMIT = int(os.environ.get("HINT_LIMIT", "5"))
+HINT_TIME_BUDGET = float(os.environ.get("HINT_TIME_BUDGET", "0.05"))
+
+
+def _signature(move: Move, wild: int) -> Tuple:
+    ranks = sorted(-1 if CARD_FACE[card.id] == wild else CARD_RANK[card.id] for card in move.cards)
+    return move.combo, tuple(ranks)
+
+
+def suggest(state: GameState, player_index: int, limit: int = HINT_LIMIT,
+            budget: float = HINT_TIME_BUDGET) -> Dict[str, Any]:
+    """
+    返回 {"hints": [...], "canPass": bool, "complete": bool}，
+    每条提示为 {"cards": CardList, "type": 牌型, "bomb": 是否炸弹, "turnsLeft": 打出后还需的手数（未评估时为 None）}
+    """
+    deadline = time.perf_counter() + budget
+    hand = state.players_hands[player_index]
+    leading = state.is_leading(player_index)
+    if not hand:
+        return {"hints": [], "canPass": False, "complete": True}
+
+    level = state.current_level
+    wild = wild_face(level)
+    complete = True
+    legal: List[Move] = []
+    playable = set()
+    for move in state.iter_legal_moves(player_index):
+        legal.append(move)
+        playable.add(_signature(move, wild))
+        if time.perf_counter() > deadline:
+            complete = False
+            break
+
+    ranked: List[Tuple[Tuple[bool, int, int], Move, Optional[int]]] = []
+    seen = set()
+    # 拆分中能出的组合
+    try:
+        plan = decompose(hand, level, deadline) if complete else None
+    except DeadlineExceeded:
+        plan = None
+        complete = False
+    if plan is not None:
+        for group, cards in zip(plan.groups, group_cards(hand, level, plan.groups)):
+            move = Move(tuple(cards), group.combo(level))
+            key = _signature(move, wild)
+            if key in playable and key not in seen:
+                seen.add(key)
+                ranked.append(((group.is_bomb, plan.score, len(ranked)), move, plan.turns - 1))
+
+    # 其余出牌逐个评估，超过时间预算后停止
+    for order, move in enumerate(legal, len(ranked)):
+        key = _signature(move, wild)
+        if key in seen:
+            continue
+        if not complete or time.perf_counter() > deadline:
+            complete = False
+            break
+        try:
+            rest = turns_after(hand, level, move.cards, deadline)
+        except DeadlineExceeded:
+            complete = False
+            break
+        seen.add(key)
+        ranked.append(((move.combo.is_bomb, type_cost(move.combo.type) + rest.score, order), move, rest.turns))
+    if not ranked:
+        # 一手都没有评估完：按枚举顺序（同牌型内从小到大）给出
+        for order, move in enumerate(legal):
+            key = _signature(move, wild)
+            if key not in seen:
+                seen.add(key)
+                ranked.append(((move.combo.is_bomb, 0, order), move, None))
+    ranked.sort(key=lambda item: item[0])
+
+    hints = [{
+        "cards": CardList(move.cards),
+        "type": move.combo.type.value,
+        "bomb": move.combo.is_bomb,
+        "turnsLeft": turns,
+    } for _, move, turns in ranked[:limit]]
+    return {"hints": hints, "canPass": not leading, "complete": complete}
@@ -1,15 +1,40 @@
+import logging
 import os
 import uuid
-from typing import Optional, List, Dict, Any
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
+from typing import Optional, List, Dict, Any, Tuple, Union
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from .game import GameState, Card, CardType, CardSuit, CardRank
+from fastapi.responses import PlainTextResponse, Response
+from .game import GameState, Card, CardType
 from .ai_player import AIPlayer
+from .search_ai import SearchAIPlayer, shutdown_pool, warm_pool
+from .scheduler import RoomScheduler
+from .cluster import Cluster, RemoteConnection, RemoteError, open_cluster
+from .connections import DROP, ClientConnection, MessageError, get_connection
+from .persistence import open_recorder
+from .metrics import (
+    AI_DECISION_SECONDS, BROADCAST_BYTES, REGISTRY, SLOW_ROOMS, STAGE_SECONDS, CallbackCounter, Gauge, LoopLagMonitor,
+    SamplingProfiler, hand_group, stage,
+)
+from .reaper import RoomReaper, mark_active, mark_finished
+from .dealing import DealPool, new_state, room_deal
+from .protocol import (
+    DELTA, EventBuffer, cached, cached_value, encode_hint, encoded_hint, encoded_snapshot, encoded_snapshot_message, event_buffer,
+    negotiate, pass_event, play_event, public_state, round_end_event, touch, tribute_event, tribute_return_event,
+)
+from .series import Series, return_card
+from .hints import suggest
+from .spectators import SpectatorHub
+from .wire import JSON, decode_cards, encode
+from .wire import negotiate as negotiate_format
 import asyncio
 import secrets
+import time
 import json
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 # 创建 FastAPI 应用
 app = FastAPI(title="掼蛋游戏 API")
 
@@ -25,12 +50,45 @@ app.add_middleware(
 # 存储所有活跃的游戏房间
 active_games = {}
 
-# 存储所有连接的客户端
-connected_clients = {}
+# 存储所有连接的客户端（player_id -> ClientConnection）
+connected_clients: Dict[str, ClientConnection] = {}
 
 # 邀请链接管理
 invite_links = {}
 
+# 多 worker 部署时的房间归属与跨 worker 转发，未配置 STATE_STORE 时为 None（单进程）
+cluster = open_cluster(os.environ.get("STATE_STORE"), active_games)
+
+# 对局记录（每步出牌与每局结果），未配置 MONGODB_URI 或 GAME_LOG_DIR 时为 None
+recorder = open_recorder(os.environ.get("MONGODB_URI"), os.environ.get("GAME_LOG_DIR"))
+
+# AI 配置："basic" 为规则 AI，"search" 为蒙特卡洛搜索 AI
+AI_THINK_DELAY = float(os.environ.get("AI_THINK_DELAY", "1.0"))  # AI 每步的展示延迟（秒），仅用于节奏
+AI_TIME_BUDGET = float(os.environ.get("AI_TIME_BUDGET", "0.5"))
+AI_WORKERS = int(os.environ.get("AI_WORKERS", str(os.cpu_count() or 1)))
+GAME_MODES = ("single", "multiplayer")
+AI_MODES = ("basic", "search")
+
+def create_ai_player(room: Dict, game_state: GameState, player_index: int):
+    """根据房间的 AI 模式创建 AI 玩家"""
+    if room.get("ai_mode") == "search":
+        return SearchAIPlayer(game_state, player_index,
+                              time_budget=AI_TIME_BUDGET, workers=AI_WORKERS)
+    return AIPlayer(game_state, player_index)
+
+# 每个房间的 AI 回合在后台任务中执行
+ai_scheduler = RoomScheduler(max_workers=int(os.environ.get("AI_DECISION_THREADS", "4")))
+
+def is_ai_player(room: Dict, player_index: int) -> bool:
+    return room["players"][player_index]["id"].startswith("ai_")
+
+def schedule_ai_turns(room: Dict, room_id: str):
+    """如果轮到 AI 行动，安排后台任务处理 AI 回合"""
+    game_state = room["game_state"]
+    # 还贡完成之前不能出牌
+    if room["mode"] == "single" and not room["series"].pending and is_ai_player(room, game_state.current_player):
+        ai_scheduler.schedule(room_id, lambda: handle_ai_turns(room, room_id))
+
 def generate_invite_link(room_id: str) -> str:
     """生成邀请链接"""
     token = secrets.token_urlsafe(16)
@@ -53,27 +111,191 @@ def validate_invite_link(token: str) -> dict:
     
     return link_data
 
+def room_is_connected(room: Dict) -> bool:
+    return any(get_connection(connected_clients, player["id"]) is not None for player in room["players"])
+
+async def remove_room(room_id: str):
+    """删除房间：取消 AI 回合，关闭残留的连接，释放房间归属"""
+    room = active_games.pop(room_id, None)
+    if room is None:
+        return
+    ai_scheduler.cancel(room_id)
+    SLOW_ROOMS.discard(room_id)
+    await spectators.close_room(room_id)
+    for player in room["players"]:
+        connection = connected_clients.pop(player["id"], None)
+        if connection is not None:
+            await connection.close()
+    if cluster is not None:
+        await cluster.release(room_id)
+
+# 定期回收无人连接的空闲房间与过期的邀请链接
+reaper = RoomReaper(active_games, invite_links, room_is_connected, remove_room)
+
+# 预先生成的发牌，开始一局时直接取用
+deal_pool = DealPool()
+
+# 观战者按房间订阅公开事件
+spectators = SpectatorHub(cluster)
+
+# 事件循环延迟与运行时开启的采样分析器（ENABLE_PROFILER=1 时可用）
+loop_lag = LoopLagMonitor()
+ENABLE_PROFILER = os.environ.get("ENABLE_PROFILER") == "1"
+profiler: Optional[SamplingProfiler] = None
+
+def register_gauges():
+    REGISTRY.register(Gauge("guandan_rooms", "Rooms held by this worker", lambda: len(active_games)))
+    REGISTRY.register(Gauge("guandan_connections", "Connected clients on this worker",
+                            lambda: len(connected_clients)))
+    REGISTRY.register(Gauge("guandan_send_queue_messages", "Messages waiting in client send queues",
+                            lambda: sum(c.queue.qsize() for c in connected_clients.values()
+                                        if isinstance(c, ClientConnection))))
+    REGISTRY.register(Gauge("guandan_room_bytes_retained", "Estimated bytes held by rooms at the last reaper sweep",
+                            lambda: reaper.bytes_retained))
+    REGISTRY.register(Gauge("guandan_spectators", "Spectator connections on this worker",
+                            spectators.audience))
+    REGISTRY.register(Gauge("guandan_deal_pool_deals", "Pre-generated deals waiting in the pool",
+                            lambda: len(deal_pool)))
+    REGISTRY.register(CallbackCounter("guandan_resumes_total", "Reconnects by how the client was brought up to date",
+                                      lambda: {(result,): n for result, n in resumes.items()}, ("result",)))
+    REGISTRY.register(CallbackCounter("guandan_rooms_reaped_total", "Rooms removed by the reaper",
+                                      lambda: {(reason,): n for reason, n in reaper.rooms_reaped.items()},
+                                      ("reason",)))
+    if recorder is not None:
+        REGISTRY.register(CallbackCounter("guandan_game_log_records_total", "Game log records by outcome",
+                                          lambda: {("written",): recorder.written, ("failed",): recorder.failed,
+                                                   ("dropped",): recorder.dropped},
+                                          ("outcome",)))
+
+register_gauges()
+
+@app.on_event("startup")
+async def start_background_work():
+    if recorder is not None:
+        recorder.start()
+    if cluster is not None:
+        await cluster.start()
+    reaper.start()
+    loop_lag.start()
+    deal_pool.fill()
+    deal_pool.start()
+    # 预先启动搜索 AI 的子进程，第一次决策不必等待进程启动
+    asyncio.get_running_loop().run_in_executor(None, warm_pool, AI_WORKERS)
+
+@app.on_event("shutdown")
+async def shutdown_background_work():
+    reaper.stop()
+    loop_lag.stop()
+    deal_pool.stop()
+    await ai_scheduler.shutdown()
+    shutdown_pool()
+    if cluster is not None:
+        await cluster.stop()
+    if recorder is not None:
+        await recorder.stop()
+
+def room_changed(room_id: str):
+    """房间状态变化后调用：记录活动时间，多 worker 部署时稍后保存到状态存储"""
+    room = active_games.get(room_id)
+    if room is not None:
+        mark_active(room)
+    if cluster is not None:
+        cluster.mark_dirty(room_id)
+
+async def locate_room(room_id: str) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    查找房间：在本 worker 上时返回 (room, None)，归属其他 worker 时返回 (None, owner)，
+    不存在时返回 (None, None)。归属 worker 已失去心跳时从状态存储中接管房间。
+    """
+    room = active_games.get(room_id)
+    if room is not None or cluster is None:
+        return room, None
+    owner = await cluster.owner_of(room_id)
+    if owner is None:
+        room = await cluster.adopt(room_id)
+        if room is not None:
+            active_games[room_id] = room
+            schedule_ai_turns(room, room_id)
+        return room, None
+    if owner == cluster.worker_id:
+        return None, None
+    return None, owner
+
+async def call_owner(owner: str, op: str, **payload) -> Any:
+    """在房间归属的 worker 上执行请求"""
+    try:
+        return await cluster.call(owner, op, **payload)
+    except RemoteError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+
+def record_move_time(room_id: str, seconds: float):
+    """从收到玩家消息到广播完成的耗时"""
+    STAGE_SECONDS.labels("move").observe(seconds)
+    SLOW_ROOMS.record(room_id, seconds)
+
+def find_player(room: Dict, player_id: str) -> Optional[int]:
+    return next((i for i, p in enumerate(room["players"]) if p["id"] == player_id), None)
+
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to Guandan Game API"}
 
+@app.get("/stats")
+async def get_stats():
+    """房间回收的统计：存活房间数、估计占用的字节数、已回收的房间与邀请链接数"""
+    return reaper.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的性能指标"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profile")
+async def profile(seconds: float = Query(10.0, gt=0, le=120), interval: float = Query(0.005, gt=0)):
+    """采样事件循环线程若干秒，返回折叠栈格式的结果（需要 ENABLE_PROFILER=1）"""
+    global profiler
+    if not ENABLE_PROFILER:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if profiler is not None:
+        raise HTTPException(status_code=409, detail="分析器正在运行")
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        result = profiler.stop()
+        profiler = None
+    return PlainTextResponse(result)
+
 @app.get("/game/create")
-async def create_game(player_name: str, mode: str = "single"):
+async def create_game(player_name: str, mode: str = "single", ai_mode: str = "basic",
+                      seed: Optional[int] = Query(None, ge=0),
+                      spectator_delay: Optional[float] = Query(None, ge=0, le=600)):
     """
-    创建一个新的游戏房间
+    创建一个新的游戏房间，指定 seed 时每一局的发牌都可以复现，
+    spectator_delay 为观战画面相对牌局的延迟（秒），不指定时使用 SPECTATOR_DELAY
     """
+    if mode not in GAME_MODES:
+        raise HTTPException(status_code=400, detail=f"未知的游戏模式：{mode}")
+    if ai_mode not in AI_MODES:
+        raise HTTPException(status_code=400, detail=f"未知的 AI 模式：{ai_mode}")
     room_id = str(uuid.uuid4())[:8]
-    
-    # 创建游戏实例
-    game_state = GameState()
-    game_state.deal_cards()
-    
-    # 存储游戏实例
-    active_games[room_id] = {
-        "game_state": game_state,
+    room = {
         "players": [{"id": str(uuid.uuid4())[:8], "name": player_name}],
-        "mode": mode
+        "mode": mode,
+        "ai_mode": ai_mode
     }
+    if seed is not None:
+        room["seed"] = seed
+    if spectator_delay is not None:
+        room["spectator_delay"] = spectator_delay
+    
+    # 发牌并存储游戏实例；联机模式也在创建时发好牌，人满后直接开始。
+    # 之后每一局都在这个 GameState 上重新开始，级别与进贡由 Series 在局与局之间保存
+    room["series"] = Series()
+    room["game_state"] = new_state(room_deal(room, deal_pool))
+    room["events"] = EventBuffer(floor=0)
+    active_games[room_id] = room
     
     player_id = active_games[room_id]["players"][0]["id"]
     
@@ -85,22 +307,18 @@ async def create_game(player_name: str, mode: str = "single"):
                 "name": f"AI 玩家 {i}"
             })
     
+    # 多 worker 部署时，创建房间的 worker 成为房间的归属 worker
+    if cluster is not None:
+        await cluster.claim(room_id)
+    room_changed(room_id)
+    
     return {
         "roomId": room_id,
         "playerId": player_id,
         "mode": mode
     }
 
-@app.get("/game/join/{room_id}")
-async def join_game(room_id: str, player_name: str):
-    """
-    加入一个已存在的游戏房间
-    """
-    if room_id not in active_games:
-        raise HTTPException(status_code=404, detail="房间不存在")
-    
-    room = active_games[room_id]
-    
+def join_room(room: Dict, room_id: str, player_name: str) -> Dict[str, Any]:
     if room["mode"] != "multiplayer":
         raise HTTPException(status_code=400, detail="不能加入单人模式游戏")
     
@@ -109,282 +327,605 @@ async def join_game(room_id: str, player_name: str):
     
     player_id = str(uuid.uuid4())[:8]
     room["players"].append({"id": player_id, "name": player_name})
-    
-    # 如果人数达到4人，分发卡牌
-    if len(room["players"]) == 4:
-        room["game_state"].deal_cards()
+    touch(room)
+    # 玩家列表只在快照中，此前断线的客户端重连时需要快照
+    event_buffer(room).barrier(room.get("seq", 0))
+    room_changed(room_id)
     
     return {
         "roomId": room_id,
         "playerId": player_id
     }
 
-@app.get("/game/status/{room_id}")
-async def get_game_status(room_id: str, player_id: Optional[str] = None):
+@app.get("/game/join/{room_id}")
+async def join_game(room_id: str, player_name: str):
     """
-    获取游戏当前状态
+    加入一个已存在的游戏房间
     """
-    if room_id not in active_games:
-        raise HTTPException(status_code=404, detail="房间不存在")
+    room, owner = await locate_room(room_id)
+    if owner is not None:
+        return await call_owner(owner, "join", room_id=room_id, player_name=player_name)
     
-    room = active_games[room_id]
-    game_state = room["game_state"]
+    if room is None:
+        raise HTTPException(status_code=404, detail="房间不存在")
     
+    result = join_room(room, room_id, player_name)
+    spectators.publish(room, room_id)
+    return result
+
+def game_status(room: Dict, room_id: str, player_id: Optional[str]) -> str:
+    """编码好的游戏状态，同一状态版本内直接使用缓存的编码结果"""
     # 获取对应玩家视角的游戏状态
     if player_id:
-        player_index = next((i for i, p in enumerate(room["players"]) if p["id"] == player_id), None)
+        player_index = find_player(room, player_id)
         if player_index is None:
             raise HTTPException(status_code=404, detail="玩家不存在")
         
-        # 构建玩家视角的游戏状态
-        return {
-            "roomId": room_id,
-            "players": room["players"],
-            "myIndex": player_index,
-            "myHand": [str(card) for card in game_state.players_hands[player_index]],
-            "currentTurn": game_state.current_player,
-            "currentLevel": game_state.current_level,
-            "lastPlayedCards": [str(card) for card in game_state.last_played_cards] if game_state.last_played_cards else None,
-            "lastPlayedPlayer": game_state.last_played_player,
-            "playerHandsCount": [len(hand) for hand in game_state.players_hands]
-        }
+        return encoded_snapshot(room, room_id, player_index)
     
     # 返回公共游戏状态信息
-    return {
-        "roomId": room_id,
-        "players": room["players"],
-        "currentLevel": game_state.current_level,
-        "currentTurn": game_state.current_player,
-        "lastPlayedCards": [str(card) for card in game_state.last_played_cards] if game_state.last_played_cards else None
-    }
+    def build_public():
+        data = public_state(room, room_id)
+        return encode({key: data[key] for key in ("roomId", "players", "currentLevel", "currentTurn", "lastPlayedCards")})
+    return cached(room, ("status",), build_public)
+
+@app.get("/game/status/{room_id}")
+async def get_game_status(room_id: str, player_id: Optional[str] = None):
+    """
+    获取游戏当前状态
+    """
+    room, owner = await locate_room(room_id)
+    if owner is not None:
+        content = await call_owner(owner, "status", room_id=room_id, player_id=player_id)
+        return Response(content, media_type="application/json")
+    
+    if room is None:
+        raise HTTPException(status_code=404, detail="房间不存在")
+    
+    return Response(game_status(room, room_id, player_id), media_type="application/json")
+
+async def hint_payload(room: Dict, player_index: int, wire_format: str = JSON) -> Union[str, bytes]:
+    """编码好的出牌提示，同一状态版本内重复请求直接使用缓存
+
+    还没有缓存时在 AI 线程池中对局面的副本计算，不阻塞事件循环；
+    算完之前局面已经变化时只回复这一次（对应请求时的局面），不放入缓存。
+    """
+    if cached_value(room, ("hint", player_index)) is None:
+        version = room.get("version", 0)
+        seq = room.get("seq", 0)
+        state = room["game_state"].clone()
+        data = await ai_scheduler.run_blocking(lambda: suggest(state, player_index))
+        if room.get("version", 0) != version:
+            return encode_hint(seq, data, wire_format)
+        cached(room, ("hint", player_index), lambda: data)
+    with stage("hint"):
+        return encoded_hint(room, player_index, wire_format)
+
+async def game_hint(room: Dict, room_id: str, player_id: str) -> str:
+    player_index = find_player(room, player_id)
+    if player_index is None:
+        raise HTTPException(status_code=404, detail="玩家不存在")
+    return await hint_payload(room, player_index)
+
+@app.get("/game/hint/{room_id}/{player_id}")
+async def get_game_hint(room_id: str, player_id: str):
+    """
+    获取玩家当前局面下的出牌提示（按打出后剩余手牌的拆分排序）
+    """
+    room, owner = await locate_room(room_id)
+    if owner is not None:
+        content = await call_owner(owner, "hint", room_id=room_id, player_id=player_id)
+        return Response(content, media_type="application/json")
+    
+    if room is None:
+        raise HTTPException(status_code=404, detail="房间不存在")
+    
+    return Response(await game_hint(room, room_id, player_id), media_type="application/json")
+
+# 重连的客户端只补发了事件（events）还是收到了完整快照（snapshot）
+resumes = {"events": 0, "snapshot": 0}
+
+async def send_resume(room: Dict, room_id: str, player_index: int, connection, last_seq: Optional[int]):
+    """
+    让客户端追上房间的状态：增量协议的客户端给出了收到的最后一个 seq，
+    且错过的事件都还在房间的事件缓冲中时只补发这些事件，否则发送完整快照
+    """
+    if connection.protocol == DELTA and last_seq is not None:
+        payloads = event_buffer(room).since(last_seq, connection.wire_format)
+        if payloads is not None:
+            resumes["events"] += 1
+            for payload in payloads:
+                await connection.send_encoded(payload)
+            return
+        resumes["snapshot"] += 1
+    await connection.send_encoded(encoded_snapshot_message(
+        room, room_id, player_index, connection.protocol, connection.wire_format))
+
+async def attach_connection(room: Dict, room_id: str, player_index: int, connection,
+                            last_seq: Optional[int] = None):
+    """将连接与玩家关联并发送初始状态，同一玩家的旧连接被新连接替换"""
+    player_id = connection.player_id
+    previous = connected_clients.get(player_id)
+    if previous is not None:
+        await previous.close()
+    connected_clients[player_id] = connection
+    mark_active(room)
+    
+    # 发送初始游戏状态，重连时只补发错过的事件
+    await send_resume(room, room_id, player_index, connection, last_seq)
+    
+    # 如果是单人模式并且现在是AI玩家的回合，让AI玩家行动
+    schedule_ai_turns(room, room_id)
+
+async def detach_connection(room: Dict, room_id: str, player_index: int, connection):
+    """移除断开连接的客户端"""
+    player_id = connection.player_id
+    if connected_clients.get(player_id) is connection:
+        del connected_clients[player_id]
+    mark_active(room)
+    
+    # 如果是多人模式，广播玩家离开消息
+    if room["mode"] == "multiplayer":
+        await broadcast_to_room(room_id, {
+            "type": "player_left",
+            "playerId": player_id,
+            "playerName": room["players"][player_index]["name"]
+        })
+
+async def handle_action(room: Dict, room_id: str, player_index: int, connection, data: Dict[str, Any]):
+    """处理玩家的一条操作消息"""
+    game_state = room["game_state"]
+    series: Series = room["series"]
+    
+    if data["action"] == "resync":
+        # 客户端发现事件序号不连续，重新发送完整快照
+        await connection.send_encoded(encoded_snapshot_message(
+            room, room_id, player_index, connection.protocol, connection.wire_format))
+    
+    elif data["action"] == "resume":
+        # 从客户端收到的最后一个 seq 继续，能补发事件时不发送快照
+        seq = data.get("seq")
+        await send_resume(room, room_id, player_index, connection, seq if isinstance(seq, int) else None)
+    
+    elif data["action"] == "hint":
+        # 出牌提示，同一状态版本内只计算一次
+        await connection.send_encoded(await hint_payload(room, player_index, connection.wire_format))
+    
+    elif data["action"] == "return_tribute":
+        # 收到贡牌的玩家还给进贡者一张牌
+        cards = decode_cards(data.get("cards"))
+        with stage("validate"):
+            success = cards is not None and len(cards) == 1 and series.return_tribute(
+                game_state, player_index, cards[0])
+        
+        if success:
+            await broadcast_event(room, room_id, tribute_return_event(room, player_index), record=False)
+            schedule_ai_turns(room, room_id)
+        else:
+            await connection.send({"type": "error", "message": "无效的还贡"})
+    
+    elif series.pending and data["action"] in ("play_cards", "pass"):
+        await connection.send({"type": "error", "message": "等待还贡"})
+    
+    elif data["action"] == "play_cards":
+        # 按连接的格式把牌的名称或 id 转换为 Card 对象
+        cards = decode_cards(data.get("cards"))
+        if cards is None:
+            await connection.send({"type": "error", "message": "无效的出牌"})
+            return
+        
+        # 尝试出牌
+        with stage("validate"):
+            success = game_state.play_cards(cards, player_index)
+        
+        if success:
+            # 广播出牌事件
+            await broadcast_event(room, room_id, play_event(room, player_index, cards))
+            
+            # 检查游戏是否结束
+            game_result = game_state.check_game_end()
+            if game_result:
+                await finish_round(room, room_id, game_result)
+            # 如果是单人模式，并且下一个玩家不是真人玩家，触发AI行动
+            schedule_ai_turns(room, room_id)
+        else:
+            await connection.send({"type": "error", "message": "无效的出牌"})
+    
+    elif data["action"] == "pass":
+        with stage("validate"):
+            success = game_state.pass_turn(player_index)
+        
+        if success:
+            # 广播过牌事件
+            await broadcast_event(room, room_id, pass_event(room, player_index))
+            
+            # 如果是单人模式，让 AI 玩家行动
+            schedule_ai_turns(room, room_id)
+        else:
+            await connection.send({"type": "error", "message": "现在不能过牌"})
+    
+    else:
+        await connection.send({"type": "error", "message": "未知的操作"})
 
 @app.websocket("/ws/{room_id}/{player_id}")
-async def websocket_endpoint(websocket: WebSocket, room_id: str, player_id: str):
+async def websocket_endpoint(websocket: WebSocket, room_id: str, player_id: str,
+                             protocol: Optional[str] = None,
+                             wire_format: Optional[str] = Query(None, alias="format"),
+                             last_seq: Optional[int] = Query(None, ge=0)):
     await websocket.accept()
     
-    if room_id not in active_games:
+    room, owner = await locate_room(room_id)
+    if owner is not None:
+        await proxy_websocket(websocket, room_id, player_id, owner, protocol, wire_format, last_seq)
+        return
+    
+    if room is None:
         await websocket.send_json({"error": "房间不存在"})
         await websocket.close()
         return
     
-    room = active_games[room_id]
-    player_index = next((i for i, p in enumerate(room["players"]) if p["id"] == player_id), None)
+    player_index = find_player(room, player_id)
     
     if player_index is None:
         await websocket.send_json({"error": "玩家不存在"})
         await websocket.close()
         return
     
-    # 将 WebSocket 连接与玩家关联
-    connected_clients[player_id] = websocket
+    connection = ClientConnection(websocket, player_id, negotiate(protocol), negotiate_format(wire_format))
     
     try:
-        # 发送初始游戏状态
-        game_state = room["game_state"]
-        await websocket.send_json({
-            "type": "game_state", 
-            "data": {
-                "roomId": room_id,
-                "players": room["players"],
-                "myIndex": player_index,
-                "myHand": [str(card) for card in game_state.players_hands[player_index]],
-                "currentTurn": game_state.current_player,
-                "currentLevel": game_state.current_level,
-                "lastPlayedCards": [str(card) for card in game_state.last_played_cards] if game_state.last_played_cards else None,
-                "lastPlayedPlayer": game_state.last_played_player,
-                "playerHandsCount": [len(hand) for hand in game_state.players_hands]
-            }
-        })
-        
-        # 如果是单人模式并且现在是AI玩家的回合，让AI玩家行动
-        if room["mode"] == "single" and game_state.current_player != player_index:
-            await handle_ai_turns(room, room_id)
+        await attach_connection(room, room_id, player_index, connection, last_seq)
         
         # 监听玩家操作
         while True:
-            data = await websocket.receive_json()
-            
-            if data["action"] == "play_cards":
-                cards_str = data["cards"]
-                # 将字符串转换为Card对象
-                cards = []
-                for card_str in cards_str:
-                    suit_str = card_str[0]
-                    rank_str = card_str[1:]
-                    
-                    # 处理大小王的特殊情况
-                    if "王" in card_str:
-                        suit = CardSuit.JOKER
-                        rank = CardRank.JOKER_BIG if "大" in card_str else CardRank.JOKER_SMALL
-                    else:
-                        # 根据字符确定花色
-                        if suit_str == "♠":
-                            suit = CardSuit.SPADES
-                        elif suit_str == "♥":
-                            suit = CardSuit.HEARTS
-                        elif suit_str == "♦":
-                            suit = CardSuit.DIAMONDS
-                        else:
-                            suit = CardSuit.CLUBS
-                        
-                        # 确定牌点
-                        rank_map = {
-                            "2": CardRank.TWO,
-                            "3": CardRank.THREE,
-                            "4": CardRank.FOUR,
-                            "5": CardRank.FIVE,
-                            "6": CardRank.SIX,
-                            "7": CardRank.SEVEN,
-                            "8": CardRank.EIGHT,
-                            "9": CardRank.NINE,
-                            "10": CardRank.TEN,
-                            "J": CardRank.JACK,
-                            "Q": CardRank.QUEEN,
-                            "K": CardRank.KING,
-                            "A": CardRank.ACE
-                        }
-                        rank = rank_map.get(rank_str)
-                    
-                    if suit and rank:
-                        cards.append(Card(suit, rank))
-                
-                # 尝试出牌
-                success = game_state.play_cards(cards, player_index)
-                
-                if success:
-                    # 广播更新后的游戏状态
-                    await broadcast_game_state(room, room_id)
-                    
-                    # 检查游戏是否结束
-                    game_result = game_state.check_game_end()
-                    if game_result:
-                        await broadcast_to_room(room_id, {
-                            "type": "game_end",
-                            "data": game_result
-                        })
-                        
-                        # 重置游戏状态
-                        game_state = GameState()
-                        game_state.deal_cards()
-                        room["game_state"] = game_state
-                        await broadcast_game_state(room, room_id)
-                    elif room["mode"] == "single" and game_state.current_player != player_index:
-                        # 如果是单人模式，并且下一个玩家不是真人玩家，触发AI行动
-                        await handle_ai_turns(room, room_id)
-                else:
-                    await websocket.send_json({"type": "error", "message": "无效的出牌"})
-            
-            elif data["action"] == "pass":
-                success = game_state.pass_turn(player_index)
-                
-                if success:
-                    # 广播更新后的游戏状态
-                    await broadcast_game_state(room, room_id)
-                    
-                    # 如果是单人模式，让 AI 玩家行动
-                    if room["mode"] == "single" and game_state.current_player != player_index:
-                        await handle_ai_turns(room, room_id)
-                else:
-                    await websocket.send_json({"type": "error", "message": "现在不能过牌"})
+            try:
+                data = await connection.receive()
+            except MessageError as exc:
+                await connection.send({"type": "error", "message": str(exc)})
+                continue
+            start = time.perf_counter()
+            await handle_action(room, room_id, player_index, connection, data)
+            record_move_time(room_id, time.perf_counter() - start)
     
     except WebSocketDisconnect:
-        # 移除断开连接的客户端
-        if player_id in connected_clients:
+        pass
+    finally:
+        # 无论因为什么退出，都要停止写任务并从房间中移除连接
+        await connection.close()
+        await detach_connection(room, room_id, player_index, connection)
+
+async def proxy_websocket(websocket: WebSocket, room_id: str, player_id: str, owner: str,
+                          protocol: Optional[str], wire_format: Optional[str], last_seq: Optional[int] = None):
+    """
+    房间归属其他 worker：连接留在本 worker，玩家操作转发给归属 worker，
+    归属 worker 的广播转发回来后放入本地连接的发送队列
+    """
+    connection = ClientConnection(websocket, player_id, negotiate(protocol), negotiate_format(wire_format))
+    previous = connected_clients.get(player_id)
+    if previous is not None:
+        await previous.close()
+    connected_clients[player_id] = connection
+    
+    try:
+        await cluster.call(owner, "attach", room_id=room_id, player_id=player_id,
+                           connection_id=connection.connection_id,
+                           protocol=connection.protocol, wire_format=connection.wire_format, last_seq=last_seq)
+    except RemoteError as exc:
+        await connection.close()
+        if connected_clients.get(player_id) is connection:
             del connected_clients[player_id]
-        
-        # 如果是多人模式，广播玩家离开消息
-        if room["mode"] == "multiplayer":
-            await broadcast_to_room(room_id, {
-                "type": "player_left",
-                "playerId": player_id,
-                "playerName": room["players"][player_index]["name"]
-            })
+        try:
+            await websocket.send_json({"error": exc.detail})
+            await websocket.close()
+        except Exception:
+            pass
+        return
+    
+    try:
+        while True:
+            try:
+                data = await connection.receive()
+            except MessageError as exc:
+                await connection.send({"type": "error", "message": str(exc)})
+                continue
+            cluster.notify(owner, "client_message", room_id=room_id, player_id=player_id, data=data)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await connection.close()
+        if connected_clients.get(player_id) is connection:
+            del connected_clients[player_id]
+        cluster.notify(owner, "detach", room_id=room_id, player_id=player_id,
+                       connection_id=connection.connection_id)
+
+@app.websocket("/watch/{room_id}")
+async def watch_endpoint(websocket: WebSocket, room_id: str,
+                         wire_format: Optional[str] = Query(None, alias="format")):
+    """观战：只接收房间的公开事件，见 spectators.py"""
+    await websocket.accept()
+    
+    room, owner = await locate_room(room_id)
+    if room is None and owner is None:
+        await websocket.send_json({"error": "房间不存在"})
+        await websocket.close()
+        return
+    
+    # 观战者跟不上时丢弃旧消息，之后可以发送 resync 重新获取快照
+    connection = ClientConnection(websocket, "spectator", DELTA, negotiate_format(wire_format), policy=DROP)
+    try:
+        if owner is None:
+            await spectators.watch(room, room_id, connection)
+        else:
+            await spectators.watch_remote(owner, room_id, connection)
+        while True:
+            try:
+                data = await connection.receive()
+            except MessageError:
+                continue
+            if data["action"] != "resync":
+                continue
+            if owner is None:
+                await spectators.resync(room_id, connection)
+            else:
+                await spectators.resync_remote(owner, room_id, connection)
+    except (WebSocketDisconnect, RemoteError):
+        pass
+    finally:
+        await connection.close()
+        if owner is None:
+            await spectators.unwatch(room_id, connection.connection_id)
+        else:
+            spectators.unwatch_remote(owner, room_id, connection)
+
+def register_cluster_handlers(cluster: Cluster):
+    """其他 worker 转发过来的请求"""
+    
+    def owned_room(room_id: str) -> Dict:
+        room = active_games.get(room_id)
+        if room is None:
+            raise HTTPException(status_code=404, detail="房间不存在")
+        return room
+    
+    def remote_connection(player_id: str, sender: str, connection_id: str) -> Optional[RemoteConnection]:
+        connection = connected_clients.get(player_id)
+        if isinstance(connection, RemoteConnection) and connection.worker == sender \
+                and connection.connection_id == connection_id:
+            return connection
+        return None
+    
+    @cluster.handler("join")
+    async def remote_join(sender: str, room_id: str, player_name: str):
+        room = owned_room(room_id)
+        result = join_room(room, room_id, player_name)
+        spectators.publish(room, room_id)
+        return result
+    
+    @cluster.handler("status")
+    async def remote_status(sender: str, room_id: str, player_id: Optional[str]):
+        return game_status(owned_room(room_id), room_id, player_id)
+    
+    @cluster.handler("hint")
+    async def remote_hint(sender: str, room_id: str, player_id: str):
+        return await game_hint(owned_room(room_id), room_id, player_id)
+    
+    @cluster.handler("attach")
+    async def remote_attach(sender: str, room_id: str, player_id: str, connection_id: str,
+                            protocol: str, wire_format: str, last_seq: Optional[int] = None):
+        room = owned_room(room_id)
+        player_index = find_player(room, player_id)
+        if player_index is None:
+            raise HTTPException(status_code=404, detail="玩家不存在")
+        connection = RemoteConnection(cluster, sender, player_id, connection_id, protocol, wire_format)
+        await attach_connection(room, room_id, player_index, connection, last_seq)
+    
+    @cluster.handler("client_message")
+    async def remote_client_message(sender: str, room_id: str, player_id: str, data: Dict[str, Any]):
+        room = owned_room(room_id)
+        connection = connected_clients.get(player_id)
+        player_index = find_player(room, player_id)
+        if isinstance(connection, RemoteConnection) and connection.worker == sender and player_index is not None:
+            start = time.perf_counter()
+            await handle_action(room, room_id, player_index, connection, data)
+            record_move_time(room_id, time.perf_counter() - start)
+    
+    @cluster.handler("detach")
+    async def remote_detach(sender: str, room_id: str, player_id: str, connection_id: str):
+        room = active_games.get(room_id)
+        connection = remote_connection(player_id, sender, connection_id)
+        if room is not None and connection is not None:
+            connection.closed = True
+            await detach_connection(room, room_id, find_player(room, player_id), connection)
+    
+    @cluster.handler("deliver")
+    async def deliver(sender: str, player_id: str, connection_id: str, data):
+        # 本 worker 上的连接收到归属 worker 转发的消息
+        connection = get_connection(connected_clients, player_id)
+        if isinstance(connection, ClientConnection) and connection.connection_id == connection_id:
+            await connection.send_encoded(data)
+    
+    @cluster.handler("close")
+    async def close(sender: str, player_id: str, connection_id: str, code: int = 1000):
+        connection = connected_clients.get(player_id)
+        if isinstance(connection, ClientConnection) and connection.connection_id == connection_id:
+            await connection.close(code)
+    
+    # 观战：归属 worker 对每个 worker 的每种格式只转发一份，由观战者所在的 worker 分发
+    @cluster.handler("watch")
+    async def remote_watch(sender: str, room_id: str, wire_format: str, audience: int):
+        return await spectators.watch_relay(owned_room(room_id), room_id, sender, wire_format, audience)
+    
+    @cluster.handler("unwatch")
+    async def remote_unwatch(sender: str, room_id: str, wire_format: str, audience: int):
+        await spectators.unwatch_relay(room_id, sender, wire_format, audience)
+    
+    @cluster.handler("spectate_deliver")
+    async def spectate_deliver(sender: str, room_id: str, wire_format: str, data):
+        await spectators.deliver(room_id, wire_format, data)
+    
+    @cluster.handler("spectate_close")
+    async def spectate_close(sender: str, room_id: str, wire_format: str, code: int = 1000):
+        await spectators.close_relay(room_id, wire_format, code)
+
+if cluster is not None:
+    register_cluster_handlers(cluster)
 
 async def broadcast_to_room(room_id: str, message: Dict[str, Any]):
     """
-    向房间内所有玩家广播消息
+    向房间内所有玩家广播消息（放入各连接的发送队列，不等待发送）
     """
     if room_id not in active_games:
         return
     
     room = active_games[room_id]
+    encoded: Dict[str, Any] = {}
     
     for player in room["players"]:
-        if player["id"] in connected_clients:
-            await connected_clients[player["id"]].send_json(message)
+        connection = get_connection(connected_clients, player["id"])
+        if connection is not None:
+            await send_shared(connection, message, encoded)
+
+async def send_shared(connection: ClientConnection, message: Dict[str, Any],
+                      encoded: Dict[str, Any]) -> Union[str, bytes]:
+    """发送所有接收者相同的消息，每种编码格式只编码一次，返回发送的内容"""
+    payload = encoded.get(connection.wire_format)
+    if payload is None:
+        with stage("serialize"):
+            payload = encoded[connection.wire_format] = encode(message, connection.wire_format)
+    await connection.send_encoded(payload)
+    return payload
 
 async def broadcast_game_state(room: Dict, room_id: str):
     """
-    向房间内所有玩家广播游戏状态
+    向房间内所有玩家广播完整的游戏状态（新的一局开始时使用）
     """
-    game_state = room["game_state"]
-    
+    room_changed(room_id)
+    # 新一局的手牌只在快照中，此前的 seq 重连时都需要快照
+    event_buffer(room).barrier(room.get("seq", 0))
     for i, player in enumerate(room["players"]):
-        if player["id"] in connected_clients:
-            await connected_clients[player["id"]].send_json({
-                "type": "game_state",
-                "data": {
-                    "roomId": room_id,
-                    "players": room["players"],
-                    "myIndex": i,
-                    "myHand": [str(card) for card in game_state.players_hands[i]],
-                    "currentTurn": game_state.current_player,
-                    "currentLevel": game_state.current_level,
-                    "lastPlayedCards": [str(card) for card in game_state.last_played_cards] if game_state.last_played_cards else None,
-                    "lastPlayedPlayer": game_state.last_played_player,
-                    "playerHandsCount": [len(hand) for hand in game_state.players_hands]
-                }
-            })
+        connection = get_connection(connected_clients, player["id"])
+        if connection is not None:
+            await connection.send_encoded(encoded_snapshot_message(
+                room, room_id, i, connection.protocol, connection.wire_format))
+    spectators.publish(room, room_id)
 
-async def handle_ai_turns(room: Dict, room_id: str):
+async def broadcast_event(room: Dict, room_id: str, event: Dict[str, Any], record: bool = True):
     """
-    处理 AI 玩家的行动
+    广播一个事件：增量协议的客户端收到同一份编码好的事件，旧客户端收到完整状态；
+    record 为真时作为一步写入对局记录
     """
-    game_state = room["game_state"]
-    current_player = game_state.current_player
+    room_changed(room_id)
+    if record and recorder is not None:
+        recorder.record_move(room_id, room, event)
+    encoded: Dict[str, Any] = {}
+    sent = 0
+    with stage("broadcast"):
+        for i, player in enumerate(room["players"]):
+            connection = get_connection(connected_clients, player["id"])
+            if connection is None:
+                continue
+            if connection.protocol == DELTA:
+                payload = await send_shared(connection, event, encoded)
+            else:
+                with stage("serialize"):
+                    payload = encoded_snapshot_message(room, room_id, i, wire_format=connection.wire_format)
+                await connection.send_encoded(payload)
+            sent += len(payload)
+    BROADCAST_BYTES.observe(sent)
+    spectators.publish(room, room_id, event)
+
+async def finish_round(room: Dict, room_id: str, game_result: Dict):
+    """广播本局结果并开始新的一局"""
+    series: Series = room["series"]
+    series.finish_round(game_result)
+    if recorder is not None:
+        recorder.record_game_end(room_id, room, game_result)
+    room["round"] = room.get("round", 0) + 1
+    event = round_end_event(room, game_result)
+    legacy = {"type": "game_end", "data": game_result}
+    encoded_event: Dict[str, Any] = {}
+    encoded_legacy: Dict[str, Any] = {}
+    for player in room["players"]:
+        connection = get_connection(connected_clients, player["id"])
+        if connection is None:
+            continue
+        if connection.protocol == DELTA:
+            await send_shared(connection, event, encoded_event)
+        else:
+            await send_shared(connection, legacy, encoded_legacy)
+    spectators.publish(room, room_id, event)
     
-    # 循环直到轮到真人玩家或游戏结束
-    while room["players"][current_player]["id"].startswith("ai_"):
-        # 创建 AI 实例
-        ai = AIPlayer(game_state, current_player)
+    # 在原来的 GameState 上开始下一局并进贡，发牌从发牌池中取（指定种子的房间按种子生成）
+    game_state = room["game_state"]
+    series.start_round(game_state, room_deal(room, deal_pool).hands)
+    touch(room)
+    if series.tributes or series.anti_tribute:
+        await broadcast_event(room, room_id, tribute_event(room), record=False)
+    # 单人模式中 AI 收到贡牌时直接还贡
+    for receiver, _ in list(series.pending):
+        if room["mode"] == "single" and is_ai_player(room, receiver):
+            card = return_card(game_state.players_hands[receiver], game_state.current_level)
+            series.return_tribute(game_state, receiver, card)
+            await broadcast_event(room, room_id, tribute_return_event(room, receiver), record=False)
+    await broadcast_game_state(room, room_id)
+    # 之后一直没有人出牌的房间按较短的 TTL 回收
+    mark_finished(room)
+
+def apply_ai_action(game_state: GameState, player_index: int, action: Dict) -> bool:
+    """执行 AI 的出牌或过牌，不合法时返回 False"""
+    if action["action"] == "play":
+        return game_state.play_cards(action["cards"], player_index)
+    return game_state.pass_turn(player_index)
+
+async def handle_ai_turns(room: Dict, room_id: str):
+    """
+    处理 AI 玩家的行动（在房间的后台任务中运行）
+    """
+    # 循环直到轮到真人玩家
+    while True:
+        game_state = room["game_state"]
+        current_player = game_state.current_player
+        round_index = room.get("round", 0)
+        if room["series"].pending or not is_ai_player(room, current_player):
+            break
+        
+        # 创建 AI 实例；决策在线程池中进行，使用局面的副本，不会读到事件循环上同时发生的修改
+        ai = create_ai_player(room, game_state.clone(), current_player)
+        
+        # 展示用的思考延迟，搜索 AI 的计算时间计入其中
+        delay = AI_THINK_DELAY
+        if isinstance(ai, SearchAIPlayer):
+            delay = max(AI_THINK_DELAY - ai.time_budget, 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
         
-        # 让AI思考一会
-        await asyncio.sleep(1)
+        # 获取 AI 决策：规则 AI 冷缓存时的手牌拆分也可能要几十毫秒，所有 AI 都在线程池中计算，不阻塞事件循环
+        hand_size = len(game_state.players_hands[current_player])
+        with AI_DECISION_SECONDS.time(current_player, hand_group(hand_size)):
+            action = await ai_scheduler.run_blocking(ai.make_decision)
         
-        # 获取 AI 决策
-        action = ai.make_decision()
+        # 思考期间局面可能已经变化（例如新开一局），此时重新决策
+        if room.get("round", 0) != round_index or game_state.current_player != current_player:
+            continue
         
+        if not apply_ai_action(game_state, current_player, action):
+            # 决策不合法时不让房间卡住：跟牌时过牌，首出时出最小的一手
+            logger.warning("room %s: AI seat %d made an illegal move %s", room_id, current_player, action)
+            action = AIPlayer(game_state, current_player).fallback_decision()
+            if not apply_ai_action(game_state, current_player, action):
+                logger.error("room %s: AI seat %d has no legal move", room_id, current_player)
+                break
+        
+        # 广播出牌或过牌事件
         if action["action"] == "play":
-            # AI 出牌
-            game_state.play_cards(action["cards"], current_player)
+            event = play_event(room, current_player, action["cards"])
         else:
-            # AI 过牌
-            game_state.pass_turn(current_player)
-        
-        # 广播游戏状态
-        await broadcast_game_state(room, room_id)
+            event = pass_event(room, current_player)
+        await broadcast_event(room, room_id, event)
         
         # 检查游戏是否结束
         game_result = game_state.check_game_end()
         if game_result:
-            await broadcast_to_room(room_id, {
-                "type": "game_end",
-                "data": game_result
-            })
-            
-            # 重置游戏状态
-            game_state = GameState()
-            game_state.deal_cards()
-            room["game_state"] = game_state
-            await broadcast_game_state(room, room_id)
-            return
-        
-        # 更新当前玩家
-        current_player = game_state.current_player
-        
-        # 如果轮到真人玩家，结束AI回合
-        if not room["players"][current_player]["id"].startswith("ai_"):
-            break
+            await finish_round(room, room_id, game_result)
 
 if __name__ == "__main__":
     import uvicorn
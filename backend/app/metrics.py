@@ -0,0 +1,304 @@
+"""服务端性能指标
+
+不依赖 prometheus_client，直接按 Prometheus 文本格式输出（GET /metrics）：
+  - guandan_stage_seconds{stage}：各阶段耗时
+      parse     解码客户端消息
+      validate  play_cards / pass_turn 校验并执行
+      serialize 广播消息的编码
+      broadcast 一次广播（编码并放入所有连接的发送队列）
+      send      单条消息写入 socket
+      move      从收到玩家消息到广播完成的总耗时
+      hint      出牌提示（含缓存命中）
+      spectate  向一个房间的所有观战者分发一条消息
+  - guandan_ai_decision_seconds{seat,hand}：AI 每次决策的耗时，按座位与手牌张数分组
+  - guandan_broadcast_bytes：每步出牌/过牌广播的总字节数
+  - guandan_event_loop_lag_seconds：事件循环的调度延迟
+  - guandan_room_move_seconds_max{room}：最近一段时间内单步最慢的若干个房间
+  - 房间数、连接数等由 main.py 注册的 Gauge
+
+SamplingProfiler 可以在运行时开启，定期采样事件循环线程的调用栈，
+输出 flamegraph.pl / speedscope 可以读取的折叠栈格式。
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 秒：50µs 到 5s
+TIME_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# 字节：64B 到 256KB
+BYTE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.samples())
+
+
+class _HistogramSeries:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], _HistogramSeries] = {}
+
+    def labels(self, *values) -> _HistogramSeries:
+        key = tuple(str(value) for value in values)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _HistogramSeries(self.buckets)
+        return series
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self, *values):
+        return self.labels(*values).time()
+
+    def samples(self) -> Iterator[str]:
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(series.sum)}"
+            yield f"{self.name}_count{labels} {series.count}"
+
+
+class Gauge(Metric):
+    """取值由回调函数在输出时计算；有标签时回调返回 {标签值元组: 数值}"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], object],
+                 labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def samples(self) -> Iterator[str]:
+        value = self.func()
+        if not self.labelnames:
+            yield f"{self.name} {_format_value(value)}"
+            return
+        for key, item in sorted(value.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(item)}"
+
+
+class CallbackCounter(Gauge):
+    """由其他模块维护的累计计数，输出时读取"""
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        parts = []
+        for metric in self.metrics.values():
+            try:
+                parts.append(metric.render())
+            except Exception:
+                logger.exception("cannot render metric %s", metric.name)
+        return "".join(parts)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "guandan_stage_seconds", "Time spent in each stage of handling a move", ("stage",)))
+AI_DECISION_SECONDS = REGISTRY.register(Histogram(
+    "guandan_ai_decision_seconds", "Time per AI decision by seat and hand size", ("seat", "hand")))
+BROADCAST_BYTES = REGISTRY.register(Histogram(
+    "guandan_broadcast_bytes", "Bytes enqueued to all clients per broadcast move", buckets=BYTE_BUCKETS))
+LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    "guandan_event_loop_lag_seconds", "Delay between when a callback is due and when it runs"))
+
+
+def stage(name: str):
+    """记录一个阶段的耗时：with stage("validate"): ..."""
+    return STAGE_SECONDS.time(name)
+
+
+def hand_group(size: int) -> str:
+    """手牌张数按 9 张分组，避免标签组合过多"""
+    low = (size - 1) // 9 * 9 + 1 if size > 0 else 0
+    return f"{low}-{low + 8}" if size > 0 else "0"
+
+
+class SlowRooms:
+    """每个统计窗口内单步最慢的房间，用于找出拖慢尾延迟的房间"""
+
+    def __init__(self, limit: int = 10, window: float = 60.0):
+        self.limit = limit
+        self.window = window
+        self._current: Dict[str, float] = {}
+        self._previous: Dict[str, float] = {}
+        self._started = time.monotonic()
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self._started > self.window:
+            self._previous, self._current = self._current, {}
+            self._started = now
+
+    def record(self, room_id: str, seconds: float):
+        self._rotate()
+        if seconds > self._current.get(room_id, 0.0):
+            self._current[room_id] = seconds
+
+    def discard(self, room_id: str):
+        self._current.pop(room_id, None)
+        self._previous.pop(room_id, None)
+
+    def top(self) -> Dict[Tuple[str], float]:
+        self._rotate()
+        merged = dict(self._previous)
+        for room_id, seconds in self._current.items():
+            merged[room_id] = max(seconds, merged.get(room_id, 0.0))
+        slowest = sorted(merged.items(), key=lambda item: item[1], reverse=True)[:self.limit]
+        return {(room_id,): seconds for room_id, seconds in slowest}
+
+
+SLOW_ROOMS = SlowRooms()
+REGISTRY.register(Gauge(
+    "guandan_room_move_seconds_max", "Slowest move per room in the recent window (top rooms only)",
+    SLOW_ROOMS.top, ("room",)))
+
+
+class LoopLagMonitor:
+    """定期 sleep 固定时长，实际醒来时间与预期的差值即事件循环的延迟"""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.last = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last = max(time.perf_counter() - start - self.interval, 0.0)
+            LOOP_LAG_SECONDS.observe(self.last)
+
+
+class SamplingProfiler:
+    """在后台线程中定期采样目标线程（默认为启动它的线程，即事件循环线程）的调用栈"""
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            raise RuntimeError("profiler is already running")
+        self.samples.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        """停止采样，返回折叠栈格式的结果（每行 "外层;...;内层 次数"）"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.collapsed()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
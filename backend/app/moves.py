@@ -0,0 +1,253 @@
+"""出牌枚举
+
+根据手牌的计数向量直接枚举所有合法出牌，不需要对手牌排序或反复扫描。
+同一牌型同一大小的出牌只产出一种代表性的选牌（优先使用自然牌，不够时才用逢人配），
+三带二按 (三张, 对子) 组合、炸弹按张数分别产出，同一组牌的同一种解释只产出一次。
+每个候选都用 combos 中的判定结果确认牌型，保证与出牌校验完全一致。
+"""
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from .cards import (
+    Card, Hand, CARDS, FACE_COUNT, RANK_FACES, RANK_VALUES,
+    SMALL_JOKER, BIG_JOKER, face_of, level_rank, wild_face,
+)
+from .combos import (
+    CardType, Combo, BOMB_TYPES, JOKER_BOMB_KEY, STRAIGHT_SEQUENCES,
+    PAIRS_SEQUENCES, TRIPLES_SEQUENCES, bomb_key, interpretations,
+    straight_flush_key,
+)
+
+MAX_BOMB_SIZE = 10
+
+
+class Move(NamedTuple):
+    """一种出牌：具体的牌和它的牌型解释"""
+    cards: Tuple[Card, ...]
+    combo: Combo
+
+
+class _HandView:
+    """枚举时使用的手牌视图：自然牌计数与逢人配数量"""
+    __slots__ = ("hand", "counts", "natural", "wild_face", "wilds", "level", "values")
+
+    def __init__(self, hand: Hand, level: int):
+        self.hand = hand
+        self.counts = hand.counts
+        self.level = level
+        self.values = RANK_VALUES[level]
+        self.wild_face = wild_face(level)
+        self.wilds = hand.wild_count(level)
+        natural = list(hand.rank_counts)
+        natural[level_rank(level)] -= self.wilds
+        self.natural = natural
+
+    def take(self, rank: int, n: int, out: List[Card]):
+        """取 n 张该点数的自然牌（不含逢人配）"""
+        counts = self.counts
+        for face in RANK_FACES[rank]:
+            if face == self.wild_face:
+                continue
+            for copy in range(counts[face]):
+                if n == 0:
+                    return
+                out.append(CARDS[copy * FACE_COUNT + face])
+                n -= 1
+
+    def take_wilds(self, n: int, out: List[Card]):
+        for copy in range(n):
+            out.append(CARDS[copy * FACE_COUNT + self.wild_face])
+
+    def same_rank(self, rank: int, size: int) -> Optional[List[Card]]:
+        """由 size 张同点数的牌组成的选牌，不足时用逢人配补"""
+        natural = self.natural[rank]
+        if rank >= SMALL_JOKER:
+            if natural < size:
+                return None
+            out: List[Card] = []
+            self.take(rank, size, out)
+            return out
+        used = min(natural, size)
+        if size - used > self.wilds:
+            return None
+        out = []
+        self.take(rank, used, out)
+        self.take_wilds(size - used, out)
+        return out
+
+    def sequence(self, ranks: Tuple[int, ...], width: int, suit: Optional[int] = None) -> Optional[List[Card]]:
+        """每个点数各取 width 张组成的连续牌，suit 不为空时只取该花色"""
+        need = 0
+        for rank in ranks:
+            have = self._suited(rank, suit) if suit is not None else self.natural[rank]
+            if have < width:
+                need += width - have
+        if need > self.wilds:
+            return None
+        out: List[Card] = []
+        for rank in ranks:
+            if suit is None:
+                self.take(rank, width, out)
+            else:
+                face = face_of(suit, rank)
+                if face != self.wild_face and self.counts[face]:
+                    out.append(CARDS[face])
+        self.take_wilds(need, out)
+        return out
+
+    def _suited(self, rank: int, suit: int) -> int:
+        face = face_of(suit, rank)
+        return 0 if face == self.wild_face else min(self.counts[face], 1)
+
+
+def _make(cards: List[Card], card_type: CardType, level: int) -> Optional[Move]:
+    for combo in interpretations(cards, level):
+        if combo.type == card_type:
+            return Move(tuple(cards), combo)
+    return None
+
+
+def _ranks_by_value(level: int) -> List[int]:
+    values = RANK_VALUES[level]
+    return sorted(range(len(values)), key=values.__getitem__)
+
+
+def _usable(view: _HandView, rank: int) -> bool:
+    # 只有逢人配的点数与级牌本身是同一组牌，只在级牌处产出一次
+    return view.natural[rank] > 0 or (rank == level_rank(view.level) and view.wilds > 0)
+
+
+def _same_rank_moves(view: _HandView, card_type: CardType, size: int, above: int) -> Iterator[Move]:
+    for rank in _ranks_by_value(view.level):
+        if view.values[rank] <= above or not _usable(view, rank):
+            continue
+        cards = view.same_rank(rank, size)
+        if cards:
+            move = _make(cards, card_type, view.level)
+            if move:
+                yield move
+
+
+def _triple_with_pair_moves(view: _HandView, above: int) -> Iterator[Move]:
+    ranks = _ranks_by_value(view.level)
+    # 用到逢人配时 (三张=a, 对子=b) 与 (三张=b, 对子=a) 可能选出同一组牌、同一牌型解释，只产出一次
+    seen = set()
+    for triple in ranks:
+        if triple >= SMALL_JOKER or view.values[triple] <= above or not _usable(view, triple):
+            continue
+        for pair in ranks:
+            if pair == triple or not _usable(view, pair):
+                continue
+            if pair >= SMALL_JOKER and view.natural[pair] != 2:
+                continue
+            used_t = min(view.natural[triple], 3)
+            used_p = min(view.natural[pair], 2)
+            if (3 - used_t) + (2 - used_p) > view.wilds:
+                continue
+            cards: List[Card] = []
+            view.take(triple, used_t, cards)
+            view.take(pair, used_p, cards)
+            view.take_wilds(5 - used_t - used_p, cards)
+            move = _make(cards, CardType.TRIPLE_WITH_PAIR, view.level)
+            if move and move.combo.key > above:
+                key = (move.combo, tuple(sorted(card.id for card in cards)))
+                if key not in seen:
+                    seen.add(key)
+                    yield move
+
+
+def _sequence_moves(view: _HandView, card_type: CardType, sequences, width: int, above: int) -> Iterator[Move]:
+    for start, ranks in enumerate(sequences):
+        if start <= above:
+            continue
+        cards = view.sequence(ranks, width)
+        if cards:
+            move = _make(cards, card_type, view.level)
+            # 逢人配补出的牌也能组成起点更大的连续牌时，判定取更大的起点，这组牌在那个起点处产出
+            if move and move.combo.key == start:
+                yield move
+
+
+def _bomb_moves(view: _HandView, above: int) -> Iterator[Move]:
+    """按炸弹大小从小到大产出所有炸弹（含同花顺与四王），候选来自手牌索引"""
+    hand = view.hand
+    candidates: List[Tuple[int, List[Card], CardType]] = []
+    mask = hand.bomb_mask(view.level)
+    rank = 0
+    while mask:
+        if mask & 1:
+            most = min(view.natural[rank] + view.wilds, MAX_BOMB_SIZE)
+            for size in range(4, most + 1):
+                key = bomb_key(size, view.values[rank])
+                if key > above:
+                    cards = view.same_rank(rank, size)
+                    if cards:
+                        candidates.append((key, cards, CardType.BOMB))
+        mask >>= 1
+        rank += 1
+    for suit, start in hand.straight_flush_candidates(view.level):
+        key = straight_flush_key(start)
+        if key > above:
+            cards = view.sequence(STRAIGHT_SEQUENCES[start], 1, suit)
+            if cards:
+                candidates.append((key, cards, CardType.STRAIGHT_FLUSH))
+    if hand.has_joker_bomb and JOKER_BOMB_KEY > above:
+        cards = []
+        view.take(SMALL_JOKER, 2, cards)
+        view.take(BIG_JOKER, 2, cards)
+        candidates.append((JOKER_BOMB_KEY, cards, CardType.JOKER_BOMB))
+    candidates.sort(key=lambda c: c[0])
+    for key, cards, card_type in candidates:
+        move = _make(cards, card_type, view.level)
+        # 同花顺与 _sequence_moves 相同，只在判定得到的起点处产出
+        if move and move.combo.key == key:
+            yield move
+
+
+_NO_LIMIT = -1
+
+
+def _type_moves(view: _HandView, card_type: CardType, above: int) -> Iterator[Move]:
+    if card_type == CardType.SINGLE:
+        return _same_rank_moves(view, card_type, 1, above)
+    if card_type == CardType.PAIR:
+        return _same_rank_moves(view, card_type, 2, above)
+    if card_type == CardType.TRIPLE:
+        return _same_rank_moves(view, card_type, 3, above)
+    if card_type == CardType.TRIPLE_WITH_PAIR:
+        return _triple_with_pair_moves(view, above)
+    if card_type == CardType.STRAIGHT:
+        return _sequence_moves(view, card_type, STRAIGHT_SEQUENCES, 1, above)
+    if card_type == CardType.CONSECUTIVE_PAIRS:
+        return _sequence_moves(view, card_type, PAIRS_SEQUENCES, 2, above)
+    if card_type == CardType.CONSECUTIVE_TRIPLES:
+        return _sequence_moves(view, card_type, TRIPLES_SEQUENCES, 3, above)
+    return iter(())
+
+
+LEAD_TYPES = (
+    CardType.SINGLE, CardType.PAIR, CardType.TRIPLE, CardType.TRIPLE_WITH_PAIR,
+    CardType.STRAIGHT, CardType.CONSECUTIVE_PAIRS, CardType.CONSECUTIVE_TRIPLES,
+)
+
+
+def iter_moves(hand: Hand, level: int, table: Optional[Combo] = None) -> Iterator[Move]:
+    """枚举手牌的所有合法出牌
+
+    table 为空时枚举所有可以首出的牌，否则只枚举能压过 table 的牌。
+    产出顺序为：普通牌型（同牌型内按从小到大），最后是炸弹（从小到大）。
+    """
+    view = _HandView(hand, level)
+    if table is None:
+        for card_type in LEAD_TYPES:
+            yield from _type_moves(view, card_type, _NO_LIMIT)
+        yield from _bomb_moves(view, _NO_LIMIT)
+        return
+    if table.type in BOMB_TYPES:
+        yield from _bomb_moves(view, table.key)
+        return
+    yield from _type_moves(view, table.type, table.key)
+    yield from _bomb_moves(view, _NO_LIMIT)
+
+
+def list_moves(hand: Hand, level: int, table: Optional[Combo] = None) -> List[Move]:
+    return list(iter_moves(hand, level, table))
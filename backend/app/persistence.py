@@ -0,0 +1,202 @@
+"""对局记录的异步批量持久化
+
+每一步出牌/过牌和每局结果都放入一个有界队列后立即返回，不会阻塞事件循环；
+后台任务把队列中的记录攒成批次，在线程池中批量写入存储（MongoDB 的 insert_many），
+写入失败的批次写入备用的文件存储，不会丢失。
+
+配置：
+  - MONGODB_URI：MongoDB 连接地址（需要安装 pymongo），记录写入 "moves" 与 "games" 集合
+  - GAME_LOG_DIR：文件存储目录，每个集合一个 JSON Lines 文件；
+    同时配置了 MONGODB_URI 时作为写入失败时的备用存储
+两者都未配置时不记录。
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+try:
+    import pymongo
+except ImportError:  # pymongo 是可选依赖
+    pymongo = None
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = int(os.environ.get("GAME_LOG_QUEUE_SIZE", "10000"))
+BATCH_SIZE = int(os.environ.get("GAME_LOG_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.environ.get("GAME_LOG_FLUSH_INTERVAL", "1.0"))
+
+MOVES = "moves"
+GAMES = "games"
+
+
+class Sink:
+    """记录的存储，write 在线程池中调用，可以阻塞"""
+
+    def write(self, collection: str, documents: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileSink(Sink):
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, collection: str, documents: List[Dict[str, Any]]):
+        lines = "".join(json.dumps(doc, ensure_ascii=False, separators=(",", ":")) + "\n"
+                        for doc in documents)
+        with self._lock, open(os.path.join(self.directory, f"{collection}.jsonl"), "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+class MongoSink(Sink):
+    def __init__(self, uri: str, database: Optional[str] = None):
+        if pymongo is None:
+            raise RuntimeError("pymongo is not installed")
+        self.client = pymongo.MongoClient(uri)
+        self.db = self.client[database or urlparse(uri).path.lstrip("/") or "guandan"]
+
+    def write(self, collection: str, documents: List[Dict[str, Any]]):
+        # insert_many 会给文档加上 _id，传入副本以便失败时原样写入备用存储
+        self.db[collection].insert_many([dict(doc) for doc in documents], ordered=False)
+
+    def close(self):
+        self.client.close()
+
+
+class GameRecorder:
+    def __init__(self, sink: Sink, fallback: Optional[Sink] = None, max_queue: int = QUEUE_SIZE,
+                 batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.sink = sink
+        self.fallback = fallback
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: Optional[asyncio.Queue] = None
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="game-log")
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List = []  # 已从队列取出、尚未交给线程池写入的记录
+        self._writing: Optional[asyncio.Future] = None  # 正在写入的批次
+
+    def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """等正在写入的批次写完，再写完队列中剩余的记录后停止"""
+        if self._task is None:
+            return
+        # 后台任务只会在等待队列、攒批或等待写入时被取消，写入本身受 shield 保护，不会写到一半
+        self._task.cancel()
+        self._task = None
+        if self._writing is not None:
+            await self._writing
+            self._writing = None
+        while self._batch or not self.queue.empty():
+            self._batch.extend(self._take(self.batch_size - len(self._batch)))
+            await self._write_batch()
+        self._executor.shutdown(wait=True)
+        self.sink.close()
+
+    def record(self, collection: str, document: Dict[str, Any]):
+        """放入队列后立即返回，队列已满时丢弃并计数"""
+        if self.queue is None:
+            return
+        try:
+            self.queue.put_nowait((collection, document))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def record_move(self, room_id: str, room: Dict, event: Dict[str, Any]):
+        """记录一个出牌或过牌事件（protocol.play_event / pass_event）"""
+        data = event["data"]
+        cards = data.get("cards")
+        self.record(MOVES, {
+            "roomId": room_id,
+            "round": room.get("round", 0),
+            "seq": event["seq"],
+            "seat": data["seat"],
+            "action": event["event"],
+            "cards": list(cards.ids) if cards is not None else None,
+            "cardType": data.get("cardType"),
+            "level": room["game_state"].current_level,
+            "ts": time.time(),
+        })
+
+    def record_game_end(self, room_id: str, room: Dict, result: Dict[str, Any]):
+        self.record(GAMES, {
+            "roomId": room_id,
+            "round": room.get("round", 0),
+            "mode": room.get("mode"),
+            "players": [player["id"] for player in room["players"]],
+            # 与 moves 中本局的出牌一起可以还原成回放（replay.RoundRecord）：
+            # transfers 为本局开始时的进贡与还贡 (给出者, 收到者, card id)，回放时先在发出的手牌之间移动这些牌
+            "dealSeed": room.get("deal_seed"),
+            "level": room["game_state"].current_level,
+            "transfers": [list(t) for t in room["series"].transfers()] if "series" in room else [],
+            "result": result,
+            "ts": time.time(),
+        })
+
+    def _take(self, limit: int) -> List:
+        items = []
+        while len(items) < limit and not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return items
+
+    async def _run(self):
+        while True:
+            self._batch.append(await self.queue.get())
+            # 等待一小段时间攒批，队列中已有足够多的记录时立即写入
+            if self.queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.flush_interval)
+            self._batch.extend(self._take(self.batch_size - len(self._batch)))
+            self._writing = asyncio.ensure_future(self._write_batch())
+            await asyncio.shield(self._writing)
+            self._writing = None
+
+    async def _write_batch(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for collection, document in batch:
+            grouped.setdefault(collection, []).append(document)
+        loop = asyncio.get_running_loop()
+        for collection, documents in grouped.items():
+            try:
+                await loop.run_in_executor(self._executor, self.sink.write, collection, documents)
+                self.written += len(documents)
+            except Exception:
+                logger.exception("failed to write %d %s records", len(documents), collection)
+                self.failed += len(documents)
+                if self.fallback is not None:
+                    try:
+                        await loop.run_in_executor(self._executor, self.fallback.write, collection, documents)
+                    except Exception:
+                        logger.exception("fallback sink failed")
+
+
+def open_recorder(mongodb_uri: Optional[str], log_dir: Optional[str]) -> Optional[GameRecorder]:
+    """根据配置创建记录器，未配置存储时返回 None"""
+    fallback = FileSink(log_dir) if log_dir else None
+    if mongodb_uri:
+        try:
+            return GameRecorder(MongoSink(mongodb_uri), fallback)
+        except Exception:
+            logger.exception("cannot use MongoDB for game records")
+    if fallback is not None:
+        return GameRecorder(fallback)
+    return None
@@ -0,0 +1,293 @@
+"""WebSocket 消息协议
+
+旧协议（snapshot）：每步之后向每位玩家发送完整的 game_state。
+增量协议（delta）：连接时 /ws/{room_id}/{player_id}?protocol=delta，
+  - 连接或重新同步时发送一次完整快照：
+        {"type": "game_state", "version": 2, "seq": n, "data": {...}}
+  - 之后每步只发送事件，事件对所有人相同，seq 在房间内单调递增：
+        {"type": "event", "seq": n, "event": "play", "data": {"seat": 1, "cards": [...], ...}}
+        {"type": "event", "seq": n, "event": "pass", "data": {"seat": 1, "next": 2, "trickEnd": false}}
+        {"type": "event", "seq": n, "event": "round_end", "data": {...}}
+        {"type": "event", "seq": n, "event": "tribute", "data": {"tributes": [...], "antiTribute": false, ...}}
+        {"type": "event", "seq": n, "event": "tribute_return", "data": {"seat": 0, "to": 3, "cards": [...], ...}}
+    客户端收到 seat 等于自己 myIndex 的 play 事件时，从自己的手牌中移除这些牌。
+    新一局开始时先发送 tribute 事件（进贡，见 series.py），再发送新一局的完整快照，快照中的手牌已经进过贡；
+    之后每次还贡发送 tribute_return 事件，seat 从手牌中移除这些牌，to 加入这些牌。
+  - 客户端发现 seq 不连续时发送 {"action": "resync"} 重新获取快照。
+  - 断线重连时带上收到的最后一个 seq：/ws/{room_id}/{player_id}?protocol=delta&last_seq=n，
+    或在连接上发送 {"action": "resume", "seq": n}。房间保留最近 EVENT_BUFFER_SIZE（默认 64）个事件
+    （EventBuffer），错过的事件都还在时只补发这些事件，否则（错过太多、其间开始了新的一局或有玩家加入）发送完整快照。
+
+收到贡牌的玩家发送 {"action": "return_tribute", "cards": [一张牌]} 还贡，所有还贡完成之前不能出牌。
+两种协议下客户端都可以发送 {"action": "hint"} 获取当前局面的出牌提示（见 hints.py），
+回复 {"type": "hint", "seq": n, "data": {"hints": [...], "canPass": ..., "complete": ...}}，
+与 GET /game/hint/{room_id}/{player_id} 的结果相同。
+
+消息中的牌用 wire.CardList 表示，发送时按连接协商的编码格式展开（见 wire.py）。
+
+房间的状态版本在每个事件、玩家加入和新开一局时递增。快照按版本缓存：
+同一版本内公开部分对每种格式只编码一次，每个座位只额外编码自己的手牌，
+WebSocket 广播、重新同步和 GET /game/status 轮询共用同一份缓存，出牌提示也缓存在其中。
+"""
+import os
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from .cards import card_from_id
+from .game import GameState
+from .hints import suggest
+from .series import Series
+from . import wire
+from .wire import CardList
+
+PROTOCOL_VERSION = 2
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+PROTOCOLS = (SNAPSHOT, DELTA)
+
+EVENT_BUFFER_SIZE = int(os.environ.get("EVENT_BUFFER_SIZE", "64"))
+
+
+def next_seq(room: Dict) -> int:
+    """房间内单调递增的事件序号，每个事件都意味着状态发生了变化"""
+    room["seq"] = room.get("seq", 0) + 1
+    touch(room)
+    return room["seq"]
+
+
+def state_version(room: Dict) -> int:
+    return room.get("version", 0)
+
+
+def touch(room: Dict):
+    """房间状态发生变化（不伴随事件时需要显式调用），使快照缓存失效"""
+    room["version"] = state_version(room) + 1
+
+
+def cached(room: Dict, key: Tuple, build: Callable[[], Any]) -> Any:
+    """按房间状态版本缓存的值，版本变化后整体失效"""
+    cache = room.get("snapshot_cache")
+    version = state_version(room)
+    if cache is None or cache[0] != version:
+        cache = room["snapshot_cache"] = (version, {})
+        room["cache_bytes"] = 0
+    entries = cache[1]
+    value = entries.get(key)
+    if value is None:
+        value = entries[key] = build()
+        room["cache_bytes"] = room.get("cache_bytes", 0) + encoded_size(value)
+    return value
+
+
+def encoded_size(value: Any) -> int:
+    """缓存中编码结果的字节数（str 按字符数），其他值（如未编码的提示）不计入"""
+    if isinstance(value, wire.Fragment):
+        value = value.payload
+    return len(value) if isinstance(value, (str, bytes)) else 0
+
+
+def public_state(room: Dict, room_id: str) -> Dict[str, Any]:
+    """所有玩家共享的公开状态"""
+    game_state: GameState = room["game_state"]
+    return {
+        "roomId": room_id,
+        "players": room["players"],
+        "currentTurn": game_state.current_player,
+        "currentLevel": game_state.current_level,
+        "lastPlayedCards": CardList(game_state.last_played_cards) if game_state.last_played_cards else None,
+        "lastPlayedPlayer": game_state.last_played_player,
+        "playerHandsCount": [len(hand) for hand in game_state.players_hands],
+        "series": series_state(room["series"]) if "series" in room else None,
+    }
+
+
+def _transfers(entries) -> List[Dict[str, Any]]:
+    return [{"from": giver, "to": receiver, "cards": CardList([card_from_id(card_id)])}
+            for giver, receiver, card_id in entries]
+
+
+def _pending_returns(series: Series) -> List[int]:
+    return [receiver for receiver, _ in series.pending]
+
+
+def series_state(series: Series) -> Dict[str, Any]:
+    """两队的级别与本局的进贡、还贡（贡牌是公开的）"""
+    return {
+        "teamLevels": list(series.team_levels),
+        "tributes": _transfers(series.tributes),
+        "returns": _transfers(series.returns),
+        "pendingReturns": _pending_returns(series),
+        "antiTribute": series.anti_tribute,
+    }
+
+
+def snapshot(room: Dict, room_id: str, player_index: int) -> Dict[str, Any]:
+    """某位玩家视角的完整状态"""
+    game_state: GameState = room["game_state"]
+    data = public_state(room, room_id)
+    data["myIndex"] = player_index
+    data["myHand"] = CardList(game_state.players_hands[player_index])
+    return data
+
+
+def snapshot_message(room: Dict, room_id: str, player_index: int, protocol: str = SNAPSHOT) -> Dict[str, Any]:
+    message = {"type": "game_state", "data": snapshot(room, room_id, player_index)}
+    if protocol == DELTA:
+        message["version"] = PROTOCOL_VERSION
+        message["seq"] = room.get("seq", 0)
+    return message
+
+
+def _public_fragment(room: Dict, room_id: str, wire_format: str) -> wire.Fragment:
+    return cached(room, ("public", wire_format),
+                  lambda: wire.fields(public_state(room, room_id), wire_format))
+
+
+def _private_fragment(room: Dict, player_index: int, wire_format: str) -> wire.Fragment:
+    hand = room["game_state"].players_hands[player_index]
+    return wire.fields({"myIndex": player_index, "myHand": CardList(hand)}, wire_format)
+
+
+def encoded_snapshot(room: Dict, room_id: str, player_index: int,
+                     wire_format: str = wire.JSON) -> Union[str, bytes]:
+    """编码好的 snapshot()，与 wire.encode(snapshot(...)) 结果相同"""
+    def build():
+        return wire.join([_public_fragment(room, room_id, wire_format),
+                          _private_fragment(room, player_index, wire_format)], wire_format)
+    return cached(room, ("snapshot", wire_format, player_index), build)
+
+
+def encoded_snapshot_message(room: Dict, room_id: str, player_index: int, protocol: str = SNAPSHOT,
+                             wire_format: str = wire.JSON) -> Union[str, bytes]:
+    """编码好的 snapshot_message()，公开部分在同一版本内只编码一次"""
+    def build():
+        parts = [
+            wire.fields({"type": "game_state"}, wire_format),
+            wire.field("data", encoded_snapshot(room, room_id, player_index, wire_format), wire_format),
+        ]
+        if protocol == DELTA:
+            parts.append(wire.fields({"version": PROTOCOL_VERSION, "seq": room.get("seq", 0)}, wire_format))
+        return wire.join(parts, wire_format)
+    return cached(room, ("message", protocol, wire_format, player_index), build)
+
+
+def cached_value(room: Dict, key: Tuple) -> Any:
+    """当前状态版本下已经缓存的值，没有时返回 None"""
+    cache = room.get("snapshot_cache")
+    if cache is None or cache[0] != state_version(room):
+        return None
+    return cache[1].get(key)
+
+
+def encode_hint(seq: int, data: Dict, wire_format: str = wire.JSON) -> Union[str, bytes]:
+    return wire.encode({"type": "hint", "seq": seq, "data": data}, wire_format)
+
+
+def encoded_hint(room: Dict, player_index: int, wire_format: str = wire.JSON) -> Union[str, bytes]:
+    """编码好的出牌提示 {"type": "hint", "seq": n, "data": {...}}，同一状态版本内只计算一次
+
+    在事件循环中调用时先在线程池中算好提示并放入缓存（见 main.hint_payload），这里只负责编码。
+    """
+    def build():
+        data = cached(room, ("hint", player_index), lambda: suggest(room["game_state"], player_index))
+        return encode_hint(room.get("seq", 0), data, wire_format)
+    return cached(room, ("hint", player_index, wire_format), build)
+
+
+class EventBuffer:
+    """房间最近的事件（环形缓冲），断线重连时只补发错过的事件
+
+    只保存事件本身，补发时再按连接的格式编码：重连远少于广播，不值得为每个事件多存几份编码结果。
+    """
+
+    def __init__(self, floor: int, size: int = EVENT_BUFFER_SIZE):
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=size)
+        # 只补事件就能追上的最小 last_seq
+        self.floor = floor
+
+    def append(self, message: Dict[str, Any]):
+        if len(self.events) == self.events.maxlen:
+            # 最早的事件将被挤出，之后需要它的客户端只能重新获取快照
+            self.floor = self.events[0]["seq"]
+        self.events.append(message)
+
+    def barrier(self, seq: int):
+        """不伴随事件的状态变化（新的一局、玩家加入）之后调用：此前的 last_seq 都需要快照"""
+        self.events.clear()
+        self.floor = seq + 1
+
+    def since(self, last_seq: int, wire_format: str) -> Optional[List[Union[str, bytes]]]:
+        """last_seq 之后的全部事件（已编码），缓冲中已经没有全部错过的事件时返回 None"""
+        # 缓冲为空时没有能补发的事件，last_seq 最多只能是 floor 之前已经发出的序号（需要快照）
+        latest = self.events[-1]["seq"] if self.events else self.floor - 1
+        if last_seq < self.floor or last_seq > latest:
+            return None
+        return [wire.encode(event, wire_format) for event in self.events if event["seq"] > last_seq]
+
+
+def event_buffer(room: Dict) -> EventBuffer:
+    """房间的事件缓冲；从状态存储恢复的房间没有缓冲，重新创建时之前的 seq 都需要快照"""
+    buffer = room.get("events")
+    if buffer is None:
+        buffer = room["events"] = EventBuffer(room.get("seq", 0) + 1)
+    return buffer
+
+
+def event_message(room: Dict, event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    buffer = event_buffer(room)
+    message = {"type": "event", "seq": next_seq(room), "event": event, "data": data}
+    buffer.append(message)
+    return message
+
+
+def play_event(room: Dict, seat: int, cards: List) -> Dict[str, Any]:
+    """出牌事件，在 play_cards 成功之后生成"""
+    game_state: GameState = room["game_state"]
+    return event_message(room, "play", {
+        "seat": seat,
+        "cards": CardList(cards),
+        "cardType": game_state.last_played_type.value if game_state.last_played_type else None,
+        "handCount": len(game_state.players_hands[seat]),
+        "next": game_state.current_player,
+    })
+
+
+def pass_event(room: Dict, seat: int) -> Dict[str, Any]:
+    """过牌事件，trickEnd 为真时表示本轮结束、桌面已清空"""
+    game_state: GameState = room["game_state"]
+    return event_message(room, "pass", {
+        "seat": seat,
+        "next": game_state.current_player,
+        "trickEnd": game_state.last_played_cards is None,
+    })
+
+
+def round_end_event(room: Dict, result: Dict[str, Any]) -> Dict[str, Any]:
+    return event_message(room, "round_end", result)
+
+
+def tribute_event(room: Dict) -> Dict[str, Any]:
+    """新一局开始时的进贡事件，在 Series.start_round 之后生成"""
+    series: Series = room["series"]
+    return event_message(room, "tribute", {
+        "tributes": _transfers(series.tributes),
+        "antiTribute": series.anti_tribute,
+        "pendingReturns": _pending_returns(series),
+        "next": room["game_state"].current_player,
+    })
+
+
+def tribute_return_event(room: Dict, seat: int) -> Dict[str, Any]:
+    """还贡事件，在 Series.return_tribute 成功之后生成"""
+    series: Series = room["series"]
+    _, receiver, card_id = series.returns[-1]
+    return event_message(room, "tribute_return", {
+        "seat": seat,
+        "to": receiver,
+        "cards": CardList([card_from_id(card_id)]),
+        "pendingReturns": _pending_returns(series),
+    })
+
+
+def negotiate(requested: Optional[str]) -> str:
+    return requested if requested in PROTOCOLS else SNAPSHOT
@@ -0,0 +1,158 @@
+"""空闲房间与过期邀请的回收
+
+后台任务定期扫描：
+  - 没有玩家连接且超过 ROOM_IDLE_TTL 秒没有任何操作的房间（被放弃的房间）
+  - 一局结束后没有人再出牌、也没有玩家连接，超过 ROOM_FINISHED_TTL 秒的房间
+  - 房间数超过 MAX_ROOMS 时，按最近活动时间从旧到新回收没有玩家连接的房间（LRU）
+  - 过期的邀请链接，以及所属房间已经不存在的邀请链接
+有玩家连接的房间不会被回收。回收房间时取消房间的 AI 回合、关闭残留的连接，
+多 worker 部署时释放房间归属与保存的状态。
+
+每次扫描同时估计房间占用的字节数：缓存的编码结果在放入缓存时记下大小（protocol.cached），
+局面与事件缓冲需要序列化才能估计，只对至多 REAP_SAMPLE_SIZE 个随机抽取的房间计算再按房间数放大。
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+ROOM_IDLE_TTL = float(os.environ.get("ROOM_IDLE_TTL", "1800"))
+ROOM_FINISHED_TTL = float(os.environ.get("ROOM_FINISHED_TTL", "300"))
+MAX_ROOMS = int(os.environ.get("MAX_ROOMS", "10000"))
+REAP_INTERVAL = float(os.environ.get("REAP_INTERVAL", "30"))
+REAP_SAMPLE_SIZE = int(os.environ.get("REAP_SAMPLE_SIZE", "64"))
+
+IDLE = "idle"
+FINISHED = "finished"
+EVICTED = "evicted"
+
+
+def mark_active(room: Dict):
+    """房间有操作（出牌、加入、连接）时调用"""
+    room["last_active"] = time.monotonic()
+    room.pop("finished_at", None)
+
+
+def mark_finished(room: Dict):
+    """一局结束时调用，之后没有人出牌的房间按 ROOM_FINISHED_TTL 回收"""
+    room["last_active"] = room["finished_at"] = time.monotonic()
+
+
+def estimate_state_bytes(room: Dict) -> int:
+    """序列化后的局面、玩家与事件缓冲的大小"""
+    size = len(json.dumps(room["game_state"].to_dict())) + len(json.dumps(room["players"]))
+    events = room.get("events")
+    if events is not None:
+        size += sum(len(json.dumps(event, default=str)) for event in events.events)
+    return size
+
+
+def estimate_rooms_bytes(rooms: List[Dict], sample_size: int = REAP_SAMPLE_SIZE) -> int:
+    """所有房间占用内存的粗略估计：缓存的编码结果逐个房间累加，局面部分抽样估计"""
+    size = sum(room.get("cache_bytes", 0) for room in rooms)
+    if rooms and sample_size > 0:
+        sample = rooms if len(rooms) <= sample_size else random.sample(rooms, sample_size)
+        size += sum(estimate_state_bytes(room) for room in sample) * len(rooms) // len(sample)
+    return size
+
+
+class RoomReaper:
+    def __init__(self, rooms: Dict[str, Dict], invites: Dict[str, Dict],
+                 is_connected: Callable[[Dict], bool],
+                 remove_room: Callable[[str], Awaitable[None]],
+                 idle_ttl: float = ROOM_IDLE_TTL, finished_ttl: float = ROOM_FINISHED_TTL,
+                 max_rooms: int = MAX_ROOMS, interval: float = REAP_INTERVAL,
+                 sample_size: int = REAP_SAMPLE_SIZE, clock: Callable[[], float] = time.monotonic):
+        self.rooms = rooms
+        self.invites = invites
+        self.is_connected = is_connected
+        self.remove_room = remove_room
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self.max_rooms = max_rooms
+        self.interval = interval
+        self.sample_size = sample_size
+        # 与 mark_active / mark_finished 记录的时间同一时钟
+        self.clock = clock
+        self.rooms_reaped = {IDLE: 0, FINISHED: 0, EVICTED: 0}
+        self.invites_reaped = 0
+        self.bytes_retained = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("room reaper sweep failed")
+
+    def _expired(self, room: Dict, now: float) -> str:
+        finished_at = room.get("finished_at")
+        if finished_at is not None and now - finished_at > self.finished_ttl:
+            return FINISHED
+        if now - room.get("last_active", now) > self.idle_ttl:
+            return IDLE
+        return ""
+
+    async def sweep(self) -> List[str]:
+        """执行一次回收，返回被回收的房间"""
+        now = self.clock()
+        reaped: List[str] = []
+        idle: List[str] = []
+        for room_id, room in list(self.rooms.items()):
+            room.setdefault("last_active", now)
+            if self.is_connected(room):
+                continue
+            reason = self._expired(room, now)
+            if reason:
+                await self._reap(room_id, reason)
+                reaped.append(room_id)
+            else:
+                idle.append(room_id)
+
+        # 房间数超过上限时，回收最久没有活动的空闲房间
+        excess = len(self.rooms) - self.max_rooms
+        if excess > 0:
+            idle.sort(key=lambda room_id: self.rooms[room_id]["last_active"])
+            for room_id in idle[:excess]:
+                await self._reap(room_id, EVICTED)
+                reaped.append(room_id)
+
+        self._reap_invites()
+        self.bytes_retained = estimate_rooms_bytes(list(self.rooms.values()), self.sample_size)
+        return reaped
+
+    async def _reap(self, room_id: str, reason: str):
+        await self.remove_room(room_id)
+        self.rooms_reaped[reason] += 1
+        logger.info("reaped %s room %s", reason, room_id)
+
+    def _reap_invites(self):
+        now = datetime.now()
+        for token, link in list(self.invites.items()):
+            if now > link["expires_at"] or link["room_id"] not in self.rooms:
+                del self.invites[token]
+                self.invites_reaped += 1
+
+    def stats(self) -> Dict:
+        return {
+            "live_rooms": len(self.rooms),
+            "bytes_retained": self.bytes_retained,
+            "rooms_reaped": dict(self.rooms_reaped),
+            "invites_reaped": self.invites_reaped,
+        }
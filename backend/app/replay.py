@@ -0,0 +1,271 @@
+"""紧凑的对局回放格式与回放引擎
+
+一局牌只记录发牌种子、级别、首个出牌的座位、开局时的进贡与还贡和每一步 (座位, 出的牌)，
+手牌由种子重新发出，任意中间局面都可以重新推演出来。
+
+文件格式（只追加）：
+    文件头  b"GDRP" + 版本号（1 字节）
+    每局    长度（varint） + 内容
+    内容    种子（varint） 级别（1 字节） 首家（1 字节） 转移... 步骤...
+    转移    1 字节张数，之后每张 2 字节：给出者 << 2 | 收到者，牌面（进贡在前、还贡在后，见 series.py）
+    步骤    1 字节：座位 << 5 | 张数（0 表示过牌），之后每张牌 1 字节（牌面 0..53）
+版本 1 的文件没有转移部分，仍然可以读取。
+
+出的牌按牌面记录而不是按出牌枚举中的序号记录，因为玩家可以用任意花色组合出同一种牌，
+平均每步约 3 字节，一局约 300 字节。
+
+回放时每隔 checkpoint_interval 步保存一份局面，跳到任意一步只需要从最近的检查点开始推演。
+
+用法：
+    python -m app.replay games.gdrp                  # 列出所有局
+    python -m app.replay games.gdrp --round 3 --ply 40  # 打印第 3 局第 40 步之后的局面
+"""
+import argparse
+import sys
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .cards import CARDS, FACE_COUNT, MAX_LEVEL, MIN_LEVEL, Card, card_names
+from .dealing import make_deal, new_state
+from .game import GameState
+
+MAGIC = b"GDRP"
+FORMAT_VERSION = 2
+CHECKPOINT_INTERVAL = 16
+
+
+class ReplayError(Exception):
+    pass
+
+
+def write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ReplayError("truncated varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def deal(seed: int, level: int = 2, first: int = 0) -> GameState:
+    """由发牌种子得到一局的初始局面"""
+    return new_state(make_deal(seed), level, first)
+
+
+# 每一步：(座位, 牌面)，牌面为空表示过牌
+Step = Tuple[int, Tuple[int, ...]]
+# 开局时一张牌的转移：(给出者, 收到者, 牌面)
+Transfer = Tuple[int, int, int]
+
+
+class RoundRecord(NamedTuple):
+    seed: int
+    level: int
+    first: int
+    steps: List[Step]
+    transfers: Tuple[Transfer, ...] = ()
+
+    def play(self, seat: int, cards: Sequence[Card]):
+        self.steps.append((seat, tuple(card.face for card in cards)))
+
+    def pass_turn(self, seat: int):
+        self.steps.append((seat, ()))
+
+    def encode(self) -> bytes:
+        body = bytearray()
+        write_varint(body, self.seed)
+        body.append(self.level)
+        body.append(self.first)
+        body.append(len(self.transfers))
+        for giver, receiver, face in self.transfers:
+            body.append(giver << 2 | receiver)
+            body.append(face)
+        for seat, faces in self.steps:
+            body.append(seat << 5 | len(faces))
+            body.extend(faces)
+        out = bytearray()
+        write_varint(out, len(body))
+        return bytes(out + body)
+
+    @classmethod
+    def decode(cls, body: bytes, version: int = FORMAT_VERSION) -> "RoundRecord":
+        seed, pos = read_varint(body, 0)
+        header = 3 if version >= 2 else 2
+        if pos + header > len(body):
+            raise ReplayError("truncated round header")
+        level, first = body[pos], body[pos + 1]
+        if not MIN_LEVEL <= level <= MAX_LEVEL or first > 3:
+            raise ReplayError(f"bad round header: level={level} first={first}")
+        pos += 2
+        transfers: List[Transfer] = []
+        if version >= 2:
+            count = body[pos]
+            pos += 1
+            if pos + 2 * count > len(body):
+                raise ReplayError("truncated transfers")
+            for _ in range(count):
+                seats, face = body[pos], body[pos + 1]
+                transfers.append((seats >> 2 & 3, seats & 3, _check_face(face)))
+                pos += 2
+        steps: List[Step] = []
+        while pos < len(body):
+            head = body[pos]
+            count = head & 0x1F
+            if head >> 5 > 3 or pos + 1 + count > len(body):
+                raise ReplayError(f"bad step at byte {pos}")
+            steps.append((head >> 5, tuple(_check_face(face) for face in body[pos + 1:pos + 1 + count])))
+            pos += 1 + count
+        return cls(seed, level, first, steps, tuple(transfers))
+
+
+def _check_face(face: int) -> int:
+    if face >= FACE_COUNT:
+        raise ReplayError(f"bad card face {face}")
+    return face
+
+
+def new_round(seed: int, level: int = 2, first: int = 0, transfers: Sequence[Transfer] = ()) -> RoundRecord:
+    return RoundRecord(seed, level, first, [], tuple(transfers))
+
+
+def initial_state(record: RoundRecord) -> GameState:
+    """一局开始出牌时的局面：按种子发牌，再按记录进贡、还贡"""
+    state = deal(record.seed, record.level, record.first)
+    hands = state.players_hands
+    for giver, receiver, face in record.transfers:
+        card = CARDS[face]
+        if card not in hands[giver]:
+            raise ReplayError(f"seat {giver} cannot give {card}")
+        hands[giver].remove(card)
+        hands[receiver].add(card)
+    return state
+
+
+def apply_step(state: GameState, step: Step):
+    seat, faces = step
+    if faces:
+        ok = state.play_cards([CARDS[face] for face in faces], seat)
+    else:
+        ok = state.pass_turn(seat)
+    if not ok:
+        raise ReplayError(f"illegal step {step} for seat {state.current_player}")
+
+
+class Replay:
+    """一局的回放，state_at(ply) 返回执行完前 ply 步之后的局面"""
+
+    def __init__(self, record: RoundRecord, checkpoint_interval: int = CHECKPOINT_INTERVAL):
+        self.record = record
+        self.checkpoint_interval = checkpoint_interval
+        self._checkpoints: List[GameState] = [initial_state(record)]
+
+    def __len__(self):
+        return len(self.record.steps)
+
+    def state_at(self, ply: int) -> GameState:
+        if not 0 <= ply <= len(self):
+            raise IndexError(ply)
+        index = min(ply // self.checkpoint_interval, len(self._checkpoints) - 1)
+        state = self._checkpoints[index].clone()
+        for step_index in range(index * self.checkpoint_interval, ply):
+            apply_step(state, self.record.steps[step_index])
+            done = step_index + 1
+            if done % self.checkpoint_interval == 0 and done // self.checkpoint_interval == len(self._checkpoints):
+                self._checkpoints.append(state.clone())
+        return state
+
+    def final_state(self) -> GameState:
+        return self.state_at(len(self))
+
+    def states(self) -> Iterator[GameState]:
+        """依次产出每一步之后的局面（同一个对象，调用方需要时自行 clone）"""
+        state = self._checkpoints[0].clone()
+        yield state
+        for step in self.record.steps:
+            apply_step(state, step)
+            yield state
+
+
+class ReplayWriter:
+    """f 以追加方式打开（"a+b"）；追加到已有文件时，文件的版本必须与当前格式相同"""
+
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        f.seek(0, 2)
+        if f.tell() == 0:
+            f.write(MAGIC + bytes((FORMAT_VERSION,)))
+            return
+        f.seek(0)
+        header = f.read(5)
+        f.seek(0, 2)
+        if header != MAGIC + bytes((FORMAT_VERSION,)):
+            raise ReplayError("cannot append to a replay file of another version")
+
+    def write(self, record: RoundRecord):
+        self.f.write(record.encode())
+
+    def write_encoded(self, data: bytes):
+        """写入已经编码好的若干局（例如从子进程返回的数据）"""
+        self.f.write(data)
+
+
+def read_rounds(data: bytes) -> Iterator[RoundRecord]:
+    if len(data) < 5 or data[:4] != MAGIC:
+        raise ReplayError("not a replay file")
+    version = data[4]
+    if not 1 <= version <= FORMAT_VERSION:
+        raise ReplayError(f"unsupported replay version {version}")
+    pos = 5
+    while pos < len(data):
+        length, pos = read_varint(data, pos)
+        if pos + length > len(data):
+            raise ReplayError("truncated round")
+        yield RoundRecord.decode(data[pos:pos + length], version)
+        pos += length
+
+
+def load(path: str) -> List[RoundRecord]:
+    with open(path, "rb") as f:
+        return list(read_rounds(f.read()))
+
+
+def describe(state: GameState) -> str:
+    lines = [f"级别 {state.current_level}  轮到 {state.current_player}"]
+    if state.last_played_cards:
+        played = " ".join(card_names(state.last_played_cards))
+        lines.append(f"桌面 {played}（{state.last_played_player} 出）")
+    for seat, hand in enumerate(state.players_hands):
+        lines.append(f"{seat}: {' '.join(card_names(hand))}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="掼蛋对局回放")
+    parser.add_argument("path")
+    parser.add_argument("--round", type=int, help="局序号（从 0 开始）")
+    parser.add_argument("--ply", type=int, help="显示执行完前若干步之后的局面，默认为最后")
+    args = parser.parse_args(argv)
+
+    rounds = load(args.path)
+    if args.round is None:
+        for index, record in enumerate(rounds):
+            sys.stdout.write(f"{index}: seed={record.seed} level={record.level} steps={len(record.steps)}\n")
+        return
+    replay = Replay(rounds[args.round])
+    ply = len(replay) if args.ply is None else args.ply
+    sys.stdout.write(describe(replay.state_at(ply)) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""基于蒙特卡洛模拟的 AI
+
+每次决策时把其他三家的未知牌随机重新分配（确定化），对每个候选出牌
+用 AIPlayer 的规则策略模拟到第一位玩家出完牌为止，按本队先出完的比例打分。
+模拟在限定的时间预算内进行，可以分散到多个进程上执行。
+
+进程池在进程内共享，同时进行的多个决策按空闲的子进程分配任务（occupy / idle_workers）：
+超时没有返回的任务（进程间通信慢、子进程刚启动）仍然占着子进程，直到它结束之前不会再有任务排在它后面；
+没有空闲子进程、或者到时一个结果都没有收到时，用预留的时间在当前进程内模拟。
+服务启动时可以用 warm_pool 预先启动子进程，避免第一次决策时等待进程启动。
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .ai_player import AIPlayer
+from .cards import CARDS, Hand
+from .game import GameState, team_of
+
+DEFAULT_TIME_BUDGET = 0.5  # 每步的思考时间（秒）
+MAX_CANDIDATES_PER_TYPE = 4
+MAX_ROLLOUT_STEPS = 2000
+# 父进程等待子进程结果时，为进程间通信预留的时间
+_IPC_MARGIN = 0.05
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+# 已提交、还没有结束的任务（包括超时后被放弃的），每个占一个子进程
+_busy: Set[Future] = set()
+_lock = threading.RLock()
+
+# 候选出牌用 card id 元组表示，None 表示过牌
+Candidate = Optional[Tuple[int, ...]]
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """进程池在进程内共享，第一次使用时创建"""
+    global _pool, _pool_workers
+    with _lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+            _busy.clear()
+        return _pool
+
+
+def _ready() -> bool:
+    return True
+
+
+def warm_pool(workers: int):
+    """启动全部子进程并等待它们就绪（阻塞，在服务启动时于线程中调用）"""
+    if workers <= 1:
+        return
+    pool = get_pool(workers)
+    wait([pool.submit(_ready) for _ in range(workers)])
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            _pool_workers = 0
+            _busy.clear()
+
+
+def _release(future: Future):
+    with _lock:
+        _busy.discard(future)
+
+
+def occupy(future: Future):
+    """把提交到进程池的任务记为占用一个子进程，任务结束（或被取消）时自动释放"""
+    with _lock:
+        _busy.add(future)
+    future.add_done_callback(_release)
+
+
+def idle_workers() -> int:
+    """进程池中没有被任务占用的子进程数"""
+    with _lock:
+        return max(_pool_workers - len(_busy), 0)
+
+
+def determinize(state: GameState, player_index: int, rng: random.Random) -> GameState:
+    """保留自己的手牌，把其他玩家的牌混在一起后按原张数随机重新分配"""
+    world = state.clone()
+    unseen: List[int] = []
+    for i in range(4):
+        if i != player_index:
+            unseen.extend(card.id for card in state.players_hands[i])
+    rng.shuffle(unseen)
+    offset = 0
+    for i in range(4):
+        if i == player_index:
+            continue
+        size = len(state.players_hands[i])
+        hand = Hand()
+        for card_id in unseen[offset:offset + size]:
+            hand.add_id(card_id)
+        world.players_hands[i] = hand
+        offset += size
+    return world
+
+
+def apply_candidate(state: GameState, player_index: int, candidate: Candidate) -> bool:
+    if candidate is None:
+        return state.pass_turn(player_index)
+    return state.play_cards([CARDS[card_id] for card_id in candidate], player_index)
+
+
+def rollout(state: GameState, player_index: int) -> float:
+    """用规则策略模拟到第一位玩家出完牌，本队先出完记 1 分"""
+    for _ in range(MAX_ROLLOUT_STEPS):
+        if state.finish_order:
+            return 1.0 if team_of(state.finish_order[0]) == team_of(player_index) else 0.0
+        current = state.current_player
+        action = AIPlayer(state, current, plan=False).make_decision()
+        if action["action"] == "play":
+            state.play_cards(action["cards"], current)
+        else:
+            state.pass_turn(current)
+    return 0.5
+
+
+def run_playouts(state: GameState, player_index: int, candidates: Sequence[Candidate],
+                 budget: float, seed: int) -> Tuple[List[float], List[int]]:
+    """在 budget 秒内反复确定化并对每个候选出牌模拟一次，返回 (得分, 次数)
+
+    至少完成一次模拟（即使 budget 为 0），超出预算最多一次模拟的时间。
+    """
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + budget
+    scores = [0.0] * len(candidates)
+    visits = [0] * len(candidates)
+    while True:
+        world = determinize(state, player_index, rng)
+        for i, candidate in enumerate(candidates):
+            sim = world.clone()
+            if not apply_candidate(sim, player_index, candidate):
+                continue
+            scores[i] += rollout(sim, player_index)
+            visits[i] += 1
+            if time.perf_counter() >= deadline:
+                return scores, visits
+        if time.perf_counter() >= deadline:
+            return scores, visits
+
+
+class SearchAIPlayer:
+    """蒙特卡洛搜索 AI，接口与 AIPlayer 相同"""
+
+    def __init__(self, game_state: GameState, player_index: int,
+                 time_budget: float = DEFAULT_TIME_BUDGET, workers: Optional[int] = None,
+                 seed: Optional[int] = None):
+        self.game_state = game_state
+        self.player_index = player_index
+        self.hand = game_state.players_hands[player_index]
+        self.time_budget = time_budget
+        # workers 为 0 时在当前进程内模拟
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.rng = random.Random(seed)
+        self.stats: Dict = {}
+
+    def candidates(self) -> List[Candidate]:
+        """候选出牌：每种牌型最小的几手、最小的炸弹，以及过牌"""
+        result: List[Candidate] = []
+        per_type: Dict = {}
+        seen = set()
+        bomb_added = False
+        for move in self.game_state.iter_legal_moves(self.player_index):
+            combo = move.combo
+            if combo.is_bomb:
+                if bomb_added:
+                    continue
+                bomb_added = True
+            elif (combo.type, combo.key) in seen or per_type.get(combo.type, 0) >= MAX_CANDIDATES_PER_TYPE:
+                continue
+            seen.add((combo.type, combo.key))
+            per_type[combo.type] = per_type.get(combo.type, 0) + 1
+            result.append(tuple(card.id for card in move.cards))
+        if not self.game_state.is_leading(self.player_index):
+            result.append(None)
+        return result
+
+    def make_decision(self) -> Dict:
+        """做出决策，返回动作字典 {"action": "play/pass", "cards": [...]}"""
+        candidates = self.candidates()
+        if len(candidates) <= 1:
+            self.stats = {"playouts": 0, "elapsed": 0.0, "playouts_per_second": 0.0, "workers": 0}
+            return self._action(candidates[0] if candidates else None)
+
+        start = time.perf_counter()
+        scores, visits = self._search(candidates)
+        elapsed = time.perf_counter() - start
+        playouts = sum(visits)
+        self.stats = {
+            "playouts": playouts,
+            "elapsed": elapsed,
+            "playouts_per_second": playouts / elapsed if elapsed > 0 else 0.0,
+            "workers": self.workers,
+        }
+
+        # 没有模拟结果时退回到规则策略的选择（候选列表中的第一个）
+        best = 0
+        best_score = -1.0
+        for i in range(len(candidates)):
+            if visits[i] and scores[i] / visits[i] > best_score:
+                best, best_score = i, scores[i] / visits[i]
+        return self._action(candidates[best])
+
+    def _search(self, candidates: List[Candidate]) -> Tuple[List[float], List[int]]:
+        """整个搜索在 time_budget 内完成：子进程模拟 time_budget - 2 * margin 秒，
+        父进程最多等到 time_budget - margin，留出的 margin 在一个结果都没有收到时用于进程内模拟"""
+        state = self.game_state
+        deadline = time.perf_counter() + self.time_budget
+        margin = min(_IPC_MARGIN, self.time_budget / 4)
+        if self.workers <= 1:
+            return run_playouts(state, self.player_index, candidates, self.time_budget - margin,
+                                self.rng.getrandbits(32))
+
+        budget = self.time_budget - 2 * margin
+        scores = [0.0] * len(candidates)
+        visits = [0] * len(candidates)
+        futures: List[Future] = []
+        try:
+            pool = get_pool(self.workers)
+            with _lock:
+                for _ in range(min(self.workers, idle_workers())):
+                    future = pool.submit(run_playouts, state, self.player_index, candidates, budget,
+                                         self.rng.getrandbits(32))
+                    occupy(future)
+                    futures.append(future)
+        except RuntimeError:
+            # 进程池不可用（例如已经关闭）
+            pass
+
+        done, not_done = wait(futures, timeout=max(deadline - margin - time.perf_counter(), 0.0))
+        for future in not_done:
+            # 还在排队的任务直接取消；已经在运行的仍然占用子进程，结束后释放
+            future.cancel()
+        for future in done:
+            if future.exception() is not None:
+                continue
+            worker_scores, worker_visits = future.result()
+            for i in range(len(candidates)):
+                scores[i] += worker_scores[i]
+                visits[i] += worker_visits[i]
+        if not any(visits):
+            # 没有空闲的子进程或者一个结果都没有收到：用剩下的时间在当前进程内模拟
+            return run_playouts(state, self.player_index, candidates,
+                                max(deadline - time.perf_counter(), 0.0), self.rng.getrandbits(32))
+        return scores, visits
+
+    @staticmethod
+    def _action(candidate: Candidate) -> Dict:
+        if candidate is None:
+            return {"action": "pass"}
+        return {"action": "play", "cards": [CARDS[card_id] for card_id in candidate]}
@@ -0,0 +1,163 @@
+"""一场比赛（多局）的状态
+
+GameState 只描述一局牌；Series 保存在局与局之间延续的部分：
+  - 两队各自的级别 team_levels，每局打上一局获胜队伍的级（第一局打 2）
+  - 上一局的名次，用于下一局开始时进贡
+  - 本局的进贡与还贡记录
+打过 A 的一方赢得这一场（打 A 的队伍获胜且升级），之后两队从 2 重新开始。
+
+每局开始时（start_round）在原来的 GameState 上换上新的手牌，然后按上一局名次进贡：
+  - 单贡：末游把除逢人配外最大的一张牌贡给头游，末游先出；
+  - 双贡：头游、二游同队时两名对手各贡一张，大的给头游、小的给二游，贡给头游的人先出；
+  - 抗贡：进贡的一方共持有两张大王时不进贡，头游先出。
+收到贡牌的玩家要还给进贡者一张不大于 10 的牌（return_tribute），
+所有还贡完成之前（pending 不为空）不能出牌。
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .cards import BIG_JOKER, CARD_VALUES, MAX_LEVEL, MIN_LEVEL, Card, Hand, wild_face
+from .game import GameState, team_of, upgrade_levels
+
+# 还贡的牌不能大于 10
+MAX_RETURN_VALUE = 10
+
+
+def tribute_card(hand: Hand, level: int) -> Card:
+    """进贡的牌：除逢人配外最大的一张"""
+    values = CARD_VALUES[level]
+    wild = wild_face(level)
+    best = None
+    for card in hand:
+        if card.face != wild and (best is None or values[card.id] > values[best.id]):
+            best = card
+    return best
+
+
+def can_return(hand: Hand, card: Card, level: int) -> bool:
+    """card 能否用来还贡：不大于 10；手中没有这样的牌时可以还任意一张"""
+    if card not in hand:
+        return False
+    values = CARD_VALUES[level]
+    if values[card.id] <= MAX_RETURN_VALUE:
+        return True
+    return all(values[other.id] > MAX_RETURN_VALUE for other in hand)
+
+
+def return_card(hand: Hand, level: int) -> Card:
+    """自动还贡时选择的牌：最小的一张（逢人配除外）"""
+    values = CARD_VALUES[level]
+    wild = wild_face(level)
+    return min((card for card in hand if card.face != wild), key=lambda card: values[card.id])
+
+
+class Series:
+    def __init__(self):
+        self.team_levels = [MIN_LEVEL, MIN_LEVEL]
+        self.level_team = 0  # 本局打哪一队的级
+        self.last_positions: Optional[List[int]] = None  # 上一局的名次，新一场开始时为 None
+        self.tributes: List[Tuple[int, int, int]] = []  # 本局的进贡 (进贡者, 收贡者, card id)
+        self.returns: List[Tuple[int, int, int]] = []  # 本局的还贡 (还贡者, 收到者, card id)
+        self.pending: List[Tuple[int, int]] = []  # 还没有还贡的 (收贡者, 进贡者)
+        self.anti_tribute = False
+
+    @property
+    def level(self) -> int:
+        """本局的级别"""
+        return self.team_levels[self.level_team]
+
+    def finish_round(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """记录一局的结果（GameState.check_game_end 的返回值），更新获胜队伍的级别
+
+        结果中的 new_level 改为获胜队伍升级后的级别，并附上 teamLevels；
+        打 A 的队伍获胜时附上 matchWinner，下一局开始新的一场。
+        """
+        positions = result["positions"]
+        winner = result["winner_team"]
+        upgrade = upgrade_levels(positions)
+        # 只有打自己的 A 并获胜才算打过 A；在对方的级别上获胜只是升到 A
+        finished = self.level_team == winner and self.team_levels[winner] == MAX_LEVEL and upgrade > 0
+        self.team_levels[winner] = min(self.team_levels[winner] + upgrade, MAX_LEVEL)
+        self.level_team = winner
+        self.last_positions = list(positions)
+        result["new_level"] = self.team_levels[winner]
+        result["teamLevels"] = list(self.team_levels)
+        if finished:
+            result["matchWinner"] = winner
+            self.team_levels = [MIN_LEVEL, MIN_LEVEL]
+            self.level_team = 0
+            self.last_positions = None
+        return result
+
+    def start_round(self, state: GameState, deal_hands: Sequence[Hand]):
+        """在 state 上开始下一局并进贡；deal_hands 为新发的四手牌（dealing.Deal.hands）"""
+        state.reset_round(deal_hands, self.level)
+        self.tributes.clear()
+        self.returns.clear()
+        self.pending.clear()
+        self.anti_tribute = False
+        positions = self.last_positions
+        if positions is None:
+            return
+        if team_of(positions[0]) == team_of(positions[1]):
+            givers, receivers = [positions[3], positions[2]], positions[:2]
+        else:
+            givers, receivers = [positions[3]], positions[:1]
+        hands = state.players_hands
+        if sum(hands[seat].rank_counts[BIG_JOKER] for seat in givers) == 2:
+            self.anti_tribute = True
+            state.current_player = positions[0]
+            return
+        values = CARD_VALUES[state.current_level]
+        cards = [(seat, tribute_card(hands[seat], state.current_level)) for seat in givers]
+        # 大的贡牌给头游，一样大时末游的给头游（sorted 是稳定的）
+        cards.sort(key=lambda item: -values[item[1].id])
+        for (giver, card), receiver in zip(cards, receivers):
+            hands[giver].remove(card)
+            hands[receiver].add(card)
+            self.tributes.append((giver, receiver, card.id))
+            self.pending.append((receiver, giver))
+        state.current_player = cards[0][0]
+
+    def return_tribute(self, state: GameState, seat: int, card: Card) -> bool:
+        """seat 把 card 还给向他进贡的玩家，不合规则时返回 False"""
+        for index, (receiver, giver) in enumerate(self.pending):
+            if receiver == seat:
+                break
+        else:
+            return False
+        hand = state.players_hands[seat]
+        if not can_return(hand, card, state.current_level):
+            return False
+        hand.remove(card)
+        state.players_hands[giver].add(card)
+        del self.pending[index]
+        self.returns.append((seat, giver, card.id))
+        return True
+
+    def transfers(self) -> List[Tuple[int, int, int]]:
+        """本局开局时的牌的转移 (给出者, 收到者, card id)，进贡在前、还贡在后（与 replay.RoundRecord 相同）"""
+        return self.tributes + self.returns
+
+    def to_dict(self) -> Dict:
+        return {
+            "teamLevels": list(self.team_levels),
+            "levelTeam": self.level_team,
+            "lastPositions": self.last_positions,
+            "tributes": [list(t) for t in self.tributes],
+            "returns": [list(r) for r in self.returns],
+            "pending": [list(p) for p in self.pending],
+            "anti": self.anti_tribute,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Series":
+        series = cls()
+        series.team_levels = list(data["teamLevels"])
+        series.level_team = data["levelTeam"]
+        series.last_positions = data["lastPositions"]
+        series.tributes = [tuple(t) for t in data["tributes"]]
+        series.returns = [tuple(r) for r in data["returns"]]
+        series.pending = [tuple(p) for p in data["pending"]]
+        series.anti_tribute = data["anti"]
+        return series
+
@@ -0,0 +1,223 @@
+"""无界面批量自我对局
+
+不经过 WebSocket、不等待，直接驱动 GameState 与 AI 完成整场比赛（多局升级与进贡，规则与服务端相同），
+用进程池并行，每场比赛的随机种子由总种子和比赛序号确定，结果可以复现。
+
+每局用单独的发牌种子发牌，--replays 可以把所有局（连同进贡与还贡）按回放格式（见 replay.py）保存下来。
+
+用法：
+    python -m app.simulator --games 10000 --workers 8 --seed 1 --output results.jsonl
+    python -m app.simulator --games 100 --replays games.gdrp
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from .ai_player import AIPlayer
+from .cards import CARD_FACE
+from .dealing import make_deal
+from .game import GameState
+from .replay import ReplayWriter, RoundRecord, deal, new_round
+from .search_ai import SearchAIPlayer
+from .series import Series, return_card
+
+MAX_ROUNDS = 100
+MAX_MOVES_PER_ROUND = 5000
+
+
+def game_seed(base_seed: int, game_index: int) -> int:
+    """每场比赛的种子只取决于总种子和比赛序号，与进程数无关"""
+    return (base_seed * 1_000_003 + game_index) & 0xFFFFFFFF
+
+
+def make_ai(state: GameState, seat: int, search_seats: Sequence[int],
+            time_budget: float, rng: random.Random):
+    if seat in search_seats:
+        return SearchAIPlayer(state, seat, time_budget=time_budget, workers=0,
+                              seed=rng.getrandbits(32))
+    return AIPlayer(state, seat)
+
+
+def play_out(state: GameState, rng: random.Random, search_seats: Sequence[int] = (),
+             time_budget: float = 0.0, log: Optional[RoundRecord] = None) -> Dict:
+    """从 state 当前的局面打完一局，返回名次、获胜队伍、新的级别和出牌步数；log 不为空时记录每一步"""
+    level = state.current_level
+    moves = 0
+    result = None
+    while result is None and moves < MAX_MOVES_PER_ROUND:
+        seat = state.current_player
+        action = make_ai(state, seat, search_seats, time_budget, rng).make_decision()
+        if action["action"] == "play":
+            state.play_cards(action["cards"], seat)
+            if log is not None:
+                log.play(seat, action["cards"])
+        else:
+            state.pass_turn(seat)
+            if log is not None:
+                log.pass_turn(seat)
+        moves += 1
+        result = state.check_game_end()
+    if result is None:
+        result = {"positions": None, "winner_team": None, "new_level": level}
+    result["moves"] = moves
+    if log is not None:
+        result["replay"] = log
+    return result
+
+
+def play_round(level: int, rng: random.Random, search_seats: Sequence[int] = (),
+               time_budget: float = 0.0, record: bool = False) -> Dict:
+    """单独打一局（不进贡），record 为真时附带本局的回放记录"""
+    seed = rng.getrandbits(32)
+    log = new_round(seed, level) if record else None
+    return play_out(deal(seed, level), rng, search_seats, time_budget, log)
+
+
+def play_game(game_index: int, base_seed: int, search_seats: Sequence[int] = (),
+              time_budget: float = 0.0, max_rounds: int = MAX_ROUNDS, record: bool = False) -> Dict:
+    """打一整场比赛，规则与服务端相同（series.Series）：两队各自升级，每局开始时进贡、AI 自动还贡，
+    打过自己的 A 的一方获胜；record 为真时附带编码好的各局回放"""
+    seed = game_seed(base_seed, game_index)
+    rng = random.Random(seed)
+    series = Series()
+    state = GameState()
+    rounds: List[Dict] = []
+    winner_team = None
+    for _ in range(max_rounds):
+        deal_seed = rng.getrandbits(32)
+        series.start_round(state, make_deal(deal_seed).hands)
+        for receiver, _ in list(series.pending):
+            card = return_card(state.players_hands[receiver], state.current_level)
+            series.return_tribute(state, receiver, card)
+        log = None
+        if record:
+            transfers = [(giver, receiver, CARD_FACE[card_id]) for giver, receiver, card_id in series.transfers()]
+            log = new_round(deal_seed, state.current_level, state.current_player, transfers)
+        result = play_out(state, rng, search_seats, time_budget, log)
+        rounds.append(result)
+        if result["winner_team"] is None:
+            break
+        series.finish_round(result)
+        if "matchWinner" in result:
+            winner_team = result["matchWinner"]
+            break
+    summary = {
+        "game": game_index,
+        "seed": seed,
+        "winner_team": winner_team,
+        "team_levels": rounds[-1].get("teamLevels", list(series.team_levels)),
+        "rounds": len(rounds),
+        "moves": sum(r["moves"] for r in rounds),
+        "first_places": [r["positions"][0] for r in rounds if r["positions"]],
+    }
+    if record:
+        summary["replay"] = b"".join(r["replay"].encode() for r in rounds)
+    return summary
+
+
+def _play_games(args) -> List[Dict]:
+    game_indices, base_seed, search_seats, time_budget, max_rounds, record = args
+    return [play_game(i, base_seed, search_seats, time_budget, max_rounds, record) for i in game_indices]
+
+
+def run(games: int, workers: int = 1, base_seed: int = 0, search_seats: Sequence[int] = (),
+        time_budget: float = 0.05, max_rounds: int = MAX_ROUNDS,
+        chunk_size: int = 16, record: bool = False) -> Iterable[Dict]:
+    """逐个产出每场比赛的结果，workers 大于 1 时使用进程池"""
+    chunks = [
+        (range(start, min(start + chunk_size, games)), base_seed, tuple(search_seats),
+         time_budget, max_rounds, record)
+        for start in range(0, games, chunk_size)
+    ]
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _play_games(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(_play_games, chunks):
+            yield from results
+
+
+def summarize(results: Iterable[Dict], elapsed: Optional[float] = None) -> Dict:
+    """汇总统计：各队胜率、各座位头游率、平均局数与步数"""
+    games = 0
+    rounds = 0
+    moves = 0
+    team_wins = [0, 0]
+    undecided = 0
+    first_places = [0, 0, 0, 0]
+    for result in results:
+        games += 1
+        rounds += result["rounds"]
+        moves += result["moves"]
+        if result["winner_team"] is None:
+            undecided += 1
+        else:
+            team_wins[result["winner_team"]] += 1
+        for seat in result["first_places"]:
+            first_places[seat] += 1
+    summary = {
+        "games": games,
+        "rounds": rounds,
+        "undecided": undecided,
+        "team_win_rate": [w / games if games else 0.0 for w in team_wins],
+        "seat_first_place_rate": [f / rounds if rounds else 0.0 for f in first_places],
+        "avg_rounds_per_game": rounds / games if games else 0.0,
+        "avg_moves_per_game": moves / games if games else 0.0,
+        "avg_moves_per_round": moves / rounds if rounds else 0.0,
+    }
+    if elapsed is not None:
+        summary["elapsed"] = elapsed
+        summary["games_per_second"] = games / elapsed if elapsed > 0 else 0.0
+    return summary
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="掼蛋 AI 批量自我对局")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--search-seats", default="", help="使用搜索 AI 的座位，例如 0,2")
+    parser.add_argument("--time-budget", type=float, default=0.05, help="搜索 AI 每步的时间（秒）")
+    parser.add_argument("--max-rounds", type=int, default=MAX_ROUNDS)
+    parser.add_argument("--output", help="逐场结果输出文件（JSON Lines）")
+    parser.add_argument("--summary", help="汇总统计输出文件（JSON），默认打印到标准输出")
+    parser.add_argument("--replays", help="把所有局的回放追加写入该文件")
+    args = parser.parse_args(argv)
+
+    search_seats = tuple(int(s) for s in args.search_seats.split(",") if s.strip())
+    start = time.perf_counter()
+    collected: List[Dict] = []
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    replays = open(args.replays, "a+b") if args.replays else None
+    writer = ReplayWriter(replays) if replays else None
+    try:
+        for result in run(args.games, args.workers, args.seed, search_seats,
+                          args.time_budget, args.max_rounds, record=writer is not None):
+            if writer:
+                writer.write_encoded(result.pop("replay"))
+            collected.append(result)
+            if out:
+                out.write(json.dumps(result) + "\n")
+    finally:
+        if out:
+            out.close()
+        if replays:
+            replays.close()
+    summary = summarize(collected, time.perf_counter() - start)
+
+    text = json.dumps(summary, indent=2, ensure_ascii=False)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""观战
+
+观战者连接 /watch/{room_id}?format=json|ids|msgpack，只收到公开信息：
+  - 连接时收到观战快照 {"type": "game_state", "seq": n, "data": {...}}（protocol.public_state）
+  - 之后收到与增量协议相同的公开事件（play / pass / round_end / tribute / tribute_return），
+    新一局开始和玩家加入时收到新的观战快照
+  - 发送 {"action": "resync"} 重新获取快照
+
+每个有观战者的房间有一个 Channel。房间的每个事件发布到频道时只记下当时的公开状态并立即返回，
+由频道自己的任务在 SPECTATOR_DELAY 秒之后（默认 0，创建房间时可以用 spectator_delay 单独设置）放出：
+每种编码格式只编码一次，放入所有观战连接的发送队列，不为观战者逐个生成快照，
+观战人数不影响玩家操作的处理时间。
+观战人数超过 SPECTATOR_SAMPLE_THRESHOLD（默认 200）时改为抽样：不再逐个转发事件，
+每 SPECTATOR_SAMPLE_INTERVAL 秒（默认 1）发送一次最新的观战快照。
+
+多 worker 部署时频道在房间的归属 worker 上。其他 worker 上的观战者由该 worker 按房间和格式汇总，
+归属 worker 对每个 worker 的每种格式只转发一份（RelayWatcher），再由该 worker 分发给本地的观战连接。
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, Union
+
+from .metrics import stage
+from .protocol import public_state
+from .wire import encode
+
+SPECTATOR_DELAY = float(os.environ.get("SPECTATOR_DELAY", "0"))
+SPECTATOR_SAMPLE_THRESHOLD = int(os.environ.get("SPECTATOR_SAMPLE_THRESHOLD", "200"))
+SPECTATOR_SAMPLE_INTERVAL = float(os.environ.get("SPECTATOR_SAMPLE_INTERVAL", "1.0"))
+
+
+def spectator_view(room: Dict, room_id: str) -> Dict[str, Any]:
+    """此刻的公开状态；玩家列表复制一份，延迟放出时不会提前看到之后加入的玩家"""
+    view = public_state(room, room_id)
+    view["players"] = list(view["players"])
+    return view
+
+
+def view_message(seq: int, view: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "game_state", "seq": seq, "data": view}
+
+
+class RelayWatcher:
+    """归属 worker 上代表另一个 worker 上某种格式的全部观战者，接口与 ClientConnection 相同"""
+
+    def __init__(self, cluster, worker: str, room_id: str, wire_format: str, audience: int):
+        self.cluster = cluster
+        self.worker = worker
+        self.room_id = room_id
+        self.connection_id = f"relay:{worker}:{wire_format}"
+        self.wire_format = wire_format
+        self.audience = audience
+        self.closed = False
+        self.closing = False
+
+    async def send_encoded(self, payload: Union[str, bytes]):
+        if not self.closed:
+            self.cluster.notify(self.worker, "spectate_deliver", room_id=self.room_id,
+                                wire_format=self.wire_format, data=payload)
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        self.cluster.notify(self.worker, "spectate_close", room_id=self.room_id,
+                            wire_format=self.wire_format, code=code)
+
+
+class Channel:
+    """一个房间的观战频道"""
+
+    def __init__(self, delay: float = SPECTATOR_DELAY, sample_threshold: int = SPECTATOR_SAMPLE_THRESHOLD,
+                 sample_interval: float = SPECTATOR_SAMPLE_INTERVAL, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep):
+        self.delay = delay
+        self.sample_threshold = sample_threshold
+        self.sample_interval = sample_interval
+        # 延迟放出与抽样使用的时钟，两者需要一致
+        self.clock = clock
+        self.sleep = sleep
+        self.watchers: Dict[str, Any] = {}  # connection_id -> ClientConnection / RelayWatcher
+        self.seq = 0
+        self.view: Optional[Dict[str, Any]] = None  # 观战者当前看到的公开状态（已放出的）
+        self.sampled = False
+        self._view_payloads: Dict[str, Union[str, bytes]] = {}
+        self._delayed: Deque[Tuple[float, int, Optional[Dict[str, Any]], Dict[str, Any]]] = deque()
+        self._delay_task: Optional[asyncio.Task] = None
+        self._sample_task: Optional[asyncio.Task] = None
+        self._stale = False  # 抽样模式下有还没有发出的变化
+
+    @property
+    def audience(self) -> int:
+        return sum(getattr(watcher, "audience", 1) for watcher in self.watchers.values())
+
+    def view_payload(self, wire_format: str) -> Optional[Union[str, bytes]]:
+        """编码好的当前观战快照，同一快照每种格式只编码一次"""
+        if self.view is None:
+            return None
+        payload = self._view_payloads.get(wire_format)
+        if payload is None:
+            payload = self._view_payloads[wire_format] = encode(view_message(self.seq, self.view), wire_format)
+        return payload
+
+    def publish(self, seq: int, message: Optional[Dict[str, Any]], view: Dict[str, Any]):
+        """发布一个公开事件（message 为 None 时发布新的观战快照），view 为事件之后的公开状态"""
+        self._delayed.append((self.clock() + self.delay, seq, message, view))
+        if self._delay_task is None:
+            self._delay_task = asyncio.ensure_future(self._run_delayed())
+
+    async def _run_delayed(self):
+        try:
+            while self._delayed:
+                wait = self._delayed[0][0] - self.clock()
+                if wait > 0:
+                    await self.sleep(wait)
+                while self._delayed and self._delayed[0][0] <= self.clock():
+                    _, seq, message, view = self._delayed.popleft()
+                    await self._release(seq, message, view)
+        finally:
+            self._delay_task = None
+
+    async def _release(self, seq: int, message: Optional[Dict[str, Any]], view: Dict[str, Any]):
+        self.seq = seq
+        self.view = view
+        self._view_payloads = {}
+        if self.sampled:
+            self._stale = True
+            return
+        if message is None:
+            await self._fan_out(self.view_payload)
+        else:
+            encoded: Dict[str, Union[str, bytes]] = {}
+
+            def payload(wire_format: str) -> Union[str, bytes]:
+                if wire_format not in encoded:
+                    encoded[wire_format] = encode(message, wire_format)
+                return encoded[wire_format]
+            await self._fan_out(payload)
+
+    async def _fan_out(self, payload):
+        with stage("spectate"):
+            for watcher in list(self.watchers.values()):
+                if not (watcher.closed or watcher.closing):
+                    await watcher.send_encoded(payload(watcher.wire_format))
+
+    async def add(self, watcher):
+        self.watchers[watcher.connection_id] = watcher
+        await self._update_mode()
+
+    async def remove(self, connection_id: str):
+        self.watchers.pop(connection_id, None)
+        await self._update_mode()
+
+    async def _update_mode(self):
+        sampled = self.audience > self.sample_threshold
+        if sampled == self.sampled:
+            return
+        self.sampled = sampled
+        if sampled:
+            self._sample_task = asyncio.ensure_future(self._run_sampler())
+            return
+        self._sample_task.cancel()
+        self._sample_task = None
+        # 恢复逐个转发事件前先发送最新的快照，补上抽样期间没有发出的事件
+        if self._stale:
+            self._stale = False
+            await self._fan_out(self.view_payload)
+
+    async def _run_sampler(self):
+        while True:
+            await self.sleep(self.sample_interval)
+            if self._stale:
+                self._stale = False
+                await self._fan_out(self.view_payload)
+
+    async def close(self):
+        for task in (self._delay_task, self._sample_task):
+            if task is not None:
+                task.cancel()
+        self._delay_task = self._sample_task = None
+        watchers, self.watchers = self.watchers, {}
+        for watcher in watchers.values():
+            await watcher.close()
+
+
+class SpectatorHub:
+    def __init__(self, cluster=None):
+        self.cluster = cluster
+        self.channels: Dict[str, Channel] = {}
+        # 本 worker 上观看其他 worker 的房间的连接：(room_id, 格式) -> {connection_id: 连接}
+        self.relays: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def audience(self) -> int:
+        """连接在本 worker 上的观战者人数"""
+        local = sum(1 for channel in self.channels.values() for watcher in channel.watchers.values()
+                    if not isinstance(watcher, RelayWatcher))
+        return local + sum(len(connections) for connections in self.relays.values())
+
+    def _channel(self, room: Dict, room_id: str) -> Channel:
+        channel = self.channels.get(room_id)
+        if channel is None:
+            channel = self.channels[room_id] = Channel(room.get("spectator_delay", SPECTATOR_DELAY))
+            # 频道的第一份快照与之后的事件一样按延迟放出，放出时发给所有观战者
+            channel.publish(room.get("seq", 0), None, spectator_view(room, room_id))
+        return channel
+
+    def publish(self, room: Dict, room_id: str, event: Optional[Dict[str, Any]] = None):
+        """房间状态变化后调用：event 为公开事件，None 表示发送新的观战快照；没有观战者时什么都不做"""
+        channel = self.channels.get(room_id)
+        if channel is not None:
+            channel.publish(room.get("seq", 0), event, spectator_view(room, room_id))
+
+    async def watch(self, room: Dict, room_id: str, connection):
+        channel = self._channel(room, room_id)
+        await channel.add(connection)
+        await self.resync(room_id, connection)
+
+    async def unwatch(self, room_id: str, connection_id: str):
+        channel = self.channels.get(room_id)
+        if channel is None:
+            return
+        await channel.remove(connection_id)
+        if not channel.watchers:
+            await channel.close()
+            del self.channels[room_id]
+
+    async def resync(self, room_id: str, connection):
+        channel = self.channels.get(room_id)
+        payload = channel.view_payload(connection.wire_format) if channel is not None else None
+        if payload is not None:
+            await connection.send_encoded(payload)
+
+    async def close_room(self, room_id: str):
+        channel = self.channels.pop(room_id, None)
+        if channel is not None:
+            await channel.close()
+
+    # ---- 多 worker：归属 worker 一侧 ----
+
+    async def watch_relay(self, room: Dict, room_id: str, worker: str, wire_format: str,
+                          audience: int) -> Optional[Union[str, bytes]]:
+        """另一个 worker 上的观战者加入（audience 为该 worker 上这种格式的观战人数），返回当前快照"""
+        channel = self._channel(room, room_id)
+        watcher = channel.watchers.get(f"relay:{worker}:{wire_format}")
+        if watcher is None:
+            watcher = RelayWatcher(self.cluster, worker, room_id, wire_format, audience)
+        watcher.audience = audience
+        await channel.add(watcher)
+        return channel.view_payload(wire_format)
+
+    async def unwatch_relay(self, room_id: str, worker: str, wire_format: str, audience: int):
+        channel = self.channels.get(room_id)
+        connection_id = f"relay:{worker}:{wire_format}"
+        if channel is None or connection_id not in channel.watchers:
+            return
+        if audience > 0:
+            channel.watchers[connection_id].audience = audience
+            await channel._update_mode()
+        else:
+            await self.unwatch(room_id, connection_id)
+
+    # ---- 多 worker：观战者所在 worker 一侧 ----
+
+    async def watch_remote(self, owner: str, room_id: str, connection):
+        local = self.relays.setdefault((room_id, connection.wire_format), {})
+        local[connection.connection_id] = connection
+        await self.resync_remote(owner, room_id, connection)
+
+    async def resync_remote(self, owner: str, room_id: str, connection):
+        local = self.relays.get((room_id, connection.wire_format), {})
+        payload = await self.cluster.call(owner, "watch", room_id=room_id, wire_format=connection.wire_format,
+                                          audience=len(local))
+        if payload is not None:
+            await connection.send_encoded(payload)
+
+    def unwatch_remote(self, owner: str, room_id: str, connection):
+        key = (room_id, connection.wire_format)
+        local = self.relays.get(key)
+        if local is None or local.pop(connection.connection_id, None) is None:
+            return
+        if not local:
+            del self.relays[key]
+        self.cluster.notify(owner, "unwatch", room_id=room_id, wire_format=connection.wire_format,
+                            audience=len(local))
+
+    async def deliver(self, room_id: str, wire_format: str, payload: Union[str, bytes]):
+        """归属 worker 转发来的一份消息，分发给本地所有这种格式的观战连接"""
+        for connection in list(self.relays.get((room_id, wire_format), {}).values()):
+            await connection.send_encoded(payload)
+
+    async def close_relay(self, room_id: str, wire_format: str, code: int = 1000):
+        local = self.relays.pop((room_id, wire_format), {})
+        for connection in local.values():
+            await connection.close(code)
@@ -0,0 +1,324 @@
+"""可替换的状态存储
+
+多个 worker 进程通过状态存储共享房间归属、序列化的房间状态，并通过发布/订阅
+在 worker 之间转发消息。后端由 STATE_STORE 配置：
+  - "memory://"：进程内的实现，多个 Cluster 实例共享同一个 MemoryStore 即可
+    在单个进程中模拟多 worker，供测试使用
+  - "file:///path/to/dir"：基于文件的实现，同一台机器上的多个 worker 共享一个目录
+  - "redis://host:6379/0"：使用 Redis 协议（RESP）的服务器，直接通过 asyncio 连接，不需要额外依赖
+
+所有值都是 bytes，ttl 以秒为单位。
+"""
+import asyncio
+import os
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+
+class StateStore:
+    """状态存储接口"""
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def set_if_absent(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        """键不存在时写入并返回 True，用于抢占房间归属"""
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, message: bytes):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        """订阅频道，返回时订阅已经生效，之后发布的消息都能从返回的迭代器读到"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryStore(StateStore):
+    def __init__(self):
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._channels: Dict[str, List[asyncio.Queue]] = {}
+
+    def _live(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._live(key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    async def set_if_absent(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        if self._live(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    async def publish(self, channel: str, message: bytes):
+        for queue in self._channels.get(channel, ()):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._channels.setdefault(channel, []).append(queue)
+
+        async def messages():
+            try:
+                while True:
+                    yield await queue.get()
+            finally:
+                self._channels[channel].remove(queue)
+        return messages()
+
+
+class FileStore(StateStore):
+    """每个键一个文件；发布的消息写入频道目录，由订阅者轮询读取后删除
+
+    频道只支持单个订阅者，集群中每个 worker 只订阅自己的频道，满足这一要求。
+    """
+
+    def __init__(self, root: str, poll_interval: float = 0.02):
+        self.root = root
+        self._counter = 0
+        self.poll_interval = poll_interval
+        os.makedirs(os.path.join(root, "keys"), exist_ok=True)
+        os.makedirs(os.path.join(root, "channels"), exist_ok=True)
+
+    def _key_path(self, key: str) -> str:
+        return os.path.join(self.root, "keys", key.replace("/", "_"))
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._key_path(key), "rb") as f:
+                header = f.readline()
+                value = f.read()
+        except FileNotFoundError:
+            return None
+        expires_at = float(header)
+        if expires_at and time.time() >= expires_at:
+            self._remove(self._key_path(key))
+            return None
+        return value
+
+    @staticmethod
+    def _header(ttl: Optional[float]) -> bytes:
+        return b"%f\n" % (time.time() + ttl if ttl else 0.0)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._read(key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        path = self._key_path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self._header(ttl) + value)
+        os.replace(tmp, path)
+
+    async def set_if_absent(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        # 过期的键先被 _read 删除；内容先完整写入临时文件，再用 link 原子地放到键的位置
+        # （目标已存在时失败），其他进程不会读到只写了一半的文件
+        if self._read(key) is not None:
+            return False
+        path = self._key_path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self._header(ttl) + value)
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            return False
+        finally:
+            self._remove(tmp)
+        return True
+
+    async def delete(self, key: str):
+        self._remove(self._key_path(key))
+
+    def _channel_dir(self, channel: str) -> str:
+        path = os.path.join(self.root, "channels", channel.replace("/", "_"))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    async def publish(self, channel: str, message: bytes):
+        directory = self._channel_dir(channel)
+        # 同一进程内按发布顺序命名，订阅者按文件名顺序读取
+        self._counter += 1
+        name = f"{time.time_ns():020d}-{os.getpid()}-{self._counter:012d}"
+        tmp = os.path.join(directory, name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(message)
+        os.replace(tmp, os.path.join(directory, name + ".msg"))
+
+    async def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        directory = self._channel_dir(channel)
+
+        async def messages():
+            while True:
+                names = sorted(n for n in os.listdir(directory) if n.endswith(".msg"))
+                if not names:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                for name in names:
+                    path = os.path.join(directory, name)
+                    with open(path, "rb") as f:
+                        message = f.read()
+                    self._remove(path)
+                    yield message
+        return messages()
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisStore(StateStore):
+    """最小的 RESP 客户端，命令使用一个连接，每个订阅使用单独的连接"""
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._conn: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip(reader, writer, "AUTH", self.password)
+        if self.db:
+            await self._roundtrip(reader, writer, "SELECT", str(self.db))
+        return reader, writer
+
+    @staticmethod
+    def _pack(*args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    @classmethod
+    async def _read_reply(cls, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("redis connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RedisError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [await cls._read_reply(reader) for _ in range(length)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    async def _roundtrip(self, reader, writer, *args):
+        writer.write(self._pack(*args))
+        await writer.drain()
+        return await self._read_reply(reader)
+
+    async def _command(self, *args):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._conn is None:
+                self._conn = await self._connect()
+            try:
+                return await self._roundtrip(*self._conn, *args)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self._conn = None
+                raise
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._command("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        if ttl:
+            await self._command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            await self._command("SET", key, value)
+
+    async def set_if_absent(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        if ttl:
+            reply = await self._command("SET", key, value, "NX", "PX", int(ttl * 1000))
+        else:
+            reply = await self._command("SET", key, value, "NX")
+        return reply == "OK"
+
+    async def delete(self, key: str):
+        await self._command("DEL", key)
+
+    async def publish(self, channel: str, message: bytes):
+        await self._command("PUBLISH", channel, message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[bytes]:
+        reader, writer = await self._connect()
+        await self._roundtrip(reader, writer, "SUBSCRIBE", channel)
+
+        async def messages():
+            try:
+                while True:
+                    reply = await self._read_reply(reader)
+                    if reply and reply[0] == b"message":
+                        yield reply[2]
+            finally:
+                writer.close()
+        return messages()
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn[1].close()
+            self._conn = None
+
+
+def open_store(url: str) -> StateStore:
+    """根据 URL 创建状态存储"""
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryStore()
+    if parsed.scheme == "file":
+        return FileStore(unquote(parsed.netloc + parsed.path))
+    if parsed.scheme == "redis":
+        db = int(parsed.path.lstrip("/") or 0)
+        return RedisStore(parsed.hostname or "localhost", parsed.port or 6379, db, parsed.password)
+    raise ValueError(f"unsupported state store: {url}")
@@ -0,0 +1,166 @@
+"""WebSocket 消息的编码格式
+
+连接时通过 /ws/{room_id}/{player_id}?format=... 协商，每个连接一种格式：
+  - "json"（默认）：JSON 文本，牌用名称表示，如 "♠10"、"大王"，兼容旧客户端
+  - "ids"：JSON 文本，牌用 0..107 的整数 id 表示
+  - "msgpack"：msgpack 二进制帧，一组牌打包成 bytes，每个字节是一张牌的 id；
+    服务器未安装 msgpack 时退回 "ids"
+
+牌 id = 副数 * 54 + 牌面，牌面 = 花色 * 13 + 点数（0..12 为 2..A），52 为小王，53 为大王。
+客户端发来的 play_cards 中的 cards 使用同一种格式。
+
+协议层用 CardList 表示消息中的一组牌，只在编码时按连接的格式展开，
+同一条消息对同一种格式只需编码一次。
+"""
+import json
+import struct
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Union
+
+from .cards import CARDS, CARD_NAMES, DECK_SIZE, Card, parse_card
+
+try:
+    import msgpack
+except ImportError:  # msgpack 是可选依赖
+    msgpack = None
+
+JSON = "json"
+IDS = "ids"
+MSGPACK = "msgpack"
+FORMATS = (JSON, IDS, MSGPACK)
+
+# 编码表：id -> 名称；解码表：名称 -> Card 已在 cards.CARD_BY_NAME 中
+_ID_NAMES = CARD_NAMES
+_CARDS_BY_ID = {i: CARDS[i] for i in range(DECK_SIZE)}
+
+
+class CardList:
+    """消息中的一组牌，内部保存为 id 组成的 bytes"""
+    __slots__ = ("ids",)
+
+    def __init__(self, cards: Iterable[Card] = ()):
+        self.ids = bytes(card.id for card in cards)
+
+    def names(self) -> List[str]:
+        return [_ID_NAMES[i] for i in self.ids]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __eq__(self, other):
+        return isinstance(other, CardList) and self.ids == other.ids
+
+    def __repr__(self):
+        return f"CardList({self.names()})"
+
+
+def _json_names(obj):
+    if isinstance(obj, CardList):
+        return obj.names()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _json_ids(obj):
+    if isinstance(obj, CardList):
+        return list(obj.ids)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, CardList):
+        return obj.ids
+    raise TypeError(f"Object of type {type(obj).__name__} is not msgpack serializable")
+
+
+_JSON_DEFAULTS = {JSON: _json_names, IDS: _json_ids}
+
+
+def negotiate(requested: Optional[str]) -> str:
+    if requested == MSGPACK and msgpack is None:
+        return IDS
+    return requested if requested in FORMATS else JSON
+
+
+def is_binary(wire_format: str) -> bool:
+    return wire_format == MSGPACK
+
+
+def encode(message: Dict[str, Any], wire_format: str = JSON) -> Union[str, bytes]:
+    """按格式编码一条消息，msgpack 返回 bytes，其余返回 str"""
+    if wire_format == MSGPACK:
+        return msgpack.packb(message, default=_msgpack_default, use_bin_type=True)
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"),
+                      default=_JSON_DEFAULTS[wire_format])
+
+
+class Fragment(NamedTuple):
+    """已编码的若干个对象字段，可以拼接成一个对象"""
+    payload: Union[str, bytes]
+    count: int
+
+
+def fields(values: Dict[str, Any], wire_format: str = JSON) -> Fragment:
+    """把若干字段编码为片段"""
+    if wire_format == MSGPACK:
+        pack = _packer()
+        return Fragment(b"".join(pack(key) + pack(value) for key, value in values.items()), len(values))
+    if not values:
+        return Fragment("", 0)
+    return Fragment(encode(values, wire_format)[1:-1], len(values))
+
+
+def field(key: str, encoded: Union[str, bytes], wire_format: str = JSON) -> Fragment:
+    """值已经编码好的单个字段"""
+    if wire_format == MSGPACK:
+        return Fragment(_packer()(key) + encoded, 1)
+    return Fragment(json.dumps(key, ensure_ascii=False) + ":" + encoded, 1)
+
+
+def join(fragments: Sequence[Fragment], wire_format: str = JSON) -> Union[str, bytes]:
+    """把片段拼接为一个完整编码的对象，字段顺序与片段顺序一致"""
+    if wire_format == MSGPACK:
+        count = sum(fragment.count for fragment in fragments)
+        if count < 16:
+            header = bytes((0x80 | count,))
+        else:
+            header = b"\xde" + struct.pack(">H", count)
+        return header + b"".join(fragment.payload for fragment in fragments)
+    return "{" + ",".join(fragment.payload for fragment in fragments if fragment.count) + "}"
+
+
+def _packer():
+    return msgpack.Packer(default=_msgpack_default, use_bin_type=True).pack
+
+
+def to_plain(message: Any) -> Any:
+    """把消息中的 CardList 展开为名称，用于 HTTP 接口等直接返回对象的场合"""
+    if isinstance(message, CardList):
+        return message.names()
+    if isinstance(message, dict):
+        return {key: to_plain(value) for key, value in message.items()}
+    if isinstance(message, list):
+        return [to_plain(value) for value in message]
+    return message
+
+
+def decode(raw: Union[str, bytes], wire_format: str = JSON) -> Dict[str, Any]:
+    if wire_format == MSGPACK and isinstance(raw, bytes):
+        return msgpack.unpackb(raw, raw=False)
+    return json.loads(raw)
+
+
+def decode_cards(cards: Any) -> Optional[List[Card]]:
+    """把客户端发来的牌解析为 Card 列表，名称、整数 id 和打包的 bytes 均可，无法识别时返回 None"""
+    if isinstance(cards, (bytes, bytearray)):
+        result = [_CARDS_BY_ID.get(i) for i in cards]
+    elif isinstance(cards, list):
+        result = []
+        for card in cards:
+            if isinstance(card, str):
+                result.append(parse_card(card))
+            elif isinstance(card, int) and not isinstance(card, bool):
+                result.append(_CARDS_BY_ID.get(card))
+            else:
+                return None
+    else:
+        return None
+    return None if None in result else result
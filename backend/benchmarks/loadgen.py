@@ -0,0 +1,402 @@
+"""压力测试：模拟大量房间与 WebSocket 客户端
+
+每个房间通过 /game/create 与 /game/join 创建，模拟客户端连接 /ws/{room_id}/{player_id}，
+用规则引擎（moves.iter_moves）在轮到自己时打出最小的合法牌，打完一局后继续下一局。
+统计每秒处理的出牌/过牌数、从发出操作到收到自己这一步广播的延迟（p50/p99）以及每个房间的内存占用。
+
+默认在当前进程内通过 ASGI 直接驱动应用（不经过网络），也可以用 --url 连接已经启动的服务
+（需要安装 websockets）。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.loadgen --rooms 1000 --duration 30
+    python -m benchmarks.loadgen --mode single --rooms 2000 --ai-delay 0
+    python -m benchmarks.loadgen --url http://127.0.0.1:8000 --rooms 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+try:
+    import websockets
+except ImportError:  # 只有 --url 模式需要
+    websockets = None
+
+from app.cards import Hand
+from app.combos import Combo, find_beating, interpretations
+from app.moves import iter_moves
+from app.wire import decode, decode_cards
+
+Message = Union[str, bytes]
+
+
+def rss_bytes() -> int:
+    """当前进程的常驻内存，无法读取时返回 0"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+# ---- 进程内的 ASGI 传输 ----
+
+class InProcessWebSocket:
+    def __init__(self, app, path: str, query: str):
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "http_version": "1.1",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query.encode(),
+            "headers": [(b"host", b"loadgen")], "client": ("127.0.0.1", 0), "server": ("loadgen", 80),
+            "subprotocols": [],
+        }
+        self._to_app.put_nowait({"type": "websocket.connect"})
+        self._task = asyncio.ensure_future(app(scope, self._to_app.get, self._from_app.put))
+
+    async def recv(self) -> Message:
+        while True:
+            message = await self._from_app.get()
+            if message["type"] == "websocket.send":
+                text = message.get("text")
+                return text if text is not None else message["bytes"]
+            if message["type"] == "websocket.close":
+                raise ConnectionError("closed by server")
+
+    async def send(self, data: Message):
+        if isinstance(data, bytes):
+            await self._to_app.put({"type": "websocket.receive", "bytes": data})
+        else:
+            await self._to_app.put({"type": "websocket.receive", "text": data})
+
+    async def close(self):
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        try:
+            await asyncio.wait_for(self._task, 5)
+        except Exception:
+            self._task.cancel()
+
+
+class InProcessTransport:
+    """直接调用 ASGI 应用，包括 lifespan 的启动与关闭"""
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan: Optional[asyncio.Task] = None
+        self._lifespan_in: asyncio.Queue = asyncio.Queue()
+        self._lifespan_out: asyncio.Queue = asyncio.Queue()
+
+    async def start(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan = asyncio.ensure_future(self.app(scope, self._lifespan_in.get, self._lifespan_out.put))
+        await self._lifespan_in.put({"type": "lifespan.startup"})
+        message = await self._lifespan_out.get()
+        if message["type"] != "lifespan.startup.complete":
+            raise RuntimeError(f"application startup failed: {message}")
+
+    async def stop(self):
+        await self._lifespan_in.put({"type": "lifespan.shutdown"})
+        await self._lifespan_out.get()
+        await self._lifespan
+
+    async def get(self, path: str, params: Dict[str, str]) -> Tuple[int, Any]:
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": urllib.parse.urlencode(params).encode(),
+            "headers": [(b"host", b"loadgen")], "client": ("127.0.0.1", 0), "server": ("loadgen", 80),
+        }
+        response: Dict[str, Any] = {"status": 500, "body": b""}
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            # 未处理的异常已由应用返回 500，这里不再向上抛出
+            return 500, None
+        return response["status"], json.loads(response["body"] or b"null")
+
+    async def websocket(self, path: str, query: str) -> InProcessWebSocket:
+        return InProcessWebSocket(self.app, path, query)
+
+
+class NetworkTransport:
+    """连接已经启动的服务"""
+
+    def __init__(self, url: str):
+        if websockets is None:
+            raise RuntimeError("--url requires the websockets package")
+        self.url = url.rstrip("/")
+        parsed = urllib.parse.urlparse(self.url)
+        self.ws_url = ("wss" if parsed.scheme == "https" else "ws") + "://" + parsed.netloc
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def _get(self, path: str, params: Dict[str, str]) -> Tuple[int, Any]:
+        url = f"{self.url}{path}?{urllib.parse.urlencode(params)}"
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as exc:
+            return exc.code, None
+
+    async def get(self, path: str, params: Dict[str, str]) -> Tuple[int, Any]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._get, path, params)
+
+    async def websocket(self, path: str, query: str):
+        return await websockets.connect(f"{self.ws_url}{path}?{query}", max_size=None)
+
+
+# ---- 模拟客户端 ----
+
+class Stats:
+    def __init__(self):
+        self.moves = 0
+        self.rounds = 0
+        self.errors = 0
+        self.failed_rooms = 0
+        self.latencies: List[float] = []
+
+
+class SimulatedClient:
+    """按增量协议跟踪自己的手牌与桌面牌型，轮到自己时打出最小的合法牌"""
+
+    def __init__(self, transport, room_id: str, player_id: str, stats: Stats, wire_format: str,
+                 observer: bool):
+        self.transport = transport
+        self.room_id = room_id
+        self.player_id = player_id
+        self.stats = stats
+        self.wire_format = wire_format
+        self.observer = observer  # 每个房间只由一个客户端统计出牌数，避免重复计数
+        self.seat = -1
+        self.hand = Hand()
+        self.level = 2
+        self.table: Optional[Combo] = None
+        self.table_seat: Optional[int] = None
+        self.sent_at: Optional[float] = None
+        self.last_action: Optional[str] = None
+        self.rejected = 0
+        self.ws = None
+
+    def _is_leading(self, seat: int) -> bool:
+        return self.table is None or self.table_seat == seat
+
+    def _set_table(self, seat: int, cards):
+        combos = interpretations(cards, self.level)
+        # 与 GameState.match_play 相同：首出取第一种解释，跟牌取能压过桌面的解释
+        if self._is_leading(seat):
+            self.table = combos[0] if combos else None
+        else:
+            self.table = find_beating(combos, self.table) or (combos[0] if combos else None)
+        self.table_seat = seat
+
+    def _on_snapshot(self, data: Dict[str, Any]):
+        self.seat = data["myIndex"]
+        self.level = data["currentLevel"]
+        self.hand = Hand(decode_cards(data["myHand"]))
+        self.table = None
+        self.table_seat = None
+        last = data.get("lastPlayedCards")
+        if last:
+            self._set_table(data["lastPlayedPlayer"], decode_cards(last))
+
+    def _choose(self) -> Dict[str, Any]:
+        leading = self._is_leading(self.seat)
+        if self.rejected > 2:
+            # 本地跟踪的局面与服务端不一致，请求完整快照
+            return {"action": "resync"}
+        if self.rejected:
+            # 上一次操作被拒绝（桌面牌型推断不一致等）：出牌被拒绝时改为过牌，过牌被拒绝时改为首出
+            leading = self.last_action == "pass"
+            if not leading:
+                return {"action": "pass"}
+        move = next(iter_moves(self.hand, self.level, None if leading else self.table), None)
+        if move is None:
+            return {"action": "pass"}
+        return {"action": "play_cards", "cards": [card.id for card in move.cards]}
+
+    async def _act(self):
+        action = self._choose()
+        self.last_action = action["action"]
+        self.sent_at = time.perf_counter()
+        await self.ws.send(json.dumps(action))
+
+    async def run(self, deadline: float):
+        self.ws = await self.transport.websocket(
+            f"/ws/{self.room_id}/{self.player_id}", f"protocol=delta&format={self.wire_format}")
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    raw = await asyncio.wait_for(self.ws.recv(), max(deadline - time.perf_counter(), 0.01))
+                except asyncio.TimeoutError:
+                    break
+                message = decode(raw, self.wire_format)
+                next_seat = await self._handle(message)
+                if next_seat == self.seat and self.hand.size:
+                    await self._act()
+        finally:
+            await self.ws.close()
+
+    async def _handle(self, message: Dict[str, Any]) -> Optional[int]:
+        """处理一条消息，返回接下来行动的座位"""
+        kind = message.get("type")
+        if kind == "game_state":
+            self.rejected = 0
+            self._on_snapshot(message["data"])
+            return message["data"]["currentTurn"]
+        if kind == "error":
+            self.stats.errors += 1
+            self.rejected += 1
+            return self.seat
+        if kind != "event":
+            return None
+        data = message["data"]
+        event = message["event"]
+        if event == "round_end":
+            if self.observer:
+                self.stats.rounds += 1
+            return None  # 新一局的快照随后到达
+        seat = data["seat"]
+        if seat == self.seat and self.sent_at is not None:
+            self.stats.latencies.append(time.perf_counter() - self.sent_at)
+            self.sent_at = None
+            self.rejected = 0
+        if self.observer:
+            self.stats.moves += 1
+        if event == "play":
+            cards = decode_cards(data["cards"])
+            self._set_table(seat, cards)
+            if seat == self.seat:
+                for card in cards:
+                    self.hand.remove(card)
+        elif event == "pass" and data.get("trickEnd"):
+            self.table = None
+            self.table_seat = None
+        return data["next"]
+
+
+async def create_room(transport, mode: str, index: int, stats: Stats) -> Optional[Tuple[str, List[str]]]:
+    status, body = await transport.get("/game/create", {"player_name": f"load{index}", "mode": mode})
+    if status != 200:
+        stats.failed_rooms += 1
+        return None
+    players = [body["playerId"]]
+    if mode == "multiplayer":
+        for seat in range(1, 4):
+            status, joined = await transport.get(f"/game/join/{body['roomId']}",
+                                                 {"player_name": f"load{index}_{seat}"})
+            if status != 200:
+                stats.failed_rooms += 1
+                return None
+            players.append(joined["playerId"])
+    return body["roomId"], players
+
+
+async def run_load(transport, rooms: int, duration: float, mode: str, wire_format: str,
+                   concurrency: int, in_process: bool) -> Dict[str, Any]:
+    stats = Stats()
+    await transport.start()
+    try:
+        rss_before = rss_bytes()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def create(index: int):
+            async with semaphore:
+                return await create_room(transport, mode, index, stats)
+
+        created = [room for room in await asyncio.gather(*(create(i) for i in range(rooms))) if room]
+        rss_rooms = rss_bytes()
+
+        start = time.perf_counter()
+        deadline = start + duration
+        clients = [
+            SimulatedClient(transport, room_id, player_id, stats, wire_format, seat == 0)
+            for room_id, players in created for seat, player_id in enumerate(players)
+        ]
+        results = await asyncio.gather(*(client.run(deadline) for client in clients), return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        disconnected = sum(1 for result in results if isinstance(result, Exception))
+        rss_after = rss_bytes()
+    finally:
+        await transport.stop()
+
+    report: Dict[str, Any] = {
+        "mode": mode,
+        "format": wire_format,
+        "rooms": len(created),
+        "failed_rooms": stats.failed_rooms,
+        "clients": len(clients),
+        "disconnected_clients": disconnected,
+        "seconds": round(elapsed, 3),
+        "moves": stats.moves,
+        "rounds": stats.rounds,
+        "moves_per_second": round(stats.moves / elapsed, 1) if elapsed else 0.0,
+        "rejected_actions": stats.errors,
+        "latency_ms_p50": round(percentile(stats.latencies, 0.50) * 1000, 3),
+        "latency_ms_p99": round(percentile(stats.latencies, 0.99) * 1000, 3),
+    }
+    if in_process and created:
+        # 房间本身（创建后）与对局进行中（连接、发送队列、缓存）的每房间内存
+        report["room_bytes_idle"] = (rss_rooms - rss_before) // len(created)
+        report["room_bytes_playing"] = (rss_after - rss_before) // len(created)
+    return report
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="掼蛋服务压力测试")
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30.0, help="对局阶段持续的秒数")
+    parser.add_argument("--mode", choices=("multiplayer", "single"), default="multiplayer",
+                        help="multiplayer：每个房间 4 个模拟客户端；single：1 个客户端与 3 个 AI")
+    parser.add_argument("--format", dest="wire_format", default="ids", choices=("json", "ids", "msgpack"))
+    parser.add_argument("--url", help="连接已经启动的服务，例如 http://127.0.0.1:8000；默认在进程内运行")
+    parser.add_argument("--ai-delay", type=float, default=0.0, help="进程内运行时 AI 每步的展示延迟")
+    parser.add_argument("--concurrency", type=int, default=64, help="同时创建房间的请求数")
+    parser.add_argument("--output", help="把结果写入该 JSON 文件")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        transport = NetworkTransport(args.url)
+    else:
+        # 配置在导入时读取
+        os.environ["AI_THINK_DELAY"] = str(args.ai_delay)
+        from app.main import app
+        transport = InProcessTransport(app)
+
+    report = asyncio.run(run_load(transport, args.rooms, args.duration, args.mode, args.wire_format,
+                                  args.concurrency, in_process=not args.url))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
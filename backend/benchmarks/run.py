@@ -0,0 +1,398 @@
+"""规则引擎与 AI 热点路径的基准测试
+
+所有用例使用固定种子生成的牌局，结果可复现。结果以 JSON 保存为基线，
+之后的运行可以与基线比较，慢于基线超过阈值的用例会被标记为回退。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.run                       # 运行并打印结果
+    python -m benchmarks.run --save                # 保存为基线
+    python -m benchmarks.run --compare             # 与基线比较，有回退时退出码为 1
+    python -m benchmarks.run --only classify       # 只运行名称包含 classify 的用例
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app import batch, decompose
+from app.ai_player import AIPlayer
+from app.cards import Card
+from app.dealing import DealPool, make_deal, new_state
+from app.game import GameState
+from app.replay import Replay
+from app.simulator import play_round
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_THRESHOLD = 0.20
+SEED = 20240501
+
+# 每个用例返回 (单次操作耗时的秒数, 操作次数)
+BENCHMARKS: Dict[str, Callable[[], Tuple[float, int]]] = {}
+
+
+def benchmark(name: str):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def measure(func: Callable[[], int], repeat: int = 5) -> Tuple[float, int]:
+    """运行 repeat 次取最快的一次，返回每次操作的耗时"""
+    best = None
+    ops = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ops = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / ops, ops
+
+
+def dealt_state(seed: int, level: int = 2) -> GameState:
+    state = GameState()
+    state.current_level = level
+    state.deal_cards(random.Random(seed))
+    return state
+
+
+def sample_plays(count: int, seed: int = SEED) -> List[Tuple[GameState, List[Card], int]]:
+    """从随机牌局中取出合法出牌与随机选牌（含非法牌型）"""
+    rng = random.Random(seed)
+    plays = []
+    while len(plays) < count:
+        state = dealt_state(rng.getrandbits(32), rng.randint(2, 14))
+        seat = rng.randrange(4)
+        moves = state.legal_moves(seat)
+        for move in rng.sample(moves, min(len(moves), 8)):
+            plays.append((state, list(move.cards), seat))
+        hand = list(state.players_hands[seat])
+        for _ in range(4):
+            plays.append((state, rng.sample(hand, rng.randint(1, 6)), seat))
+    return plays[:count]
+
+
+@benchmark("classify.get_card_type")
+def bench_get_card_type():
+    plays = sample_plays(2000)
+
+    def run():
+        for state, cards, _ in plays:
+            state.get_card_type(cards)
+        return len(plays)
+    return measure(run)
+
+
+@benchmark("classify.compare_cards")
+def bench_compare_cards():
+    plays = sample_plays(2000)
+    pairs = list(zip(plays, plays[1:] + plays[:1]))
+
+    def run():
+        for (state, cards1, _), (_, cards2, _) in pairs:
+            state.compare_cards(cards1, cards2)
+        return len(pairs)
+    return measure(run)
+
+
+@benchmark("classify.can_play_cards")
+def bench_can_play_cards():
+    rng = random.Random(SEED)
+    cases = []
+    for state, cards, seat in sample_plays(2000):
+        table = state.clone()
+        follow = next(iter(table.legal_moves((seat + 1) % 4)), None)
+        if follow and rng.random() < 0.7:
+            table.current_player = (seat + 1) % 4
+            table.play_cards(list(follow.cards), (seat + 1) % 4)
+        cases.append((table, cards, seat))
+
+    def run():
+        for state, cards, seat in cases:
+            state.can_play_cards(cards, seat)
+        return len(cases)
+    return measure(run)
+
+
+def _decision_bench(hand_size: int):
+    def bench():
+        rng = random.Random(SEED + hand_size)
+        states = []
+        for _ in range(50):
+            state = dealt_state(rng.getrandbits(32), rng.randint(2, 14))
+            hand = state.players_hands[0]
+            for card in rng.sample(list(hand), len(hand) - hand_size):
+                hand.remove(card)
+            states.append(state)
+
+        def run():
+            for state in states:
+                AIPlayer(state, 0).make_decision()
+            return len(states)
+        return measure(run)
+    return bench
+
+
+for _size in (27, 20, 10, 5):
+    benchmark(f"ai.make_decision.hand{_size}")(_decision_bench(_size))
+
+
+@benchmark("decompose.cold")
+def bench_decompose_cold():
+    rng = random.Random(SEED)
+    hands = []
+    for _ in range(20):
+        state = dealt_state(rng.getrandbits(32), rng.randint(2, 14))
+        hands.append((state.players_hands[0], state.current_level))
+
+    def run():
+        for hand, level in hands:
+            decompose.clear_cache()
+            decompose.decompose(hand, level)
+        return len(hands)
+    return measure(run, repeat=3)
+
+
+if batch.np is not None:
+    @benchmark("batch.classify_ids")
+    def bench_batch_classify():
+        rng = random.Random(SEED)
+        plays, levels = batch.random_plays(20000, rng)
+        ids = batch.encode_ids(plays, batch.MAX_PLAY_SIZE)
+        level_array = batch.np.array(levels)
+
+        def run():
+            batch.classify_ids(ids, level_array)
+            return len(plays)
+        return measure(run)
+
+
+@benchmark("game.deal_cards")
+def bench_deal_cards():
+    rng = random.Random(SEED)
+
+    def run():
+        for _ in range(500):
+            state = GameState()
+            state.deal_cards(rng)
+        return 500
+    return measure(run)
+
+
+@benchmark("dealing.make_deal")
+def bench_make_deal():
+    def run():
+        for seed in range(500):
+            new_state(make_deal(seed))
+        return 500
+    return measure(run)
+
+
+@benchmark("dealing.pool_take")
+def bench_pool_take():
+    # 只计取用的耗时：事先生成够所有轮次用的发牌（服务中由后台任务补充）
+    pool = DealPool(size=500 * 5, seed=SEED)
+    pool.fill()
+
+    def run():
+        for _ in range(500):
+            new_state(pool.take())
+        return 500
+    return measure(run)
+
+
+@benchmark("selfplay.round")
+def bench_selfplay_round():
+    def run():
+        rng = random.Random(SEED)
+        for _ in range(5):
+            play_round(2, rng)
+        return 5
+    return measure(run, repeat=3)
+
+
+@benchmark("replay.state_at")
+def bench_replay():
+    rng = random.Random(SEED)
+    replays = [Replay(play_round(2, rng, record=True)["replay"]) for _ in range(5)]
+    plies = [(replay, ply) for replay in replays for ply in range(0, len(replay), 7)]
+
+    def run():
+        for replay, ply in plies:
+            replay.state_at(ply)
+        return len(plies)
+    return measure(run)
+
+
+@benchmark("server.broadcast_game_state")
+def bench_broadcast():
+    try:
+        from app import main
+    except ImportError:
+        return None
+
+    class NullSocket:
+        """不发送的 WebSocket，消息在放入发送队列前已经编码"""
+        async def send_text(self, data):
+            pass
+
+        async def close(self, code=1000):
+            pass
+
+    state = dealt_state(SEED)
+    room_id = "bench"
+    room = {
+        "game_state": state,
+        "players": [{"id": f"bench_{i}", "name": f"玩家 {i}"} for i in range(4)],
+        "mode": "multiplayer",
+    }
+    main.active_games[room_id] = room
+    loop = asyncio.new_event_loop()
+
+    async def connect():
+        for player in room["players"]:
+            main.connected_clients[player["id"]] = main.ClientConnection(NullSocket(), player["id"])
+
+    async def broadcast():
+        # 计入写任务的编码时间：等待所有连接的队列发送完
+        for _ in range(200):
+            await main.broadcast_game_state(room, room_id)
+        for player in room["players"]:
+            await main.connected_clients[player["id"]].drain()
+
+    def run():
+        loop.run_until_complete(broadcast())
+        return 200
+    loop.run_until_complete(connect())
+    try:
+        return measure(run)
+    finally:
+        for player in room["players"]:
+            loop.run_until_complete(main.connected_clients[player["id"]].close())
+        loop.close()
+        del main.active_games[room_id]
+        for player in room["players"]:
+            main.connected_clients.pop(player["id"], None)
+
+
+@benchmark("server.spectator_fanout")
+def bench_spectator_fanout():
+    try:
+        from app.connections import ClientConnection
+        from app.spectators import Channel, spectator_view
+    except ImportError:
+        return None
+
+    class NullSocket:
+        async def send_text(self, data):
+            pass
+
+        async def close(self, code=1000):
+            pass
+
+    state = dealt_state(SEED)
+    room = {"game_state": state, "players": [{"id": f"bench_{i}", "name": f"玩家 {i}"} for i in range(4)]}
+    event = {"type": "event", "seq": 1, "event": "pass", "data": {"seat": 0, "next": 1, "trickEnd": False}}
+    loop = asyncio.new_event_loop()
+    # 每个事件发给 500 名观战者，计入频道任务的分发和各连接写任务的发送
+    channel = Channel(delay=0, sample_threshold=1000)
+    watchers = []
+
+    async def connect():
+        for i in range(500):
+            watcher = ClientConnection(NullSocket(), f"spectator_{i}", max_queue=1000)
+            watchers.append(watcher)
+            await channel.add(watcher)
+
+    async def publish():
+        for _ in range(200):
+            channel.publish(1, event, spectator_view(room, "bench"))
+            await asyncio.sleep(0)
+        for watcher in watchers:
+            await watcher.drain()
+
+    def run():
+        loop.run_until_complete(publish())
+        return 200
+    loop.run_until_complete(connect())
+    try:
+        return measure(run, repeat=3)
+    finally:
+        loop.run_until_complete(channel.close())
+        loop.close()
+
+
+def run_benchmarks(only: Optional[str] = None) -> Dict[str, Dict]:
+    results = {}
+    for name, func in BENCHMARKS.items():
+        if only and only not in name:
+            continue
+        measured = func()
+        if measured is None:
+            print(f"{name:40s} skipped (dependency not installed)")
+            continue
+        per_op, ops = measured
+        results[name] = {"seconds_per_op": per_op, "ops_per_second": 1 / per_op, "ops": ops}
+        print(f"{name:40s} {per_op * 1e6:12.2f} us/op {1 / per_op:14.1f} ops/s")
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """返回比基线慢超过 threshold 的用例名称"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = result["seconds_per_op"] / base["seconds_per_op"]
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:40s} {ratio:8.2f}x baseline {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="掼蛋规则引擎基准测试")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--compare", action="store_true", help="与基线比较")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="判定为回退的相对变慢比例，默认 0.2")
+    parser.add_argument("--only", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--output", help="把本次结果写入该 JSON 文件")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.only)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"baseline {args.baseline} not found", file=sys.stderr)
+            return 2
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
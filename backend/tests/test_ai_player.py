@@ -0,0 +1,22 @@
+"""规则 AI 的决策只由局面决定"""
+from app import decompose
+from app.ai_player import AIPlayer
+from app.replay import deal
+from app.simulator import play_game
+
+
+def test_decision_does_not_depend_on_cache_state():
+    for seed in range(10):
+        state = deal(seed, 2 + seed % 13)
+        decompose.clear_cache()
+        cold = AIPlayer(state.clone(), state.current_player).make_decision()
+        warm = AIPlayer(state.clone(), state.current_player).make_decision()
+        assert cold == warm
+
+
+def test_simulated_games_are_reproducible():
+    for game in range(2):
+        decompose.clear_cache()
+        first = play_game(game, 7, max_rounds=4, record=True)
+        second = play_game(game, 7, max_rounds=4, record=True)
+        assert first == second
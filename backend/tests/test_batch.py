@@ -0,0 +1,34 @@
+"""批量判定与逐手判定一致（python -m app.batch --check 的测试版本）"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app import batch  # noqa: E402
+from app.cards import CARDS, FACE_COUNT, NATURAL_RANK_COUNT, wild_face  # noqa: E402
+from app.combos import CardType, Combo, classify, interpretations  # noqa: E402
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_batch_matches_scalar_classification(seed):
+    result = batch.check(20000, seed)
+    assert result.count == 20000
+    assert result.mismatches == []
+
+
+def test_only_main_prints(capsys):
+    assert batch.check(200).mismatches == []
+    assert capsys.readouterr().out == ""
+    assert batch.main(["--check", "200"]) == 0
+    assert capsys.readouterr().out.startswith("200 plays: 0 mismatches")
+
+
+def test_triple_and_two_wilds_has_full_house_reading():
+    # 打 3 时 ♥3 ♥3 ♠5 ♥5 ♦5：既是五张的炸弹，也是三带二
+    level = 3
+    wild = wild_face(level)
+    plays = [[CARDS[wild], CARDS[wild + FACE_COUNT]] + [CARDS[suit * NATURAL_RANK_COUNT + 3] for suit in range(3)]]
+    result = batch.classify_ids(batch.encode_ids(plays), level)
+    readings = set(interpretations(plays[0], level))
+    assert result.combo(0) == classify(plays[0], level)
+    assert Combo(batch.TYPES[result.alt_type[0]], int(result.alt_key[0])) in readings
+    assert {combo.type for combo in readings} == {CardType.BOMB, CardType.TRIPLE_WITH_PAIR}
@@ -0,0 +1,355 @@
+"""多 worker 集群：用进程内的 MemoryStore 在同一个进程中模拟多个 worker"""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from app.cluster import Cluster, RemoteError, deserialize_room, serialize_room
+from app.game import GameState
+from app.replay import deal
+from app.series import Series
+from app.store import FileStore, MemoryStore, RedisError, RedisStore, open_store
+
+
+def new_room():
+    return {"game_state": deal(9, 4), "series": Series(), "players": [{"id": "p", "name": "a"}],
+            "mode": "single", "ai_mode": "basic", "seq": 3, "version": 5}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def start(store, name, **options):
+    cluster = Cluster(store, {}, worker_id=name, **options)
+    await cluster.start()
+    return cluster
+
+
+async def crash(cluster):
+    """停止后台任务但不删除心跳，模拟 worker 进程异常退出"""
+    for task in cluster._tasks:
+        task.cancel()
+    cluster._tasks = []
+
+
+def test_room_round_trips_through_the_store():
+    room = new_room()
+    restored = deserialize_room(serialize_room(room))
+    assert restored["game_state"].to_dict() == room["game_state"].to_dict()
+    assert restored["players"] == room["players"] and restored["seq"] == 3
+    assert isinstance(restored["game_state"], GameState)
+
+
+def test_only_one_worker_claims_a_room():
+    async def scenario():
+        store = MemoryStore()
+        a, b = await start(store, "a"), await start(store, "b")
+        try:
+            assert await a.claim("r1")
+            assert not await b.claim("r1")
+            assert await b.owner_of("r1") == "a"
+            assert await a.owner_of("r1") == "a"
+            await a.release("r1")
+            assert await b.owner_of("r1") is None
+            assert await b.claim("r1")
+        finally:
+            await a.stop()
+            await b.stop()
+    run(scenario())
+
+
+def test_room_is_adopted_after_the_owner_heartbeat_expires():
+    async def scenario():
+        store = MemoryStore()
+        a = await start(store, "a", owner_ttl=0.2)
+        b = await start(store, "b", owner_ttl=0.2)
+        c = await start(store, "c", owner_ttl=0.2)
+        try:
+            room = new_room()
+            assert await a.claim("r1")
+            a.rooms["r1"] = room
+            a.mark_dirty("r1")
+            await a.flush()
+            # 归属 worker 还活着时不能接管
+            assert await b.owner_of("r1") == "a"
+
+            await crash(a)
+            await asyncio.sleep(0.3)
+            assert await b.owner_of("r1") is None
+            adopted = await b.adopt("r1")
+            assert adopted is not None
+            assert adopted["game_state"].to_dict() == room["game_state"].to_dict()
+            # 同一次接管只有一个 worker 成功
+            assert await c.adopt("r1") is None
+            assert await c.owner_of("r1") == "b"
+            assert await b.adopt("missing") is None
+        finally:
+            await b.stop()
+            await c.stop()
+    run(scenario())
+
+
+def test_call_and_notify_are_relayed():
+    async def scenario():
+        store = MemoryStore()
+        a = await start(store, "a", rpc_timeout=0.5)
+        b = await start(store, "b")
+        received = []
+
+        @b.handler("add")
+        async def add(sender, x, y):
+            return {"sum": x + y, "sender": sender, "data": b"\x00\x01"}
+
+        @b.handler("fail")
+        async def fail(sender):
+            raise RemoteError(404, "房间不存在")
+
+        @b.handler("event")
+        async def event(sender, n):
+            received.append((sender, n))
+
+        try:
+            assert await a.call("b", "add", x=1, y=2) == {"sum": 3, "sender": "a", "data": b"\x00\x01"}
+            with pytest.raises(RemoteError) as error:
+                await a.call("b", "fail")
+            assert error.value.status_code == 404 and error.value.detail == "房间不存在"
+            with pytest.raises(RemoteError) as error:
+                await a.call("b", "unknown")
+            assert error.value.status_code == 400
+            with pytest.raises(RemoteError) as error:
+                await a.call("nobody", "add", x=1, y=2)
+            assert error.value.status_code == 504
+
+            # notify 不等待回复，同一目标的消息按发送顺序处理
+            for n in range(20):
+                a.notify("b", "event", n=n)
+            for _ in range(50):
+                if len(received) == 20:
+                    break
+                await asyncio.sleep(0.01)
+            assert received == [("a", n) for n in range(20)]
+        finally:
+            await a.stop()
+            await b.stop()
+    run(scenario())
+
+
+class FakeRedis:
+    """只实现 RedisStore 用到的命令的 RESP 服务器，用来测试手写的 RESP 客户端"""
+
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.subscribers = {}
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @staticmethod
+    async def _read_command(reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        assert line[:1] == b"*"
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    @staticmethod
+    def _bulk(value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _live(self, key):
+        item = self.data.get(key)
+        if item is not None and item[1] is not None and time.monotonic() >= item[1]:
+            del self.data[key]
+            item = None
+        return None if item is None else item[0]
+
+    async def _serve(self, reader, writer):
+        authed = self.password is None
+        while True:
+            args = await self._read_command(reader)
+            if args is None:
+                break
+            name = args[0].upper()
+            if name == b"AUTH":
+                authed = args[1].decode() == self.password
+                writer.write(b"+OK\r\n" if authed else b"-ERR invalid password\r\n")
+            elif not authed:
+                writer.write(b"-NOAUTH Authentication required.\r\n")
+            elif name == b"SELECT":
+                writer.write(b"+OK\r\n")
+            elif name == b"GET":
+                writer.write(self._bulk(self._live(args[1])))
+            elif name == b"SET":
+                options = [arg.upper() for arg in args[3:]]
+                expires = None
+                if b"PX" in options:
+                    expires = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+                if b"NX" in options and self._live(args[1]) is not None:
+                    writer.write(b"$-1\r\n")
+                else:
+                    self.data[args[1]] = (args[2], expires)
+                    writer.write(b"+OK\r\n")
+            elif name == b"DEL":
+                writer.write(b":%d\r\n" % (self.data.pop(args[1], None) is not None))
+            elif name == b"PUBLISH":
+                targets = self.subscribers.get(args[1], [])
+                for target in targets:
+                    target.write(b"*3\r\n" + self._bulk(b"message") + self._bulk(args[1]) + self._bulk(args[2]))
+                writer.write(b":%d\r\n" % len(targets))
+            elif name == b"SUBSCRIBE":
+                self.subscribers.setdefault(args[1], []).append(writer)
+                writer.write(b"*3\r\n" + self._bulk(b"subscribe") + self._bulk(args[1]) + b":1\r\n")
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+        writer.close()
+
+
+async def open_test_store(kind, tmp_path):
+    """返回 (store, 清理函数)"""
+    if kind == "memory":
+        return MemoryStore(), None
+    if kind == "file":
+        return FileStore(str(tmp_path), poll_interval=0.005), None
+    redis = FakeRedis(password="secret")
+    port = await redis.start()
+    store = open_store(f"redis://:secret@127.0.0.1:{port}/2")
+    assert isinstance(store, RedisStore) and store.db == 2
+    return store, redis.stop
+
+
+STORES = ["memory", "file", "redis"]
+
+
+@pytest.mark.parametrize("kind", STORES)
+def test_store_keys_and_expiry(kind, tmp_path):
+    async def scenario():
+        store, cleanup = await open_test_store(kind, tmp_path)
+        try:
+            # 值可以包含任意字节，包括 RESP 的分隔符
+            value = b"a\r\nb\x00\xff"
+            assert await store.get("k") is None
+            await store.set("k", value)
+            assert await store.get("k") == value
+            assert not await store.set_if_absent("k", b"other")
+            await store.delete("k")
+            assert await store.get("k") is None
+            assert await store.set_if_absent("k", b"mine", ttl=0.1)
+            assert not await store.set_if_absent("k", b"theirs", ttl=0.1)
+            await asyncio.sleep(0.15)
+            assert await store.get("k") is None
+            assert await store.set_if_absent("k", b"theirs")
+            assert await store.get("k") == b"theirs"
+            await store.delete("missing")
+        finally:
+            await store.close()
+            if cleanup is not None:
+                await cleanup()
+    run(scenario())
+
+
+@pytest.mark.parametrize("kind", STORES)
+def test_store_publish_and_subscribe(kind, tmp_path):
+    async def scenario():
+        store, cleanup = await open_test_store(kind, tmp_path)
+        try:
+            messages = await store.subscribe("inbox")
+            sent = [b"m%d\r\n" % i for i in range(10)]
+            for message in sent:
+                await store.publish("inbox", message)
+            received = [await asyncio.wait_for(messages.__anext__(), 2) for _ in sent]
+            assert received == sent
+            await messages.aclose()
+        finally:
+            await store.close()
+            if cleanup is not None:
+                await cleanup()
+    run(scenario())
+
+
+def test_redis_errors_are_raised():
+    async def scenario():
+        redis = FakeRedis(password="secret")
+        port = await redis.start()
+        store = RedisStore("127.0.0.1", port, password="wrong")
+        try:
+            with pytest.raises(RedisError):
+                await store.get("k")
+        finally:
+            await store.close()
+            await redis.stop()
+    run(scenario())
+
+
+def test_file_store_claims_are_atomic(tmp_path):
+    """多个线程同时抢占同一个键：只有一个成功，读取方不会看到写了一半的文件"""
+    store = FileStore(str(tmp_path))
+    winners = []
+    errors = []
+    start = threading.Barrier(8)
+
+    def claim(worker):
+        loop = asyncio.new_event_loop()
+        try:
+            start.wait()
+            for attempt in range(200):
+                key = f"room:{attempt}:owner"
+                if loop.run_until_complete(store.set_if_absent(key, worker.encode(), ttl=60)):
+                    winners.append(key)
+                value = loop.run_until_complete(store.get(key))
+                if value is None or not value.startswith(b"w"):
+                    errors.append((key, value))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            loop.close()
+
+    threads = [threading.Thread(target=claim, args=(f"w{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert sorted(winners) == sorted(f"room:{attempt}:owner" for attempt in range(200))
+    assert not [name for name in os.listdir(tmp_path / "keys") if name.endswith(".tmp")]
+
+
+@pytest.mark.parametrize("kind", ["file", "redis"])
+def test_cluster_runs_on_shared_stores(kind, tmp_path):
+    async def scenario():
+        store_a, cleanup = await open_test_store(kind, tmp_path)
+        store_b = FileStore(str(tmp_path), poll_interval=0.005) if kind == "file" else \
+            RedisStore(store_a.host, store_a.port, store_a.db, store_a.password)
+        a = await start(store_a, "a", rpc_timeout=2)
+        b = await start(store_b, "b", rpc_timeout=2)
+
+        @b.handler("echo")
+        async def echo(sender, value):
+            return value
+
+        try:
+            assert await a.claim("r1") and not await b.claim("r1")
+            assert await b.owner_of("r1") == "a"
+            assert await a.call("b", "echo", value=[1, "二"]) == [1, "二"]
+        finally:
+            await a.stop()
+            await b.stop()
+            await store_a.close()
+            await store_b.close()
+            if cleanup is not None:
+                await cleanup()
+    run(scenario())
@@ -0,0 +1,107 @@
+"""牌型判定与穷举参考实现的对照
+
+参考实现不用签名和计数技巧：把每张逢人配依次当作每一种普通点数，
+按牌型定义逐一检查，收集所有成立的解释。
+"""
+import itertools
+import random
+
+import pytest
+
+from app.cards import (
+    BIG_JOKER, CARD_RANK, CARD_SUIT, CARDS, MAX_LEVEL, MIN_LEVEL, NATURAL_RANK_COUNT,
+    RANK_VALUES, SMALL_JOKER, card_from_id, wild_face,
+)
+from app.combos import (
+    PAIRS_SEQUENCES, STRAIGHT_SEQUENCES, TRIPLES_SEQUENCES, CardType, Combo, JOKER_BOMB_KEY,
+    bomb_key, classify, interpretations, straight_flush_key,
+)
+from app.replay import deal
+
+
+def _sequence_start(ranks, sequences, width):
+    """ranks（已排序的点数列表）恰好是某个连续牌型时返回最大的起点"""
+    for start in range(len(sequences) - 1, -1, -1):
+        if sorted(r for r in sequences[start] for _ in range(width)) == ranks:
+            return start
+    return None
+
+
+def reference(cards, level):
+    """穷举逢人配的替代点数，返回 {牌型: 最大的 key}"""
+    values = RANK_VALUES[level]
+    wild = wild_face(level)
+    natural = [card for card in cards if card.face != wild]
+    wilds = len(cards) - len(natural)
+    suits = {CARD_SUIT[card.id] for card in natural}
+    found = {}
+
+    def add(card_type, key):
+        found[card_type] = max(found.get(card_type, key), key)
+
+    for extra in itertools.product(range(NATURAL_RANK_COUNT), repeat=wilds):
+        ranks = sorted([CARD_RANK[card.id] for card in natural] + list(extra))
+        size = len(ranks)
+        distinct = sorted(set(ranks))
+        jokers = sum(1 for r in ranks if r >= SMALL_JOKER)
+        if len(distinct) == 1:
+            rank = distinct[0]
+            if rank >= SMALL_JOKER and wilds:
+                continue
+            if size <= 3:
+                add((CardType.SINGLE, CardType.PAIR, CardType.TRIPLE)[size - 1], values[rank])
+            elif rank < SMALL_JOKER and size <= 10:
+                add(CardType.BOMB, bomb_key(size, values[rank]))
+        if ranks == [SMALL_JOKER, SMALL_JOKER, BIG_JOKER, BIG_JOKER]:
+            add(CardType.JOKER_BOMB, JOKER_BOMB_KEY)
+        if size == 5 and not jokers:
+            start = _sequence_start(ranks, STRAIGHT_SEQUENCES, 1)
+            if start is not None:
+                add(CardType.STRAIGHT, start)
+                if len(suits) <= 1:
+                    add(CardType.STRAIGHT_FLUSH, straight_flush_key(start))
+        if size == 5 and len(distinct) == 2:
+            for triple, pair in itertools.permutations(distinct):
+                if ranks.count(triple) == 3 and ranks.count(pair) == 2 and triple < SMALL_JOKER:
+                    add(CardType.TRIPLE_WITH_PAIR, values[triple])
+        if size == 6 and not jokers:
+            start = _sequence_start(ranks, TRIPLES_SEQUENCES, 3)
+            if start is not None:
+                add(CardType.CONSECUTIVE_TRIPLES, start)
+            start = _sequence_start(ranks, PAIRS_SEQUENCES, 2)
+            if start is not None:
+                add(CardType.CONSECUTIVE_PAIRS, start)
+    return found
+
+
+def random_plays(rng, count):
+    """随机的出牌：一半是手牌中的合法出牌，一半随机选 1~10 张"""
+    plays = []
+    while len(plays) < count:
+        level = rng.randint(MIN_LEVEL, MAX_LEVEL)
+        state = deal(rng.getrandbits(32), level)
+        for seat in range(4):
+            hand = list(state.players_hands[seat])
+            moves = state.legal_moves(seat)
+            plays.extend((list(move.cards), level) for move in rng.sample(moves, min(len(moves), 10)))
+            plays.extend((rng.sample(hand, rng.randint(1, 10)), level) for _ in range(10))
+    return plays[:count]
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_reference(seed):
+    for cards, level in random_plays(random.Random(seed), 1500):
+        combos = interpretations(cards, level)
+        assert {combo.type: combo.key for combo in combos} == reference(cards, level), \
+            (level, [str(card) for card in cards])
+
+
+def test_triple_and_two_wilds_is_also_full_house():
+    level = 3
+    # ♥3 ♥3 为逢人配，加上三张 5
+    wild = wild_face(level)
+    cards = [CARDS[wild], CARDS[wild + 54], card_from_id(3), card_from_id(16), card_from_id(29)]
+    combos = interpretations(cards, level)
+    assert combos[0].type == CardType.BOMB
+    assert Combo(CardType.TRIPLE_WITH_PAIR, RANK_VALUES[level][3]) in combos
+    assert classify(cards, level).type == CardType.BOMB
@@ -0,0 +1,144 @@
+"""客户端连接：消息解码、有界发送队列与慢客户端策略"""
+import asyncio
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+from app.connections import DISCONNECT, DROP, ClientConnection, MessageError, get_connection
+
+
+class FakeWebSocket:
+    """send_* 在 gate 打开之前阻塞（模拟慢客户端），fail 为真时发送失败"""
+
+    def __init__(self, messages=(), blocked=False, fail=False):
+        self.messages = list(messages)
+        self.sent = []
+        self.closed_with = None
+        self.gate = asyncio.Event()
+        if not blocked:
+            self.gate.set()
+        self.fail = fail
+
+    async def receive(self):
+        if not self.messages:
+            return {"type": "websocket.disconnect", "code": 1000}
+        return self.messages.pop(0)
+
+    async def _send(self, payload):
+        await self.gate.wait()
+        if self.fail:
+            raise ConnectionError("socket closed")
+        self.sent.append(payload)
+
+    async def send_text(self, text):
+        await self._send(text)
+
+    async def send_bytes(self, data):
+        await self._send(data)
+
+    async def send_json(self, data):
+        await self._send(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_bad_messages_raise_message_error_and_keep_the_connection():
+    async def run():
+        websocket = FakeWebSocket([
+            {"type": "websocket.receive", "text": "{not json"},
+            {"type": "websocket.receive", "text": "[1, 2]"},
+            {"type": "websocket.receive", "text": '{"cards": []}'},
+            {"type": "websocket.receive"},
+            {"type": "websocket.receive", "text": '{"action": "pass"}'},
+        ])
+        connection = ClientConnection(websocket, "p")
+        for _ in range(4):
+            with pytest.raises(MessageError):
+                await connection.receive()
+        assert await connection.receive() == {"action": "pass"}
+        with pytest.raises(WebSocketDisconnect):
+            await connection.receive()
+        await connection.close()
+
+    asyncio.run(run())
+
+
+def test_messages_are_sent_in_order():
+    async def run():
+        websocket = FakeWebSocket()
+        connection = ClientConnection(websocket, "p", max_queue=4)
+        for i in range(10):
+            await connection.send_text(str(i))
+            if i % 3 == 0:
+                await connection.drain()
+        await connection.drain()
+        await connection.close()
+        return websocket
+
+    websocket = asyncio.run(run())
+    assert websocket.sent == [str(i) for i in range(10)]
+
+
+def test_drop_policy_keeps_the_newest_messages():
+    async def run():
+        websocket = FakeWebSocket(blocked=True)
+        connection = ClientConnection(websocket, "p", max_queue=3, policy=DROP)
+        await connection.send_text("0")
+        await settle()  # 写任务取走第一条，卡在发送上
+        for i in range(1, 10):
+            await connection.send_text(str(i))
+        assert connection.dropped == 6 and connection.queue.qsize() == 3
+        assert get_connection({"p": connection}, "p") is connection
+        websocket.gate.set()
+        await connection.drain()
+        assert not connection.closed
+        await connection.close()
+        return websocket
+
+    websocket = asyncio.run(run())
+    assert websocket.sent == ["0", "7", "8", "9"]
+
+
+def test_disconnect_policy_closes_slow_clients():
+    async def run():
+        websocket = FakeWebSocket(blocked=True)
+        connection = ClientConnection(websocket, "p", max_queue=3, policy=DISCONNECT)
+        await connection.send_text("0")
+        await settle()
+        for i in range(1, 5):
+            await connection.send_text(str(i))
+        # 队列满之后立即不再接受消息，房间广播时跳过这个连接
+        assert connection.closing
+        assert get_connection({"p": connection}, "p") is None
+        await settle()
+        assert connection.closed and websocket.closed_with == 1013
+        assert connection.queue.empty()
+        await connection.send_text("late")
+        await connection.drain()
+        return websocket
+
+    websocket = asyncio.run(run())
+    assert websocket.sent == []
+
+
+@pytest.mark.parametrize("fail", [True, False])
+def test_writer_failure_or_timeout_closes_the_connection(fail):
+    async def run():
+        # fail：发送抛出异常；否则发送一直不返回，超过 send_timeout
+        websocket = FakeWebSocket(blocked=not fail, fail=fail)
+        connection = ClientConnection(websocket, "p", send_timeout=0.05)
+        await connection.send_text("0")
+        await connection.send_text("1")
+        await asyncio.wait_for(connection.drain(), 1)
+        await asyncio.sleep(0.01)
+        assert connection.closed and connection._writer.done()
+        assert websocket.closed_with == 1000 and connection.queue.empty()
+        assert get_connection({"p": connection}, "p") is None
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+"""发牌：同一种子得到同一副牌，牌合法，发牌池按需补充"""
+import asyncio
+import random
+from collections import Counter
+
+from app.cards import CARD_FACE, DECK_SIZE, FACE_COUNT
+from app.dealing import DealPool, deal_ids, make_deal, room_deal, round_seed
+from app.game import GameState
+
+
+def test_same_seed_gives_the_same_deal():
+    assert deal_ids(7) == deal_ids(7)
+    assert deal_ids(7) != deal_ids(8)
+    assert [bytes(hand.counts) for hand in make_deal(7).hands] == [bytes(hand.counts) for hand in make_deal(7).hands]
+    # 指定种子的房间每一局的种子可复现，各局不同
+    assert round_seed(42, 3) == round_seed(42, 3)
+    assert len({round_seed(42, index) for index in range(100)}) == 100
+
+
+def test_deals_are_valid():
+    for seed in range(20):
+        ids = deal_ids(seed)
+        assert [len(hand) for hand in ids] == [27] * 4
+        # 两副牌共 108 张，每个 id 恰好发出一次，每个牌面两张
+        assert sorted(card_id for hand in ids for card_id in hand) == list(range(DECK_SIZE))
+        hands = make_deal(seed).hands
+        assert [hand.size for hand in hands] == [27] * 4
+        assert all(sum(hand.counts[face] for hand in hands) == 2 for face in range(FACE_COUNT))
+        for hand, hand_ids in zip(hands, ids):
+            assert list(hand.counts) == [Counter(CARD_FACE[card_id] for card_id in hand_ids)[face]
+                                         for face in range(FACE_COUNT)]
+
+
+def test_deal_matches_dealing_from_the_game_state():
+    state = GameState()
+    state.deal_cards(random.Random(5))
+    assert [bytes(hand.counts) for hand in state.players_hands] == \
+        [bytes(hand.counts) for hand in make_deal(5).hands]
+
+
+def test_pool_refills_in_the_background():
+    async def scenario():
+        pool = DealPool(size=40, seed=1)
+        pool.fill()
+        assert len(pool) == 40
+        pool.start()
+        seeds = [pool.take().seed for _ in range(25)]
+        # 低于一半后唤醒补充任务
+        assert len(pool) == 15
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert len(pool) >= 40
+        pool.stop()
+        # 池子取空后当场生成
+        while len(pool):
+            seeds.append(pool.take().seed)
+        seeds.append(pool.take().seed)
+        assert pool.stats()["misses"] == 1
+        assert len(set(seeds)) == len(seeds)
+    asyncio.run(scenario())
+
+
+def test_seeded_rooms_do_not_use_the_pool():
+    pool = DealPool(size=4, seed=1)
+    room = {"seed": 42, "round": 2}
+    deal = room_deal(room, pool)
+    assert room["deal_seed"] == deal.seed == round_seed(42, 2)
+    assert pool.taken == 0
+    room = {}
+    deal = room_deal(room, pool)
+    assert room["deal_seed"] == deal.seed and pool.taken == 1
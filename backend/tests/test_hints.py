@@ -0,0 +1,35 @@
+"""出牌提示的排序与时间预算"""
+import random
+import time
+
+from app import decompose
+from app.hints import suggest
+from app.replay import deal
+
+
+def dealt_states(count, seed):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield deal(rng.getrandbits(32), rng.randint(2, 14))
+
+
+def test_cold_cache_stays_within_budget():
+    budget = 0.02
+    for state in dealt_states(10, 3):
+        decompose.clear_cache()
+        start = time.perf_counter()
+        result = suggest(state, state.current_player, budget=budget)
+        # 检查点之间最多多出一个子问题或一手牌的枚举
+        assert time.perf_counter() - start < budget + 0.02
+        assert result["hints"]
+        if not result["complete"]:
+            assert all(hint["turnsLeft"] is None for hint in result["hints"]) or \
+                all(isinstance(hint["turnsLeft"], int) for hint in result["hints"])
+
+
+def test_complete_hints_are_ranked_by_remaining_turns():
+    for state in dealt_states(5, 4):
+        result = suggest(state, state.current_player, limit=100, budget=10)
+        assert result["complete"] and not result["canPass"]
+        plain = [hint["turnsLeft"] for hint in result["hints"] if not hint["bomb"]]
+        assert plain[0] == min(plain)
@@ -0,0 +1,59 @@
+"""创建房间的参数校验，以及 AI 决策不合法时的兜底"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+
+
+@pytest.fixture
+def client():
+    yield TestClient(main.app)
+    main.active_games.clear()
+
+
+@pytest.mark.parametrize("params", [{"mode": "solo"}, {"ai_mode": "minimax"}, {"mode": "", "ai_mode": "basic"}])
+def test_unknown_modes_are_rejected(client, params):
+    response = client.get("/game/create", params={"player_name": "p", **params})
+    assert response.status_code == 400
+    assert not main.active_games
+
+
+def test_known_modes_are_accepted(client):
+    for mode in main.GAME_MODES:
+        for ai_mode in main.AI_MODES:
+            response = client.get("/game/create", params={"player_name": "p", "mode": mode, "ai_mode": ai_mode})
+            assert response.status_code == 200
+            assert main.active_games[response.json()["roomId"]]["ai_mode"] == ai_mode
+
+
+class IllegalAI:
+    """总是给出不合法动作的 AI：首出时过牌，跟牌时出空牌"""
+
+    def __init__(self, state, seat):
+        self.state = state
+        self.seat = seat
+
+    def make_decision(self):
+        if self.state.is_leading(self.seat):
+            return {"action": "pass"}
+        return {"action": "play", "cards": []}
+
+
+def test_illegal_ai_moves_fall_back_instead_of_stalling(client, monkeypatch):
+    room_id = client.get("/game/create", params={"player_name": "p", "seed": 5}).json()["roomId"]
+    room = main.active_games[room_id]
+    state = room["game_state"]
+    state.current_player = 1
+    smallest = next(state.iter_legal_moves(1))
+    monkeypatch.setattr(main, "AI_THINK_DELAY", 0)
+    monkeypatch.setattr(main, "create_ai_player", lambda room, state, seat: IllegalAI(state, seat))
+
+    asyncio.run(main.handle_ai_turns(room, room_id))
+    # 座位 1 首出时出最小的一手，座位 2、3 跟牌时过牌，之后轮到真人玩家
+    assert state.last_played_player == 1
+    assert state.last_played_cards == list(smallest.cards)
+    assert [len(hand) for hand in state.players_hands] == [27, 27 - len(smallest.cards), 27, 27]
+    assert state.current_player == 0
+    assert room["seq"] == 3
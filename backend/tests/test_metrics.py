@@ -0,0 +1,54 @@
+"""/metrics 输出的 Prometheus 文本格式"""
+from app.metrics import CallbackCounter, Gauge, Histogram, Registry, hand_group
+
+
+def test_rendered_text():
+    registry = Registry()
+    latency = registry.register(Histogram("t_seconds", "Latency", ("stage",), buckets=(0.001, 0.01, 0.1)))
+    for value in (0.0005, 0.001, 0.005, 0.05, 3):
+        latency.labels("move").observe(value)
+    latency.labels('a"b').observe(0.01)
+    registry.register(Histogram("t_bytes", "Size", buckets=(64, 256)))
+    registry.register(Gauge("t_rooms", "Rooms", lambda: 3))
+    registry.register(CallbackCounter("t_total", "Totals", lambda: {("ok",): 2, ("failed",): 0.5}, ("outcome",)))
+
+    assert registry.render() == (
+        '# HELP t_seconds Latency\n'
+        '# TYPE t_seconds histogram\n'
+        't_seconds_bucket{stage="a\\"b",le="0.001"} 0\n'
+        't_seconds_bucket{stage="a\\"b",le="0.01"} 1\n'
+        't_seconds_bucket{stage="a\\"b",le="0.1"} 1\n'
+        't_seconds_bucket{stage="a\\"b",le="+Inf"} 1\n'
+        't_seconds_sum{stage="a\\"b"} 0.01\n'
+        't_seconds_count{stage="a\\"b"} 1\n'
+        # 桶是累计的，上界包含等于上界的值
+        't_seconds_bucket{stage="move",le="0.001"} 2\n'
+        't_seconds_bucket{stage="move",le="0.01"} 3\n'
+        't_seconds_bucket{stage="move",le="0.1"} 4\n'
+        't_seconds_bucket{stage="move",le="+Inf"} 5\n'
+        't_seconds_sum{stage="move"} 3.0565\n'
+        't_seconds_count{stage="move"} 5\n'
+        # 没有观测值的无标签直方图不输出样本
+        '# HELP t_bytes Size\n'
+        '# TYPE t_bytes histogram\n'
+        '# HELP t_rooms Rooms\n'
+        '# TYPE t_rooms gauge\n'
+        't_rooms 3\n'
+        '# HELP t_total Totals\n'
+        '# TYPE t_total counter\n'
+        't_total{outcome="failed"} 0.5\n'
+        't_total{outcome="ok"} 2\n'
+    )
+
+
+def test_failing_metric_does_not_break_the_output():
+    registry = Registry()
+    registry.register(Gauge("t_broken", "Broken", lambda: 1 / 0))
+    histogram = registry.register(Histogram("t_bytes", "Size", buckets=(64,)))
+    histogram.observe(64)
+    assert registry.render().endswith(
+        't_bytes_bucket{le="64"} 1\nt_bytes_bucket{le="+Inf"} 1\nt_bytes_sum 64\nt_bytes_count 1\n')
+
+
+def test_hand_groups():
+    assert [hand_group(size) for size in (0, 1, 9, 10, 27)] == ["0", "1-9", "1-9", "10-18", "19-27"]
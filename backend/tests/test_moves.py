@@ -0,0 +1,82 @@
+"""出牌枚举的完整性：与枚举手牌所有子集的结果对照"""
+import itertools
+import random
+from collections import Counter
+
+import pytest
+
+from app.cards import CARDS, FACE_COUNT, MAX_LEVEL, MIN_LEVEL, NATURAL_RANK_COUNT, Hand, wild_face
+from app.combos import beats, interpretations
+from app.moves import list_moves
+
+
+def sub_multisets(cards, limit=10):
+    """手牌所有不超过 limit 张的子集（同一牌面的牌不区分）"""
+    groups = {}
+    for card in cards:
+        groups.setdefault(card.face, []).append(card)
+    groups = list(groups.values())
+    for counts in itertools.product(*(range(len(group) + 1) for group in groups)):
+        if 0 < sum(counts) <= limit:
+            yield [card for group, n in zip(groups, counts) for card in group[:n]]
+
+
+def reachable(hand, level):
+    """所有子集的所有牌型解释"""
+    return {combo for cards in sub_multisets(list(hand)) for combo in interpretations(cards, level)}
+
+
+def random_hand(rng):
+    """集中在几个相邻点数上的手牌（更容易组成连续牌型和炸弹），可能带逢人配和王"""
+    level = rng.randint(MIN_LEVEL, MAX_LEVEL)
+    low = rng.randint(0, NATURAL_RANK_COUNT - 5)
+    ranks = list(range(low, low + rng.randint(3, 5))) + [NATURAL_RANK_COUNT - 1]
+    pool = [card for card in CARDS if card.face < 52 and card.face % NATURAL_RANK_COUNT in ranks]
+    pool += [card for card in CARDS if card.face >= 52]
+    cards = rng.sample(pool, 9)
+    wild = wild_face(level)
+    cards += [CARDS[wild + FACE_COUNT * copy] for copy in range(rng.choice((0, 1, 2)))
+              if CARDS[wild + FACE_COUNT * copy] not in cards]
+    return Hand(cards), level
+
+
+def check_moves(hand, level, moves, table=None):
+    keys = Counter((move.combo, tuple(sorted(card.id for card in move.cards))) for move in moves)
+    assert max(keys.values(), default=1) == 1, "duplicate moves"
+    for move in moves:
+        assert hand.contains_all(list(move.cards))
+        assert move.combo in interpretations(move.cards, level)
+        if table is not None:
+            assert beats(move.combo, table)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_lead_moves_are_complete(seed):
+    rng = random.Random(seed)
+    for _ in range(40):
+        hand, level = random_hand(rng)
+        moves = list_moves(hand, level)
+        check_moves(hand, level, moves)
+        assert {move.combo for move in moves} == reachable(hand, level)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_follow_moves_are_complete(seed):
+    rng = random.Random(100 + seed)
+    for _ in range(20):
+        hand, level = random_hand(rng)
+        combos = reachable(hand, level)
+        for table in rng.sample(sorted(combos, key=repr), min(len(combos), 8)):
+            moves = list_moves(hand, level, table)
+            check_moves(hand, level, moves, table)
+            assert {move.combo for move in moves} == {combo for combo in combos if beats(combo, table)}
+
+
+def test_dealt_hands_have_no_duplicate_moves():
+    from app.replay import deal
+    rng = random.Random(7)
+    for _ in range(50):
+        level = rng.randint(MIN_LEVEL, MAX_LEVEL)
+        state = deal(rng.getrandbits(32), level)
+        for hand in state.players_hands:
+            check_moves(hand, level, list_moves(hand, level))
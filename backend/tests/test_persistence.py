@@ -0,0 +1,108 @@
+"""对局记录：批量写入、停止时写完剩余记录、每步与每局各一条"""
+import asyncio
+import json
+import threading
+import time
+
+from app.ai_player import AIPlayer
+from app.persistence import GAMES, MOVES, FileSink, GameRecorder
+from app.protocol import pass_event, play_event
+from app.replay import deal
+from app.series import Series
+
+
+class CountingSink(FileSink):
+    """记录每次写入的批次大小，delay 秒模拟慢存储"""
+
+    def __init__(self, directory, delay=0.0):
+        super().__init__(directory)
+        self.delay = delay
+        self.batches = []
+        self.started = threading.Event()
+
+    def write(self, collection, documents):
+        self.started.set()
+        time.sleep(self.delay)
+        super().write(collection, documents)
+        self.batches.append((collection, len(documents)))
+
+
+def read(directory, collection):
+    path = directory / f"{collection}.jsonl"
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_records_are_written_in_batches(tmp_path):
+    async def scenario():
+        sink = CountingSink(str(tmp_path))
+        recorder = GameRecorder(sink, batch_size=3, flush_interval=0.01)
+        recorder.start()
+        for seq in range(7):
+            recorder.record(MOVES, {"seq": seq})
+        for _ in range(100):
+            if recorder.written == 7:
+                break
+            await asyncio.sleep(0.01)
+        await recorder.stop()
+        return sink
+
+    sink = asyncio.run(scenario())
+    assert [size for _, size in sink.batches] == [3, 3, 1]
+    assert [doc["seq"] for doc in read(tmp_path, MOVES)] == list(range(7))
+
+
+def test_stop_flushes_queued_and_in_flight_records(tmp_path):
+    async def scenario():
+        sink = CountingSink(str(tmp_path), delay=0.2)
+        recorder = GameRecorder(sink, batch_size=4, flush_interval=10)
+        recorder.start()
+        for seq in range(3):
+            recorder.record(MOVES, {"seq": seq})
+        recorder.record(GAMES, {"round": 0})
+        # 第一批（moves 与 games 两个集合）正在写入时停止，之后再放入的记录也要写完
+        while not sink.started.is_set():
+            await asyncio.sleep(0.005)
+        for seq in range(3, 10):
+            recorder.record(MOVES, {"seq": seq})
+        await recorder.stop()
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert recorder.written == 11 and recorder.failed == 0
+    assert [doc["seq"] for doc in read(tmp_path, MOVES)] == list(range(10))
+    assert read(tmp_path, GAMES) == [{"round": 0}]
+
+
+def test_one_record_per_move_and_per_round(tmp_path):
+    async def scenario():
+        recorder = GameRecorder(FileSink(str(tmp_path)), batch_size=50, flush_interval=0.01)
+        recorder.start()
+        state = deal(11, 2)
+        room = {"game_state": state, "series": Series(), "players": [{"id": str(i)} for i in range(4)],
+                "mode": "single", "round": 0, "deal_seed": 11, "seq": 0}
+        moves = 0
+        while state.check_game_end() is None:
+            seat = state.current_player
+            action = AIPlayer(state, seat).make_decision()
+            if action["action"] == "play":
+                assert state.play_cards(action["cards"], seat)
+                event = play_event(room, seat, action["cards"])
+            else:
+                assert state.pass_turn(seat)
+                event = pass_event(room, seat)
+            recorder.record_move("r1", room, event)
+            moves += 1
+        recorder.record_game_end("r1", room, state.check_game_end())
+        await recorder.stop()
+        return moves
+
+    moves = asyncio.run(scenario())
+    records = read(tmp_path, MOVES)
+    assert len(records) == moves
+    assert [record["seq"] for record in records] == list(range(1, moves + 1))
+    assert all(record["roomId"] == "r1" and record["round"] == 0 for record in records)
+    games = read(tmp_path, GAMES)
+    assert len(games) == 1
+    assert games[0]["dealSeed"] == 11 and games[0]["transfers"] == []
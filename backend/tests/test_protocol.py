@@ -0,0 +1,68 @@
+"""断线重连时的事件补发（EventBuffer）"""
+import pytest
+
+from app import wire
+from app.protocol import EventBuffer
+
+
+def event(seq):
+    return {"type": "event", "seq": seq, "event": "pass", "data": {"seat": seq % 4}}
+
+
+def seqs(payloads):
+    return [wire.decode(payload)["seq"] for payload in payloads]
+
+
+def test_since_returns_only_missed_events():
+    buffer = EventBuffer(1, size=8)
+    for seq in range(1, 6):
+        buffer.append(event(seq))
+    assert seqs(buffer.since(1, wire.JSON)) == [2, 3, 4, 5]
+    assert seqs(buffer.since(3, wire.JSON)) == [4, 5]
+    assert buffer.since(5, wire.JSON) == []
+    # 客户端声称收到了还没有发出的事件
+    assert buffer.since(6, wire.JSON) is None
+    # 序号 1 之前的状态不在缓冲中
+    assert buffer.since(0, wire.JSON) is None
+
+
+def test_events_pushed_out_of_the_buffer_need_a_snapshot():
+    buffer = EventBuffer(1, size=4)
+    for seq in range(1, 7):
+        buffer.append(event(seq))
+    assert [item["seq"] for item in buffer.events] == [3, 4, 5, 6]
+    # 收到过 2 的客户端缺的 3..6 都还在
+    assert buffer.since(1, wire.JSON) is None
+    assert seqs(buffer.since(2, wire.JSON)) == [3, 4, 5, 6]
+    assert seqs(buffer.since(3, wire.JSON)) == [4, 5, 6]
+
+
+def test_barrier_requires_a_snapshot_for_earlier_sequences():
+    buffer = EventBuffer(1, size=8)
+    for seq in range(1, 4):
+        buffer.append(event(seq))
+    buffer.barrier(3)
+    # 屏障之前的 seq（包括屏障时的 seq 本身）都不能只靠补发事件追上
+    for last_seq in range(0, 5):
+        assert buffer.since(last_seq, wire.JSON) is None
+    buffer.append(event(4))
+    assert buffer.since(3, wire.JSON) is None
+    assert buffer.since(4, wire.JSON) == []
+    buffer.append(event(5))
+    assert seqs(buffer.since(4, wire.JSON)) == [5]
+
+
+def test_new_buffer_has_nothing_to_replay():
+    # 从状态存储恢复的房间：此前的 seq 都需要快照
+    buffer = EventBuffer(11)
+    for last_seq in (0, 10, 11, 12):
+        assert buffer.since(last_seq, wire.JSON) is None
+
+
+def test_events_are_encoded_in_the_requested_format():
+    buffer = EventBuffer(1)
+    buffer.append(event(1))
+    buffer.append(event(2))
+    assert buffer.since(1, wire.JSON) == [wire.encode(event(2), wire.JSON)]
+    pytest.importorskip("msgpack")
+    assert buffer.since(1, wire.MSGPACK) == [wire.encode(event(2), wire.MSGPACK)]
@@ -0,0 +1,129 @@
+"""房间回收：空闲与结束后的超时、超过上限时的 LRU 回收、邀请清理，以及占用字节数的估计"""
+import asyncio
+from datetime import datetime, timedelta
+
+from app import wire
+from app.game import GameState
+from app.protocol import cached, touch
+from app.reaper import EVICTED, FINISHED, IDLE, RoomReaper, estimate_rooms_bytes, estimate_state_bytes
+
+
+def new_room():
+    return {"game_state": GameState(), "players": [{"id": "p", "name": "a"}], "version": 0}
+
+
+def test_cache_counts_only_encoded_payloads():
+    room = new_room()
+    cached(room, ("a",), lambda: "x" * 10)
+    cached(room, ("b",), lambda: b"y" * 7)
+    cached(room, ("c",), lambda: wire.Fragment("z" * 5, 1))
+    cached(room, ("hint", 0), lambda: {"hints": [], "canPass": False, "complete": True})
+    cached(room, ("a",), lambda: "not built again")
+    assert room["cache_bytes"] == 22
+    # 状态变化后整个缓存失效，重新计数
+    touch(room)
+    cached(room, ("a",), lambda: "x")
+    assert room["cache_bytes"] == 1
+
+
+def test_state_is_sampled():
+    rooms = [new_room() for _ in range(50)]
+    for room in rooms:
+        cached(room, ("a",), lambda: "x" * 100)
+    state = estimate_state_bytes(rooms[0])
+    assert estimate_rooms_bytes(rooms, sample_size=5) == 50 * (100 + state)
+    assert estimate_rooms_bytes(rooms, sample_size=0) == 50 * 100
+    assert estimate_rooms_bytes([]) == 0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def reaper_for(rooms, invites=None, connected=(), **options):
+    removed = []
+
+    async def remove_room(room_id):
+        removed.append(room_id)
+        del rooms[room_id]
+
+    clock = options.setdefault("clock", FakeClock())
+    options.setdefault("idle_ttl", 100)
+    options.setdefault("finished_ttl", 10)
+    reaper = RoomReaper(rooms, invites if invites is not None else {},
+                        lambda room: room["id"] in connected, remove_room, sample_size=0, **options)
+    return reaper, clock, removed
+
+
+def room_at(room_id, last_active, finished_at=None):
+    room = new_room()
+    room["id"] = room_id
+    room["last_active"] = last_active
+    if finished_at is not None:
+        room["finished_at"] = finished_at
+    return room
+
+
+def test_rooms_expire_after_their_ttl():
+    rooms = {"idle": room_at("idle", 1000), "done": room_at("done", 1000, finished_at=1000),
+             "new": room_at("new", 1000)}
+    reaper, clock, removed = reaper_for(rooms)
+
+    clock.now = 1010
+    assert asyncio.run(reaper.sweep()) == []
+    # 结束后的房间按较短的 finished_ttl 回收
+    clock.now = 1011
+    assert asyncio.run(reaper.sweep()) == ["done"]
+    rooms["new"]["last_active"] = 1050
+    clock.now = 1101
+    assert asyncio.run(reaper.sweep()) == ["idle"]
+    clock.now = 1151
+    assert asyncio.run(reaper.sweep()) == ["new"]
+    assert removed == ["done", "idle", "new"]
+    assert reaper.rooms_reaped == {IDLE: 2, FINISHED: 1, EVICTED: 0}
+
+
+def test_rooms_seen_for_the_first_time_start_their_ttl_now():
+    room = room_at("a", 0)
+    del room["last_active"]
+    rooms = {"a": room}
+    reaper, clock, _ = reaper_for(rooms)
+    assert asyncio.run(reaper.sweep()) == []
+    assert room["last_active"] == clock.now
+
+
+def test_least_recently_active_rooms_are_evicted_over_the_limit():
+    rooms = {room_id: room_at(room_id, 1000 - age)
+             for room_id, age in [("b", 20), ("a", 30), ("d", 0), ("c", 10), ("e", 5)]}
+    reaper, _, removed = reaper_for(rooms, max_rooms=3)
+    assert asyncio.run(reaper.sweep()) == ["a", "b"]
+    assert sorted(rooms) == ["c", "d", "e"]
+    assert reaper.rooms_reaped[EVICTED] == 2
+    # 未超过上限时不再回收
+    assert asyncio.run(reaper.sweep()) == []
+
+
+def test_rooms_with_live_connections_are_never_reaped():
+    rooms = {"old": room_at("old", 0, finished_at=0), "idle": room_at("idle", 0),
+             "x": room_at("x", 999), "y": room_at("y", 998)}
+    reaper, clock, _ = reaper_for(rooms, connected={"old", "x", "y"}, max_rooms=1)
+    clock.now = 5000
+    # 已超时的 idle 回收后仍有 3 个房间，但剩下的都有玩家连接
+    assert asyncio.run(reaper.sweep()) == ["idle"]
+    assert sorted(rooms) == ["old", "x", "y"]
+
+
+def test_expired_and_orphaned_invites_are_removed():
+    rooms = {"a": room_at("a", 1000)}
+    later = datetime.now() + timedelta(hours=1)
+    invites = {"live": {"room_id": "a", "expires_at": later},
+               "expired": {"room_id": "a", "expires_at": datetime.now() - timedelta(seconds=1)},
+               "orphan": {"room_id": "gone", "expires_at": later}}
+    reaper, _, _ = reaper_for(rooms, invites)
+    asyncio.run(reaper.sweep())
+    assert list(invites) == ["live"]
+    assert reaper.stats()["invites_reaped"] == 2
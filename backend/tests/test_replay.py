@@ -0,0 +1,97 @@
+"""回放格式的编码、解码与推演"""
+import io
+import random
+
+import pytest
+
+from app.cards import CARDS
+from app.replay import (
+    FORMAT_VERSION, MAGIC, Replay, ReplayError, ReplayWriter, RoundRecord, deal, initial_state,
+    read_rounds, read_varint, write_varint,
+)
+from app.simulator import play_round
+
+
+def record_rounds(count, seed=1):
+    rng = random.Random(seed)
+    return [play_round(rng.randint(2, 14), rng, record=True) for _ in range(count)]
+
+
+def write_file(records):
+    f = io.BytesIO()
+    writer = ReplayWriter(f)
+    for record in records:
+        writer.write(record)
+    return f.getvalue()
+
+
+def test_varint_round_trip():
+    for value in (0, 1, 127, 128, 300, 2 ** 32 - 1):
+        out = bytearray()
+        write_varint(out, value)
+        assert read_varint(bytes(out), 0) == (value, len(out))
+
+
+def test_round_trip_reaches_final_state():
+    results = record_rounds(3)
+    records = [result["replay"] for result in results]
+    decoded = list(read_rounds(write_file(records)))
+    assert decoded == records
+    for record, result in zip(decoded, results):
+        replay = Replay(record)
+        final = replay.final_state()
+        assert final.check_game_end()["positions"] == result["positions"]
+        # 从检查点跳到任意一步与逐步推演的结果相同
+        for ply, state in enumerate(replay.states()):
+            if ply % 13 == 0:
+                assert replay.state_at(ply).to_dict() == state.to_dict()
+
+
+def test_transfers_are_applied_before_the_first_step():
+    state = deal(42, 5)
+    given = next(iter(state.players_hands[3]))
+    returned = min(state.players_hands[0], key=lambda card: card.id)
+    record = RoundRecord(42, 5, 3, [], ((3, 0, given.face), (0, 3, returned.face)))
+    decoded = next(read_rounds(write_file([record])))
+    assert decoded.transfers == record.transfers
+    start = initial_state(decoded)
+    assert start.current_player == 3
+    assert len(start.players_hands[0]) == len(start.players_hands[3]) == 27
+    assert given in start.players_hands[0]
+
+
+def test_transfer_of_a_missing_card_is_rejected():
+    state = deal(42, 5)
+    missing = next(card for card in CARDS if card not in state.players_hands[1])
+    with pytest.raises(ReplayError):
+        Replay(RoundRecord(42, 5, 0, [], ((1, 0, missing.face),)))
+
+
+def test_truncated_files_raise_replay_error():
+    data = write_file([result["replay"] for result in record_rounds(2, seed=3)])
+    for end in range(len(data)):
+        try:
+            for record in read_rounds(data[:end]):
+                Replay(record).final_state()
+        except ReplayError:
+            pass
+
+
+def test_reads_version_1_files():
+    record = record_rounds(1, seed=5)[0]["replay"]
+    body = bytearray()
+    write_varint(body, record.seed)
+    body += bytes((record.level, record.first))
+    for seat, faces in record.steps:
+        body.append(seat << 5 | len(faces))
+        body.extend(faces)
+    length = bytearray()
+    write_varint(length, len(body))
+    decoded = list(read_rounds(MAGIC + bytes((1,)) + bytes(length) + bytes(body)))
+    assert decoded == [record]
+
+
+def test_writer_refuses_to_append_to_another_version():
+    f = io.BytesIO(MAGIC + bytes((FORMAT_VERSION - 1,)))
+    with pytest.raises(ReplayError):
+        ReplayWriter(f)
@@ -0,0 +1,103 @@
+"""房间后台任务的调度与取消"""
+import asyncio
+import threading
+
+from app.scheduler import RoomScheduler
+
+
+def test_jobs_for_a_busy_room_run_once_after_the_current_one():
+    async def scenario():
+        scheduler = RoomScheduler()
+        runs = []
+        gate = asyncio.Event()
+
+        def job(name, wait=False):
+            async def run():
+                runs.append(name)
+                if wait:
+                    await gate.wait()
+            return run
+
+        scheduler.schedule("r", job("first", wait=True))
+        await asyncio.sleep(0)
+        assert scheduler.is_running("r")
+        # 运行中再安排的任务只保留最后一个
+        scheduler.schedule("r", job("second"))
+        scheduler.schedule("r", job("third"))
+        scheduler.schedule("other", job("other"))
+        await asyncio.sleep(0)
+        assert runs == ["first", "other"]
+        gate.set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert runs == ["first", "other", "third"]
+        assert not scheduler.is_running("r") and not scheduler.is_running("other")
+        await scheduler.shutdown()
+    asyncio.run(scenario())
+
+
+def test_failing_job_does_not_stop_the_room():
+    async def scenario():
+        scheduler = RoomScheduler()
+        runs = []
+
+        async def failing():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        async def ok():
+            runs.append("ok")
+
+        scheduler.schedule("r", failing)
+        scheduler.schedule("r", ok)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert runs == ["ok"]
+        scheduler.schedule("r", ok)
+        await asyncio.sleep(0)
+        assert runs == ["ok", "ok"]
+        await scheduler.shutdown()
+    asyncio.run(scenario())
+
+
+def test_cancel_stops_the_running_job_and_drops_the_pending_one():
+    async def scenario():
+        scheduler = RoomScheduler()
+        cancelled = asyncio.Event()
+        runs = []
+
+        async def forever():
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def pending():
+            runs.append("pending")
+
+        scheduler.schedule("r", forever)
+        await asyncio.sleep(0)
+        scheduler.schedule("r", pending)
+        scheduler.cancel("r")
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert not scheduler.is_running("r") and runs == []
+        # 取消后可以重新安排
+        scheduler.schedule("r", pending)
+        await asyncio.sleep(0)
+        assert runs == ["pending"]
+        scheduler.cancel("missing")
+        await scheduler.shutdown()
+    asyncio.run(scenario())
+
+
+def test_blocking_work_runs_off_the_event_loop_thread():
+    async def scenario():
+        scheduler = RoomScheduler(max_workers=2)
+        loop_thread = threading.get_ident()
+        worker_thread = await scheduler.run_blocking(threading.get_ident)
+        assert worker_thread != loop_thread
+        assert await scheduler.run_blocking(lambda: sum(range(10))) == 45
+        await scheduler.shutdown()
+    asyncio.run(scenario())
@@ -0,0 +1,58 @@
+"""搜索 AI 的时间预算与进程池"""
+import time
+
+from app import search_ai
+from app.replay import deal
+from app.search_ai import SearchAIPlayer, idle_workers, occupy, run_playouts, shutdown_pool, warm_pool
+
+BUDGET = 0.1
+# 超出预算的容差：进程内模拟最多多出一次模拟的时间（几毫秒）
+TOLERANCE = 0.03
+
+
+def decide(seed, budget=BUDGET, workers=2):
+    state = deal(seed, 2)
+    player = SearchAIPlayer(state, state.current_player, time_budget=budget, workers=workers, seed=seed)
+    start = time.perf_counter()
+    action = player.make_decision()
+    return action, player.stats, time.perf_counter() - start
+
+
+def test_playouts_run_at_least_once():
+    state = deal(1, 2)
+    candidates = SearchAIPlayer(state, state.current_player).candidates()
+    _, visits = run_playouts(state, state.current_player, candidates, 0.0, 1)
+    assert sum(visits) == 1
+
+
+def test_decisions_stay_within_budget_and_always_simulate():
+    warm_pool(2)
+    try:
+        for seed in range(3):
+            action, stats, elapsed = decide(seed)
+            assert action["action"] == "play"
+            assert stats["playouts"] > 0
+            assert elapsed < BUDGET + TOLERANCE
+        for workers in (0, 1):
+            _, stats, elapsed = decide(5, workers=workers)
+            assert stats["playouts"] > 0 and elapsed < BUDGET + TOLERANCE
+    finally:
+        shutdown_pool()
+
+
+def test_busy_pool_falls_back_to_local_playouts():
+    warm_pool(2)
+    try:
+        pool = search_ai.get_pool(2)
+        # 两个子进程都被占用时不再排队，用预留的时间在当前进程内模拟
+        blockers = [pool.submit(time.sleep, 0.5) for _ in range(2)]
+        for future in blockers:
+            occupy(future)
+        assert idle_workers() == 0
+        _, stats, elapsed = decide(4)
+        assert stats["playouts"] > 0 and elapsed < BUDGET + TOLERANCE
+        for future in blockers:
+            future.result()
+        assert idle_workers() == 2
+    finally:
+        shutdown_pool()
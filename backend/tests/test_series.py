@@ -0,0 +1,121 @@
+"""局与局之间的级别、进贡与还贡"""
+from app.cards import BIG_JOKER, MAX_LEVEL, MIN_LEVEL, CARD_VALUES, Hand
+from app.dealing import make_deal
+from app.game import GameState, partner_of, team_of
+from app.replay import FORMAT_VERSION, MAGIC, Replay, read_rounds
+from app.series import MAX_RETURN_VALUE, Series, can_return, return_card
+from app.simulator import play_game
+
+
+def result(positions, level=MIN_LEVEL):
+    return {"positions": positions, "winner_team": team_of(positions[0]), "new_level": level}
+
+
+def test_partners_sit_opposite():
+    assert [partner_of(seat) for seat in range(4)] == [2, 3, 0, 1]
+    assert [team_of(seat) for seat in range(4)] == [0, 1, 0, 1]
+
+
+def test_levels_are_kept_per_team():
+    series = Series()
+    series.finish_round(result([0, 2, 1, 3]))
+    assert series.team_levels == [5, 2] and series.level == 5
+    series.finish_round(result([1, 0, 3, 2]))
+    assert series.team_levels == [5, 3] and series.level == 3
+
+
+def test_round_end_changes_levels_only_through_the_series():
+    series = Series()
+    state = GameState()
+    series.start_round(state, make_deal(3).hands)
+    for seat in (0, 2, 1):
+        state.players_hands[seat].clear()
+    state.finish_order = [0, 2, 1]
+    game_result = state.check_game_end()
+    # 局面保持本局的级别，下一局的级别由 Series 给出
+    assert state.current_level == MIN_LEVEL
+    assert series.finish_round(game_result)["new_level"] == 5
+    series.start_round(state, make_deal(4).hands)
+    assert state.current_level == 5
+
+
+def test_match_ends_only_on_own_ace():
+    series = Series()
+    series.team_levels = [MAX_LEVEL, 5]
+    series.level_team = 1
+    # 在对方的级别上获胜不算打过 A
+    outcome = series.finish_round(result([0, 1, 2, 3]))
+    assert "matchWinner" not in outcome
+    assert series.team_levels == [MAX_LEVEL, 5] and series.level_team == 0
+    outcome = series.finish_round(result([2, 1, 0, 3]))
+    assert outcome["matchWinner"] == 0
+    assert series.team_levels == [MIN_LEVEL, MIN_LEVEL] and series.last_positions is None
+
+
+def test_single_and_double_tribute():
+    state = GameState()
+    for seed in range(20):
+        series = Series()
+        series.last_positions = [0, 1, 2, 3]
+        series.start_round(state, make_deal(seed).hands)
+        if series.anti_tribute:
+            continue
+        assert series.tributes and series.tributes[0][:2] == (3, 0)
+        assert state.current_player == 3 and len(state.players_hands[0]) == 28
+        receiver, giver = series.pending[0]
+        card = return_card(state.players_hands[receiver], state.current_level)
+        assert series.return_tribute(state, receiver, card)
+        assert not series.pending and all(len(hand) == 27 for hand in state.players_hands)
+
+        series = Series()
+        series.last_positions = [1, 3, 0, 2]
+        series.start_round(state, make_deal(seed).hands)
+        if series.anti_tribute:
+            continue
+        assert {receiver for _, receiver, _ in series.tributes} == {1, 3}
+        assert len(series.pending) == 2
+
+
+def test_anti_tribute_with_both_big_jokers():
+    deal = make_deal(1)
+    hands = [hand.copy() for hand in deal.hands]
+    # 把两张大王都放到末游手中
+    for seat in range(4):
+        if seat != 3:
+            for card in [card for card in hands[seat] if card.rank_index == BIG_JOKER]:
+                hands[seat].remove(card)
+                hands[3].add(card)
+    assert hands[3].rank_counts[BIG_JOKER] == 2
+    series = Series()
+    series.last_positions = [0, 1, 2, 3]
+    state = GameState()
+    series.start_round(state, hands)
+    assert series.anti_tribute and not series.tributes and state.current_player == 0
+
+
+def test_return_must_be_ten_or_lower():
+    level = 2
+    hand = Hand(card for card in make_deal(3).hands[0])
+    values = CARD_VALUES[level]
+    for card in hand:
+        assert can_return(hand, card, level) == (values[card.id] <= MAX_RETURN_VALUE)
+
+
+def test_reset_round_reuses_hands():
+    state = GameState()
+    hands = list(state.players_hands)
+    Series().start_round(state, make_deal(5).hands)
+    assert all(a is b for a, b in zip(hands, state.players_hands))
+    assert [hand.ids() for hand in state.players_hands] == [hand.ids() for hand in make_deal(5).hands]
+
+
+def test_simulated_match_follows_series_rules():
+    summary = play_game(0, 7, max_rounds=60, record=True)
+    records = list(read_rounds(MAGIC + bytes((FORMAT_VERSION,)) + summary["replay"]))
+    assert len(records) == summary["rounds"]
+    assert any(record.transfers for record in records[1:])
+    # 每一局（包括进贡之后的局）都能由回放还原到结束
+    for record in records:
+        assert Replay(record).final_state().check_game_end() is not None
+    if summary["winner_team"] is not None:
+        assert summary["team_levels"][summary["winner_team"]] == MAX_LEVEL
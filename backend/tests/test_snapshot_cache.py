@@ -0,0 +1,65 @@
+"""快照缓存：缓存的编码结果与重新编码完全相同，状态版本变化后失效"""
+import pytest
+
+from app import wire
+from app.ai_player import AIPlayer
+from app.protocol import (DELTA, SNAPSHOT, cached_value, encoded_snapshot_message, play_event,
+                          snapshot_message, touch)
+from app.replay import deal
+from app.series import Series
+
+FORMATS = [wire.JSON, wire.IDS, pytest.param(wire.MSGPACK, marks=pytest.mark.skipif(
+    wire.msgpack is None, reason="msgpack is not installed"))]
+
+
+def new_room(seed=3):
+    return {"game_state": deal(seed, 2), "series": Series(), "mode": "single",
+            "players": [{"id": str(i), "name": f"p{i}"} for i in range(4)], "seq": 0, "version": 0}
+
+
+def fresh(room, seat, protocol, wire_format):
+    return wire.encode(snapshot_message(room, "r", seat, protocol), wire_format)
+
+
+def play_once(room):
+    state = room["game_state"]
+    seat = state.current_player
+    action = AIPlayer(state, seat).make_decision()
+    assert action["action"] == "play" and state.play_cards(action["cards"], seat)
+    play_event(room, seat, action["cards"])
+
+
+@pytest.mark.parametrize("wire_format", FORMATS)
+@pytest.mark.parametrize("protocol", [SNAPSHOT, DELTA])
+def test_cached_bytes_equal_a_fresh_encoding(protocol, wire_format):
+    room = new_room()
+    for seat in range(4):
+        first = encoded_snapshot_message(room, "r", seat, protocol, wire_format)
+        assert first == fresh(room, seat, protocol, wire_format)
+        # 第二次取到的是缓存中的同一个对象
+        assert encoded_snapshot_message(room, "r", seat, protocol, wire_format) is first
+    assert room["cache_bytes"] > 0
+
+
+@pytest.mark.parametrize("wire_format", FORMATS)
+def test_version_change_invalidates_the_cache(wire_format):
+    room = new_room()
+    key = ("message", DELTA, wire_format, 0)
+    before = encoded_snapshot_message(room, "r", 0, DELTA, wire_format)
+    assert cached_value(room, key) is before
+
+    # 事件推进 seq 与版本，旧的快照不再可见
+    play_once(room)
+    assert cached_value(room, key) is None
+    after = encoded_snapshot_message(room, "r", 0, DELTA, wire_format)
+    assert after != before
+    assert after == fresh(room, 0, DELTA, wire_format)
+    assert wire.decode(after, wire_format)["seq"] == room["seq"] == 1
+
+    # 不伴随事件的状态变化通过 touch 使缓存失效
+    room["players"][1]["name"] = "renamed"
+    touch(room)
+    assert cached_value(room, key) is None
+    renamed = encoded_snapshot_message(room, "r", 0, DELTA, wire_format)
+    assert renamed == fresh(room, 0, DELTA, wire_format)
+    assert "renamed" in str(wire.decode(renamed, wire_format))
@@ -0,0 +1,173 @@
+"""观战频道：延迟放出、观战人数超过阈值后的抽样、多 worker 时按格式汇总转发"""
+import asyncio
+
+from app import wire
+from app.replay import deal
+from app.series import Series
+from app.spectators import Channel, SpectatorHub
+
+
+class FakeClock:
+    """手动推进的时钟：sleep 一直等到 advance 把时间推过截止时刻"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.waiters = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((self.now + delay, future))
+        await future
+
+    async def advance(self, delay=0.0):
+        self.now += delay
+        for deadline, future in list(self.waiters):
+            if deadline <= self.now:
+                self.waiters.remove((deadline, future))
+                if not future.done():
+                    future.set_result(None)
+        await settle()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class FakeWatcher:
+    def __init__(self, connection_id, wire_format=wire.JSON):
+        self.connection_id = connection_id
+        self.wire_format = wire_format
+        self.closed = False
+        self.closing = False
+        self.sent = []
+
+    async def send_encoded(self, payload):
+        self.sent.append(wire.decode(payload, self.wire_format))
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+class FakeCluster:
+    def __init__(self):
+        self.notified = []
+
+    def notify(self, worker, method, **params):
+        self.notified.append((worker, method, params))
+
+
+def event(seq):
+    return {"type": "event", "seq": seq, "event": "pass", "data": {"seat": seq % 4}}
+
+
+def view(seq):
+    return {"currentTurn": seq % 4, "players": []}
+
+
+def received(watcher):
+    return [(message["type"], message["seq"]) for message in watcher.sent]
+
+
+def test_events_are_released_after_the_delay():
+    async def scenario():
+        clock = FakeClock()
+        channel = Channel(delay=30, clock=clock, sleep=clock.sleep)
+        watcher = FakeWatcher("a")
+        await channel.add(watcher)
+        channel.publish(1, event(1), view(1))
+        await clock.advance(10)
+        channel.publish(2, event(2), view(2))
+        await clock.advance(19)
+        assert watcher.sent == [] and channel.view is None
+        await clock.advance(1)
+        assert received(watcher) == [("event", 1)]
+        # 放出之前观战快照停留在延迟之前的状态
+        assert channel.seq == 1 and channel.view == view(1)
+        await clock.advance(10)
+        assert received(watcher) == [("event", 1), ("event", 2)]
+        assert wire.decode(channel.view_payload(wire.JSON)) == {"type": "game_state", "seq": 2, "data": view(2)}
+        await channel.close()
+        assert watcher.closed
+    asyncio.run(scenario())
+
+
+def test_large_audiences_are_sampled():
+    async def scenario():
+        clock = FakeClock()
+        channel = Channel(delay=0, sample_threshold=2, sample_interval=1, clock=clock, sleep=clock.sleep)
+        watchers = [FakeWatcher(str(i)) for i in range(3)]
+        for watcher in watchers:
+            await channel.add(watcher)
+        assert channel.sampled
+
+        for seq in range(1, 4):
+            channel.publish(seq, event(seq), view(seq))
+            await settle()
+        # 抽样期间不逐个转发事件，每个间隔只发送一次最新的快照
+        assert all(watcher.sent == [] for watcher in watchers)
+        await clock.advance(1)
+        assert all(received(watcher) == [("game_state", 3)] for watcher in watchers)
+        await clock.advance(1)
+        assert all(len(watcher.sent) == 1 for watcher in watchers)
+
+        # 人数回到阈值以内时先补发最新快照，再恢复逐个转发
+        channel.publish(4, event(4), view(4))
+        await settle()
+        await channel.remove("2")
+        assert not channel.sampled
+        channel.publish(5, event(5), view(5))
+        await settle()
+        assert received(watchers[0]) == [("game_state", 3), ("game_state", 4), ("event", 5)]
+        assert received(watchers[2]) == [("game_state", 3)]
+        await channel.close()
+    asyncio.run(scenario())
+
+
+def new_room():
+    return {"game_state": deal(1, 2), "series": Series(), "mode": "multiplayer",
+            "players": [{"id": str(i), "name": f"p{i}"} for i in range(4)], "seq": 0, "version": 0}
+
+
+def test_remote_watchers_get_one_copy_per_worker_and_format():
+    async def scenario():
+        cluster = FakeCluster()
+        owner = SpectatorHub(cluster)
+        room = new_room()
+        await owner.watch_relay(room, "r", "w2", wire.JSON, 3)
+        await owner.watch_relay(room, "r", "w2", wire.IDS, 1)
+        await settle()
+        # 中继的观战人数计入抽样阈值
+        assert owner.channels["r"].audience == 4
+
+        room["seq"] = 1
+        message = event(1)
+        message["data"]["cards"] = wire.CardList(list(room["game_state"].players_hands[0])[:2])
+        owner.publish(room, "r", message)
+        await settle()
+        deliveries = [(worker, params["wire_format"], params["data"]) for worker, method, params in cluster.notified
+                      if method == "spectate_deliver"]
+        # 第一份是频道建立时的快照，之后每种格式只转发一份事件
+        events = [(worker, wire_format, data) for worker, wire_format, data in deliveries
+                  if wire.decode(data, wire_format)["type"] == "event"]
+        assert [(worker, wire_format) for worker, wire_format, _ in events] == [("w2", wire.JSON), ("w2", wire.IDS)]
+        assert [data for _, _, data in events] == [wire.encode(message, wire.JSON), wire.encode(message, wire.IDS)]
+
+        # 观战者所在的 worker 把一份消息分发给本地所有同一格式的连接
+        remote = SpectatorHub(cluster)
+        local = [FakeWatcher("a"), FakeWatcher("b"), FakeWatcher("c", wire.IDS)]
+        for connection in local:
+            remote.relays.setdefault(("r", connection.wire_format), {})[connection.connection_id] = connection
+        for _, wire_format, data in events:
+            await remote.deliver("r", wire_format, data)
+        assert local[0].sent == local[1].sent == [wire.decode(wire.encode(message, wire.JSON))]
+        assert local[2].sent[0]["data"]["cards"] == list(message["data"]["cards"].ids)
+        assert remote.audience() == 3
+
+        await owner.unwatch_relay("r", "w2", wire.JSON, 0)
+        await owner.unwatch_relay("r", "w2", wire.IDS, 0)
+        assert "r" not in owner.channels
+    asyncio.run(scenario())
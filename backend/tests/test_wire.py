@@ -0,0 +1,105 @@
+"""消息编码格式：逐格式往返，片段拼接与整体编码结果相同"""
+import pytest
+
+from app import wire
+from app.cards import CARDS
+from app.wire import IDS, JSON, MSGPACK, CardList, decode, decode_cards, encode, field, fields, join
+
+FORMATS = [JSON, IDS, pytest.param(MSGPACK, marks=pytest.mark.skipif(wire.msgpack is None,
+                                                                     reason="msgpack is not installed"))]
+
+CARDS_SAMPLE = [CARDS[0], CARDS[12], CARDS[52], CARDS[53], CARDS[54 + 8], CARDS[107]]
+
+
+def message():
+    return {
+        "type": "event",
+        "seq": 300,
+        "event": "play",
+        "data": {"seat": 2, "cards": CardList(CARDS_SAMPLE), "cardType": "顺子", "next": None,
+                 "nested": [{"cards": CardList()}, True, -1, 1.5]},
+    }
+
+
+def cards_in(value, wire_format):
+    """解码后的一组牌：名称只区分牌面不区分副，json 按名称比较，其余格式按 id 比较"""
+    cards = decode_cards(value)
+    if wire_format == JSON:
+        return [str(card) for card in cards]
+    return [card.id for card in cards]
+
+
+@pytest.mark.parametrize("wire_format", FORMATS)
+def test_round_trip(wire_format):
+    encoded = encode(message(), wire_format)
+    assert isinstance(encoded, bytes if wire_format == MSGPACK else str)
+    decoded = decode(encoded, wire_format)
+    data = decoded["data"]
+    expected_cards = [str(card) if wire_format == JSON else card.id for card in CARDS_SAMPLE]
+    assert cards_in(data["cards"], wire_format) == expected_cards
+
+    assert decode_cards(data["nested"][0]["cards"]) == []
+    expected = wire.to_plain(message())
+    data["cards"] = expected["data"]["cards"]
+    data["nested"][0]["cards"] = []
+    assert decoded == expected
+
+
+def test_card_representation_per_format():
+    cards = CardList(CARDS_SAMPLE[:2])
+    assert decode(encode({"c": cards}, JSON))["c"] == [str(card) for card in CARDS_SAMPLE[:2]]
+    assert decode(encode({"c": cards}, IDS))["c"] == [0, 12]
+    if wire.msgpack is not None:
+        assert decode(encode({"c": cards}, MSGPACK), MSGPACK)["c"] == b"\x00\x0c"
+
+
+@pytest.mark.parametrize("wire_format", FORMATS)
+@pytest.mark.parametrize("size", [0, 1, 14, 15, 16, 40])
+def test_joined_fragments_equal_whole_encoding(wire_format, size):
+    # msgpack 的 map 头在 16 个字段处由 fixmap 变为 map16
+    values = {f"k{i}": (CardList(CARDS_SAMPLE[:i % 4]) if i % 3 == 0 else i) for i in range(size)}
+    items = list(values.items())
+    split = size // 3
+    inner = {"x": 1}
+    whole = dict(values)
+    whole["inner"] = inner
+    fragments = [
+        fields(dict(items[:split]), wire_format),
+        fields({}, wire_format),
+        field("inner", encode(inner, wire_format), wire_format),
+        fields(dict(items[split:]), wire_format),
+    ]
+    # 字段顺序与片段顺序一致
+    ordered = dict(items[:split])
+    ordered["inner"] = inner
+    ordered.update(items[split:])
+    assert join(fragments, wire_format) == encode(ordered, wire_format)
+    assert decode(join(fragments, wire_format), wire_format) == decode(encode(whole, wire_format), wire_format)
+
+
+@pytest.mark.skipif(wire.msgpack is None, reason="msgpack is not installed")
+def test_msgpack_map_header():
+    def joined(count):
+        return join([fields({f"k{i}": i for i in range(count)}, MSGPACK)], MSGPACK)
+
+    assert joined(0)[:1] == b"\x80"
+    assert joined(15)[:1] == b"\x8f"
+    assert joined(16)[:3] == b"\xde\x00\x10"
+    assert joined(300)[:3] == b"\xde\x01\x2c"
+    assert wire.msgpack.unpackb(joined(300)) == {f"k{i}": i for i in range(300)}
+
+
+def test_decode_cards_accepts_every_client_form():
+    ids = [card.id for card in CARDS_SAMPLE]
+    assert decode_cards([str(card) for card in CARDS_SAMPLE]) == CARDS_SAMPLE
+    assert decode_cards(ids) == CARDS_SAMPLE
+    assert decode_cards(bytes(ids)) == CARDS_SAMPLE
+    for bad in (None, "♠2", [108], [-1], ["♠1"], [True], [1.0], b"\x6c", {"cards": ids}):
+        assert decode_cards(bad) is None
+
+
+def test_msgpack_falls_back_to_ids_without_the_library(monkeypatch):
+    monkeypatch.setattr(wire, "msgpack", None)
+    assert wire.negotiate(MSGPACK) == IDS
+    assert wire.negotiate("xml") == JSON and wire.negotiate(None) == JSON
+    assert wire.negotiate(IDS) == IDS